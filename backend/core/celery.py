@@ -1,8 +1,43 @@
 import os
+import redis
 from celery import Celery
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 app = Celery('core')
 app.config_from_object('django.conf:settings', namespace='CELERY')
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+# Each kind of work has a queue of its own, consumed by workers of its own
+# (see docker-compose.prod.yaml), so a backlog of bulk work never delays the
+# screening of new submissions: 'live' persists and screens new submissions,
+# 'bulk' re-screens historical answers and 'maintenance' takes every other task
+LIVE_QUEUE = 'live'
+BULK_QUEUE = 'bulk'
+MAINTENANCE_QUEUE = 'maintenance'
+TASK_QUEUES = (LIVE_QUEUE, BULK_QUEUE, MAINTENANCE_QUEUE)
+
+app.conf.task_default_queue = MAINTENANCE_QUEUE
+app.conf.task_routes = {
+    'surveys.tasks.analyze_survey_responses_async': {'queue': LIVE_QUEUE},
+    'surveys.tasks.drain_pending_analyses': {'queue': LIVE_QUEUE},
+    'surveys.ingestion.drain_submission_stream': {'queue': LIVE_QUEUE},
+    'surveys.reanalysis.reanalyze_chunk': {'queue': BULK_QUEUE},
+}
+
+
+def get_queue_depths():
+    """
+    get_queue_depths returns the number of tasks waiting in each task queue
+    (not counting those prefetched by workers), read from the Redis broker
+    with one LLEN per queue in a single round trip. NOTE: tasks sent with a
+    priority wait in other lists and are not counted.
+    """
+    client = redis.Redis.from_url(app.conf.broker_url)
+    try:
+        pipeline = client.pipeline(transaction=False)
+        for queue in TASK_QUEUES:
+            pipeline.llen(queue)
+        return dict(zip(TASK_QUEUES, pipeline.execute()))
+    finally:
+        client.close()
@@ -3,12 +3,20 @@ from django.conf import settings
 
 class AdminAuthMiddleware(MiddlewareMixin):
     def process_response(self, request, response):
+        return self._set_superuser_cookie(response, request.user)
+
+    async def __acall__(self, request):
+        # Under ASGI, load the user without handing the response to a thread
+        response = await self.get_response(request)
+        return self._set_superuser_cookie(response, await request.auser())
+
+    def _set_superuser_cookie(self, response, user):
         # Check if user is authenticated and is accessing admin
-        if request.user.is_authenticated and request.user.is_superuser:
+        if user.is_authenticated and user.is_superuser:
             # Set cookies only if they don't exist
             response.set_cookie(
                 'is_superuser', 
-                str(request.user.is_superuser).lower(), 
+                str(user.is_superuser).lower(), 
                 max_age=3600*24*7, 
                 path='/', 
                 domain=settings.COOKIE_DOMAIN,
@@ -26,4 +34,4 @@ class AdminAuthMiddleware(MiddlewareMixin):
                 httponly=False,
                 samesite='Lax'
             )
-        return response
\ No newline at end of file
+        return response
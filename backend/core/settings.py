@@ -5,6 +5,7 @@ Django settings for core project.
 from pathlib import Path
 import os
 from dotenv import load_dotenv
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -55,6 +56,10 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Default and maximum number of rows per page of the cursor-paginated list APIs
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+
 # Remove these duplicate static settings
 # STATIC_URL = '/static/'
 # STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
@@ -75,6 +80,15 @@ MIDDLEWARE = [
     'core.middleware.AdminAuthMiddleware',
 ]
 
+# Serve the student-facing survey endpoints (questions, submission, autosave)
+# from the async views in surveys/async_views.py. Only useful when the app
+# runs under an ASGI server (core.asgi), e.g. gunicorn with uvicorn workers.
+ASYNC_SURVEY_VIEWS = os.getenv('ASYNC_SURVEY_VIEWS', 'false').lower() == 'true'
+if ASYNC_SURVEY_VIEWS:
+    # WhiteNoise is sync only, so every request below it would be run in a
+    # thread; nginx serves the static files in production
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
+
 # Remove these duplicate static settings
 # STATIC_URL = '/static/'
 # STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
@@ -99,6 +113,7 @@ CORS_ALLOWED_ORIGINS = [
     f'https://{os.getenv("EC2_HOST")}',
 ]
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 # 添加 CSRF 配置
 CSRF_TRUSTED_ORIGINS = [
@@ -161,7 +176,8 @@ DATABASES = {
             'charset': 'utf8mb4',  # 使用utf8mb4字符集，支持所有Unicode字符
             'isolation_level': 'read committed',  # 设置事务隔离级别
         },
-        'CONN_MAX_AGE': 60,  # 连接池持久化时间（秒）
+        # 连接池持久化时间（秒）; set to 0 under ASGI, where each request runs in its own thread
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
         'ATOMIC_REQUESTS': True,  # 每个HTTP请求在一个事务中执行
     }
 }
@@ -283,6 +299,23 @@ CACHES = {
     }
 }
 
+# Time in seconds a computed dashboard snapshot stays cached. Snapshots are
+# also invalidated whenever the institution's survey data changes.
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_CACHE_TIMEOUT', '900'))
+
+# Maximum time in seconds a process reuses a compiled survey template for the
+# hash link endpoints. Template edits made through the API invalidate it
+# immediately; this bounds the staleness of other changes (e.g. the
+# institution's email pattern edited in the Django admin).
+SURVEY_TEMPLATE_CACHE_MAX_AGE = int(os.getenv('SURVEY_TEMPLATE_CACHE_MAX_AGE', '300'))
+
+# Directory the columnar (Parquet) analytics exports are written to, one
+# subdirectory per institution
+ANALYTICS_EXPORT_ROOT = os.getenv('ANALYTICS_EXPORT_ROOT', os.path.join(BASE_DIR, 'analytics_exports'))
+# Responses younger than this many seconds are left for the next export run, so
+# slow transactions commit and submission-time flagging settles before export
+ANALYTICS_EXPORT_LAG_SECONDS = int(os.getenv('ANALYTICS_EXPORT_LAG_SECONDS', '900'))
+
 # Optional: Use Redis for sessions as well
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'default'
@@ -292,5 +325,131 @@ CELERY_RESULT_BACKEND = f'redis://{REDIS_HOST}:{REDIS_PORT}/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+# Task modules outside surveys/tasks.py
+CELERY_IMPORTS = ('surveys.ingestion', 'surveys.reanalysis')
+
+# Seconds the result of a submission sent with an idempotency key is replayed
+# to retries, and seconds after which an unfinished submission's claim on its
+# key expires
+SURVEY_IDEMPOTENCY_TIMEOUT = 86400
+SURVEY_IDEMPOTENCY_LOCK_TIMEOUT = 60
+
+# Survey submission ingestion: 'direct' writes submissions to MySQL in the
+# request; 'stream' appends them to a Redis stream that a Celery task persists
+# in batches, acknowledging the client before the database write
+SURVEY_INGESTION_MODE = os.getenv('SURVEY_INGESTION_MODE', 'direct')
+SURVEY_INGESTION_STREAM = 'sowfee_survey_submissions'
+SURVEY_INGESTION_GROUP = 'survey_persisters'
+# Maximum number of submissions persisted per transaction
+SURVEY_INGESTION_BATCH_SIZE = int(os.getenv('SURVEY_INGESTION_BATCH_SIZE', '200'))
+# Seconds between the first queued submission and the drain task, letting a batch build up
+SURVEY_INGESTION_DRAIN_DELAY = float(os.getenv('SURVEY_INGESTION_DRAIN_DELAY', '1'))
+# Seconds a drain task runs before handing over to a new one
+SURVEY_INGESTION_DRAIN_SECONDS = 30
+# Seconds after which a lost drain task no longer keeps new ones from being queued
+SURVEY_INGESTION_DRAIN_SCHEDULE_TIMEOUT = 60
+# Milliseconds after which entries read by a dead consumer are taken over
+SURVEY_INGESTION_CLAIM_IDLE_MS = 60000
+# Seconds the status of a queued submission stays available
+SURVEY_INGESTION_STATUS_TIMEOUT = 86400
+# Seconds between the drains celery beat queues on top of those queued by
+# submissions, so entries left by a dead drain task (and reclaimed with
+# XAUTOCLAIM) are persisted even when no new submission arrives
+SURVEY_INGESTION_SWEEP_INTERVAL = float(os.getenv('SURVEY_INGESTION_SWEEP_INTERVAL', '60'))
+
+# Periodic tasks, queued by celery beat (see docker-compose.prod.yaml)
+CELERY_BEAT_SCHEDULE = {
+    'sweep-submission-stream': {
+        'task': 'surveys.ingestion.drain_submission_stream',
+        'schedule': SURVEY_INGESTION_SWEEP_INTERVAL,
+        # A sweep not started by the next one is redundant
+        'options': {'expires': SURVEY_INGESTION_SWEEP_INTERVAL},
+    },
+}
 
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
\ No newline at end of file
+# What screens the text answers the prescreening does not settle (see
+# surveys/screening_backends.py): 'openai' the OpenAI API (or OPENAI_BASE_URL),
+# 'fake' the deterministic fake LLM of manage.py screening_stub_server at
+# SCREENING_FAKE_LLM_URL, for load tests without network access, or 'rules'
+# the local phrase rules alone
+SCREENING_BACKEND = os.getenv('SCREENING_BACKEND', 'openai')
+# Model of the openai backend, and its price in dollars per million input
+# and output tokens, for the cost estimates of manage.py screening_stats
+SCREENING_LLM_MODEL = os.getenv('SCREENING_LLM_MODEL', 'gpt-4o-mini')
+SCREENING_LLM_INPUT_COST = float(os.getenv('SCREENING_LLM_INPUT_COST', '0.15'))
+SCREENING_LLM_OUTPUT_COST = float(os.getenv('SCREENING_LLM_OUTPUT_COST', '0.60'))
+SCREENING_FAKE_LLM_URL = os.getenv('SCREENING_FAKE_LLM_URL', 'http://127.0.0.1:8089/v1')
+
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+# Base URL of the OpenAI compatible API to screen answers with, e.g. a local
+# stub server; the OpenAI API when unset
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+# Maximum number of screening requests a worker process has in flight
+SCREENING_LLM_CONCURRENCY = int(os.getenv('SCREENING_LLM_CONCURRENCY', '32'))
+# Time in seconds a screening request may take before it is retried
+SCREENING_LLM_TIMEOUT = float(os.getenv('SCREENING_LLM_TIMEOUT', '20'))
+# Retries of a screening request that timed out, was rate limited or failed
+# on the server, with exponential backoff from SCREENING_LLM_RETRY_BACKOFF
+# seconds up to SCREENING_LLM_MAX_BACKOFF
+SCREENING_LLM_MAX_RETRIES = int(os.getenv('SCREENING_LLM_MAX_RETRIES', '3'))
+SCREENING_LLM_RETRY_BACKOFF = 0.5
+SCREENING_LLM_MAX_BACKOFF = 20
+
+# How the text answers of a survey response are screened: 'batched' sends
+# them to the model together in one request, 'per_question' one request per
+# answer, stopping at the first concerning one
+SURVEY_ANALYSIS_MODE = os.getenv('SURVEY_ANALYSIS_MODE', 'batched')
+# Maximum number of answers screened per model request in the batched mode
+SURVEY_ANALYSIS_BATCH_SIZE = int(os.getenv('SURVEY_ANALYSIS_BATCH_SIZE', '20'))
+# Coalesce the screening of survey responses submitted within
+# SURVEY_ANALYSIS_MICROBATCH_WINDOW seconds of each other: they are queued on
+# a Redis list and a drain task screens up to SURVEY_ANALYSIS_MICROBATCH_SIZE
+# of them with one database read and one batched screening pass
+SURVEY_ANALYSIS_MICROBATCH = os.getenv('SURVEY_ANALYSIS_MICROBATCH', 'false').lower() == 'true'
+SURVEY_ANALYSIS_MICROBATCH_WINDOW = float(os.getenv('SURVEY_ANALYSIS_MICROBATCH_WINDOW', '0.5'))
+SURVEY_ANALYSIS_MICROBATCH_SIZE = int(os.getenv('SURVEY_ANALYSIS_MICROBATCH_SIZE', '50'))
+SURVEY_ANALYSIS_PENDING_LIST = 'sowfee_pending_analyses'
+# Seconds a drain task runs before handing over to a new one, and seconds
+# after which a lost drain task no longer keeps new ones from being queued
+SURVEY_ANALYSIS_DRAIN_SECONDS = 30
+SURVEY_ANALYSIS_DRAIN_SCHEDULE_TIMEOUT = 60
+# Screen answers with the local rules in surveys/prescreening.py before the
+# LLM: obvious high risk answers are flagged and filler answers ("n/a",
+# "fine") settled without an LLM request
+SCREENING_PRESCREEN_ENABLED = os.getenv('SCREENING_PRESCREEN_ENABLED', 'true').lower() == 'true'
+# Time in seconds a screening verdict stays cached for identical answers to
+# the same question. Redis evicts the least recently used verdicts first
+# when it runs out of memory (volatile-lru).
+SCREENING_VERDICT_CACHE_TIMEOUT = int(os.getenv('SCREENING_VERDICT_CACHE_TIMEOUT', str(30 * 86400)))
+
+# Circuit breaker of the LLM screening (surveys/circuit_breaker.py). It opens
+# when, in a window of SCREENING_BREAKER_WINDOW seconds with at least
+# SCREENING_BREAKER_MIN_ANSWERS answers sent to the LLM, the share of answers
+# that failed to screen reaches SCREENING_BREAKER_ERROR_RATE or the share
+# that took over SCREENING_BREAKER_SLOW_MS reaches SCREENING_BREAKER_SLOW_RATE,
+# or when more than SCREENING_BREAKER_MAX_QUEUE_DEPTH tasks wait in the live
+# queue (read every SCREENING_BREAKER_QUEUE_CHECK_INTERVAL seconds). While it
+# is open new answers get provisional verdicts from the local classifier;
+# after SCREENING_BREAKER_COOLDOWN seconds one screening probes the LLM, and
+# once it succeeds the provisional verdicts are confirmed by the LLM,
+# SCREENING_CONFIRMATION_BATCH_SIZE answers at a time.
+SCREENING_BREAKER_ENABLED = os.getenv('SCREENING_BREAKER_ENABLED', 'true').lower() == 'true'
+SCREENING_BREAKER_WINDOW = 60
+SCREENING_BREAKER_MIN_ANSWERS = int(os.getenv('SCREENING_BREAKER_MIN_ANSWERS', '20'))
+SCREENING_BREAKER_ERROR_RATE = float(os.getenv('SCREENING_BREAKER_ERROR_RATE', '0.5'))
+SCREENING_BREAKER_SLOW_MS = int(os.getenv('SCREENING_BREAKER_SLOW_MS', '15000'))
+SCREENING_BREAKER_SLOW_RATE = float(os.getenv('SCREENING_BREAKER_SLOW_RATE', '0.5'))
+SCREENING_BREAKER_MAX_QUEUE_DEPTH = int(os.getenv('SCREENING_BREAKER_MAX_QUEUE_DEPTH', '500'))
+SCREENING_BREAKER_QUEUE_CHECK_INTERVAL = 10
+SCREENING_BREAKER_COOLDOWN = int(os.getenv('SCREENING_BREAKER_COOLDOWN', '60'))
+SCREENING_CONFIRMATION_BATCH_SIZE = 200
+
+# Re-screening of historical answers (manage.py reanalyze_responses): the
+# QuestionResponse ids re-screened per Celery task, the LLM requests per
+# minute a run may send across all workers, the number of chunk tasks queued
+# at a time, and the seconds after which a queued chunk that never finished
+# is queued again
+SCREENING_REANALYSIS_CHUNK_SIZE = int(os.getenv('SCREENING_REANALYSIS_CHUNK_SIZE', '1000'))
+SCREENING_REANALYSIS_BUDGET = int(os.getenv('SCREENING_REANALYSIS_BUDGET', '300'))
+SCREENING_REANALYSIS_MAX_IN_FLIGHT = int(os.getenv('SCREENING_REANALYSIS_MAX_IN_FLIGHT', '8'))
+SCREENING_REANALYSIS_CHUNK_TIMEOUT = 3600
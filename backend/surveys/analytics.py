@@ -0,0 +1,159 @@
+import calendar
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q, Sum
+from django.db.models.functions import ExtractMonth
+from django.utils import timezone
+from .caching import get_version, bump_version, get_or_compute
+from .models import User, AnonymousStudent, SurveyQuestion, QuestionCategory, DailyResponseRollup, DailyLikertRollup, LatestResponse
+
+
+def get_dashboard_data(institution):
+    """
+    get_dashboard_data computes the dashboard payload of an institution with a
+    fixed number of grouped queries. Response counts and Likert distributions
+    are read from the daily rollups, so their cost depends on the number of
+    days with responses rather than the number of responses, and flagged
+    students are read from the latest response index. The returned dict is
+    what dashboard_api sends to the frontend.
+
+    institution: institution of the admin viewing the dashboard
+    """
+    # Students, respondents and students whose latest response is flagged
+    num_students = (
+        User.objects.filter(is_student=True, institution_details=institution).count() +
+        AnonymousStudent.objects.filter(survey_template__institution=institution).count()
+    )
+    latest_responses = LatestResponse.objects.filter(institution=institution)
+    registered_latest = latest_responses.filter(student__is_student=True)
+    anonymous_latest = latest_responses.filter(anonymous_student__isnull=False)
+    responded_students = registered_latest.count() + anonymous_latest.count()
+
+    school_flagged_responses = [
+        (name, email) for name, email in registered_latest.filter(flagged=True)
+        .order_by('student_id').values_list('student__name', 'student__email')
+    ]
+    school_flagged_responses += [
+        (name or "Anonymous", email) for name, email in anonymous_latest.filter(flagged=True)
+        .order_by('anonymous_student_id').values_list('anonymous_student__name', 'anonymous_student__email')
+    ]
+    num_flagged_students = len(school_flagged_responses)
+
+    # Number of responses and the month of the latest one
+    daily_rollups = DailyResponseRollup.objects.filter(institution=institution, num_responses__gt=0)
+    response_totals = daily_rollups.aggregate(num_responses=Sum('num_responses'), latest=Max('day'))
+    num_responses = response_totals['num_responses'] or 0
+
+    # Question categories available in the institution's templates
+    categories = set(
+        SurveyQuestion.objects.filter(survey_template__institution=institution)
+        .values_list('category', flat=True).distinct()
+    )
+    has_sleep_questions = QuestionCategory.SLEEP in categories
+    has_stress_questions = QuestionCategory.STRESS in categories
+    has_support_questions = QuestionCategory.SUPPORT in categories
+
+    # Sleep and stress buckets over every response of the institution
+    likert_rollups = DailyLikertRollup.objects.filter(institution=institution)
+    buckets = likert_rollups.aggregate(
+        good_sleep=Sum('count', filter=Q(category=QuestionCategory.SLEEP, likert_value__lte=2), default=0),
+        bad_sleep=Sum('count', filter=Q(category=QuestionCategory.SLEEP, likert_value__gte=4), default=0),
+        low_stress=Sum('count', filter=Q(category=QuestionCategory.STRESS, likert_value__lte=2), default=0),
+        moderate_stress=Sum('count', filter=Q(category=QuestionCategory.STRESS, likert_value=3), default=0),
+        high_stress=Sum('count', filter=Q(category=QuestionCategory.STRESS, likert_value__gte=4), default=0),
+    )
+    num_good_sleep_quality = buckets['good_sleep'] if has_sleep_questions else 0
+    num_bad_sleep_quality = buckets['bad_sleep'] if has_sleep_questions else 0
+    num_low_stress = buckets['low_stress'] if has_stress_questions else 0
+    num_moderate_stress = buckets['moderate_stress'] if has_stress_questions else 0
+    num_high_stress = buckets['high_stress'] if has_stress_questions else 0
+
+    months = []
+    monthly_response_rates = []
+    monthly_num_responses = []
+    monthly_support_perception = []
+
+    # Only process if there are responses
+    if response_totals['latest'] is not None:
+        last_month = response_totals['latest'].month
+        months = list(calendar.month_abbr[1:last_month + 1])
+        current_year = timezone.now().year
+
+        # Unique students who responded in each month of the current year
+        respondents_by_month = {
+            row['month']: row['respondents']
+            for row in daily_rollups.filter(day__year=current_year)
+            .annotate(month=ExtractMonth('day'))
+            .values('month')
+            .annotate(respondents=Sum('num_respondents'))
+        }
+
+        # Positive support perception answers in each month of the current year
+        support_by_month = {}
+        if has_support_questions:
+            support_by_month = {
+                row['month']: row['count']
+                for row in likert_rollups.filter(
+                    day__year=current_year,
+                    category=QuestionCategory.SUPPORT,
+                    likert_value__lte=2,
+                )
+                .annotate(month=ExtractMonth('day'))
+                .values('month')
+                .annotate(count=Sum('count'))
+            }
+
+        for month in range(1, last_month + 1):
+            unique_students_responded = respondents_by_month.get(month, 0)
+            monthly_response_rates.append(int(unique_students_responded/num_students * 100) if num_students > 0 else 0)
+            monthly_num_responses.append(unique_students_responded)
+            if has_support_questions:
+                monthly_support_perception.append(support_by_month.get(month, 0))
+
+    return {
+        "num_students": num_students,
+        "flagged_students": school_flagged_responses,
+        "num_flagged_students": num_flagged_students,
+        "num_responses": num_responses,
+        "response_rate": int(responded_students/num_students * 100) if num_students > 0 else 0,
+        "num_stable_students": num_students - num_flagged_students,
+        "num_good_sleep_quality": num_good_sleep_quality,
+        "num_bad_sleep_quality": num_bad_sleep_quality,
+        "num_low_stress": num_low_stress,
+        "num_moderate_stress": num_moderate_stress,
+        "num_high_stress": num_high_stress,
+        "months": months,
+        "monthly_response_rates": monthly_response_rates,
+        "monthly_num_responses": monthly_num_responses,
+        "monthly_support_perception": monthly_support_perception,
+        "has_sleep_questions": has_sleep_questions,
+        "has_stress_questions": has_stress_questions,
+        "has_support_questions": has_support_questions
+    }
+
+
+def get_dashboard_snapshot(institution):
+    """
+    get_dashboard_snapshot returns the dashboard payload of an institution from
+    the cache, computing it at most once per version of the institution's data
+
+    institution: institution of the admin viewing the dashboard
+    """
+    version = get_version(f"dashboard_{institution.id}")
+    return get_or_compute(
+        f"dashboard_snapshot_{institution.id}_{version}",
+        lambda: get_dashboard_data(institution),
+        timeout=settings.DASHBOARD_CACHE_TIMEOUT,
+    )
+
+
+def invalidate_dashboard(institution_id):
+    """
+    invalidate_dashboard discards the cached dashboard of an institution once
+    the current transaction commits, so that the next recompute sees the change
+
+    institution_id: id of the institution whose data changed
+    """
+    if institution_id is None:
+        return
+    transaction.on_commit(lambda: bump_version(f"dashboard_{institution_id}"))
@@ -0,0 +1,283 @@
+"""
+Async implementations of the student-facing survey endpoints, routed instead
+of the DRF views in views.py when ASYNC_SURVEY_VIEWS is enabled and the app is
+served by an ASGI server (core.asgi). Reads go through the async ORM and cache
+API, so a request waiting on MySQL or Redis does not hold a worker; writes
+need a transaction, which the async ORM does not support, and run in a
+worker thread through sync_to_async.
+"""
+import json
+import logging
+from datetime import datetime
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST, require_http_methods
+from .models import SurveyTemplate, SurveyQuestion
+from .template_cache import aget_compiled_template
+from .views import _handle_student_responses
+
+logger = logging.getLogger("surveys")
+
+
+class _CSRFCheck(CsrfViewMiddleware):
+    def _reject(self, request, reason):
+        return reason
+
+
+def _csrf_failure(request):
+    """
+    _csrf_failure runs Django's CSRF check and returns the reason it fails, or
+    None if it passes. Like DRF's SessionAuthentication, the check only applies
+    to authenticated users, who are the only ones a forged request can act for.
+    """
+    check = _CSRFCheck(lambda request: None)
+    check.process_request(request)
+    return check.process_view(request, None, (), {})
+
+
+def _parse_body(request):
+    """_parse_body returns the submitted JSON or form data of a request"""
+    if request.content_type == 'application/json':
+        return json.loads(request.body or b'{}')
+    return request.POST
+
+
+def async_survey_endpoint(view):
+    """
+    async_survey_endpoint applies what the async survey views need in place of
+    DRF's api_view: their own CSRF check, and opting out of ATOMIC_REQUESTS,
+    which Django does not support for async views
+    """
+    return transaction.non_atomic_requests(csrf_exempt(view))
+
+
+@async_survey_endpoint
+@require_GET
+async def get_user_survey_questions(request, hash_link=None):
+    """
+    get_user_survey_questions returns the questions of a survey: those of the
+    hash link's template, or of the active template of the user's institution
+    """
+    if hash_link:
+        compiled_template = await aget_compiled_template(hash_link)
+        if compiled_template is None:
+            return JsonResponse({
+                "success": False,
+                "error": "Survey template not found"
+            }, status=404)
+        if not compiled_template.questions:
+            return JsonResponse({
+                "success": False,
+                "error": "No survey questions found for this template"
+            }, status=404)
+        # The response body is encoded once per template version
+        return HttpResponse(compiled_template.questions_json, content_type="application/json")
+
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"success": False, "error": "Authentication required"})
+    try:
+        survey_template = None
+        if not user.is_superuser:
+            if user.institution_details_id:
+                survey_template = await SurveyTemplate.objects.filter(
+                    institution_id=user.institution_details_id,
+                    used=True
+                ).afirst()
+            if not survey_template:
+                survey_template = await SurveyTemplate.objects.filter(
+                    institution_id=user.institution_details_id,
+                ).order_by('id').afirst()
+        else:
+            survey_template = await SurveyTemplate.objects.afirst()
+
+        if not survey_template:
+            return JsonResponse({
+                "success": False,
+                "error": "No survey template found for your institution"
+            }, status=404)
+
+        questions_data = [{
+            'id': q.id,
+            'text': q.question_text,
+            'type': q.question_type,
+            'category': q.category,
+            'answer_choices': q.answer_choices,
+            'order': q.order
+        } async for q in SurveyQuestion.objects.filter(survey_template=survey_template).order_by('order')]
+
+        if not questions_data:
+            return JsonResponse({
+                "success": False,
+                "error": "No survey questions found for this template"
+            }, status=404)
+
+        return JsonResponse({
+            "success": True,
+            "template_id": survey_template.id,
+            "questions": questions_data
+        })
+    except Exception as e:
+        logger.error(f"Error fetching survey questions: {str(e)}")
+        return JsonResponse({
+            "success": False,
+            "error": "An error occurred while loading survey questions"
+        }, status=500)
+
+
+async def _get_submission_template(user, data):
+    """
+    _get_submission_template returns the survey template an authenticated
+    student submits to (the one given in the submission, or the institution's
+    active template) with its questions, or an error response
+    """
+    survey_template_id = data.get('survey_template_id')
+    if survey_template_id:
+        try:
+            survey_template = await SurveyTemplate.objects.aget(id=survey_template_id)
+        except Exception as e:
+            return None, None, JsonResponse({"success": False, "message": f"Invalid survey template: {str(e)}"})
+    elif user.institution_details_id:
+        survey_template = await SurveyTemplate.objects.filter(
+            institution_id=user.institution_details_id, used=True
+        ).afirst()
+        if not survey_template:
+            survey_template = await SurveyTemplate.objects.filter(
+                institution_id=user.institution_details_id
+            ).order_by('id').afirst()
+            # If we found a template, mark it as used
+            if survey_template:
+                survey_template.used = True
+                await survey_template.asave()
+        if not survey_template:
+            return None, None, JsonResponse({"success": False, "message": "No survey template found for your institution"})
+    else:
+        return None, None, JsonResponse({"success": False, "message": "No institution associated with user and no survey template specified"})
+
+    questions = [question async for question in SurveyQuestion.objects.filter(survey_template=survey_template)]
+    return survey_template, questions, None
+
+
+@async_survey_endpoint
+@require_POST
+async def survey_view(request, hash_link=None):
+    """survey_view validates and saves a survey submission, from a hash link or a logged in student"""
+    user = await request.auser()
+    if user.is_authenticated:
+        reason = _csrf_failure(request)
+        if reason:
+            return JsonResponse({"detail": f"CSRF Failed: {reason}"}, status=403)
+    try:
+        data = _parse_body(request)
+    except ValueError:
+        return JsonResponse({"success": False, "message": "Invalid JSON format"}, status=400)
+
+    email_pattern = None
+    if hash_link:
+        compiled_template = await aget_compiled_template(hash_link)
+        if compiled_template is None:
+            return JsonResponse({"success": False, "message": "Survey template not found"}, status=404)
+        survey_template, questions = compiled_template.template, compiled_template.questions
+        email_pattern = compiled_template.email_pattern
+        if not questions:
+            return JsonResponse({"success": False, "message": "No questions found in the survey template"})
+        missing_responses = compiled_template.missing_answers(data)
+    else:
+        if not user.is_authenticated:
+            return JsonResponse({"success": False, "message": "Please login to the application to submit a survey response"})
+        survey_template, questions, error_response = await _get_submission_template(user, data)
+        if error_response:
+            return error_response
+        if not questions:
+            return JsonResponse({"success": False, "message": "No questions found in the survey template"})
+        missing_responses = [
+            question.question_text[:30] + "..." for question in questions if str(question.id) not in data
+        ]
+
+    if missing_responses:
+        return JsonResponse({"success": False, "message": f"Missing responses for questions: {', '.join(missing_responses)}"})
+
+    # Saving the submission needs a transaction
+    return await sync_to_async(_handle_student_responses)(
+        request, data, survey_template, questions, bool(hash_link), email_pattern
+    )
+
+
+def _autosave_key(email, template_id):
+    return f"survey_autosave_{email}_{template_id}"
+
+
+@async_survey_endpoint
+@require_POST
+async def survey_autosave(request):
+    try:
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({"success": False, "message": "User not authorized"}, status=200)
+        reason = _csrf_failure(request)
+        if reason:
+            return JsonResponse({"detail": f"CSRF Failed: {reason}"}, status=403)
+        data = _parse_body(request)
+        template_id = data.get("template_id")
+        if not template_id:
+            return JsonResponse({"success": False, "message": "Error: Wrong template id"}, status=200)
+        if not await SurveyTemplate.objects.filter(id=template_id).aexists():
+            return JsonResponse({
+                "success": False,
+                "message": "Invalid survey template"
+            }, status=404)
+        cache_data = {
+            "template_id": template_id,
+            "student_name": user.name if user.name else "",
+            "school_email": user.email,
+            "last_saved": datetime.now().isoformat(),
+            "answers": data.get("answers", {}),
+        }
+        await cache.aset(_autosave_key(user.email, template_id), json.dumps(cache_data), timeout=1800)
+        return JsonResponse({"success": True, "message": "Progress saved"})
+    except Exception as e:
+        logger.error(f"Autosave error: {str(e)}")
+        return JsonResponse({"success": False, "message": "Failed to save progress"}, status=200)
+
+
+@async_survey_endpoint
+@require_GET
+async def survey_autosave_load(request, template_id):
+    try:
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({"success": False, "message": "User not authorized"}, status=200)
+        cache_key = _autosave_key(user.email, template_id)
+        cached_data = await cache.aget(cache_key)
+        if not cached_data:
+            return JsonResponse({"success": False, "message": "No autosaved data found"}, status=200)
+        try:
+            return JsonResponse({"success": True, "saved_data": json.loads(cached_data)}, status=200)
+        except json.JSONDecodeError:
+            # Corrupted data
+            await cache.adelete(cache_key)
+            return JsonResponse({"success": False, "message": "Corrupted save data. Please press the clear button"}, status=200)
+    except Exception as e:
+        logger.error(f"Autosave load error: {str(e)}")
+        return JsonResponse({"success": False, "message": "Failed to load autosave"}, status=200)
+
+
+@async_survey_endpoint
+@require_http_methods(["DELETE"])
+async def survey_autosave_clear(request, template_id):
+    try:
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({"success": False, "message": "User not authorized"}, status=200)
+        reason = _csrf_failure(request)
+        if reason:
+            return JsonResponse({"detail": f"CSRF Failed: {reason}"}, status=403)
+        await cache.adelete(_autosave_key(user.email, template_id))
+        return JsonResponse({"success": True, "message": "Autosave data cleared"})
+    except Exception as e:
+        logger.error(f"Clear autosave error: {str(e)}")
+        return JsonResponse({"success": False, "message": "Failed to clear draft"}, status=200)
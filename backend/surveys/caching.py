@@ -0,0 +1,90 @@
+import time
+import uuid
+from django.core.cache import cache
+
+
+def get_version(namespace):
+    """
+    get_version returns the current version token of a cache namespace. Keys
+    built from the token become unreachable as soon as the namespace is bumped.
+    NOTE: tokens are random rather than incrementing, so a version key lost to
+    eviction can never bring back entries cached under an older version.
+
+    namespace: name of the group of cache entries, e.g. dashboard_<institution id>
+    """
+    key = f"cache_version_{namespace}"
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(namespace):
+    """aget_version is the async version of get_version"""
+    key = f"cache_version_{namespace}"
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, uuid.uuid4().hex, timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_version(namespace):
+    """
+    bump_version invalidates every cache entry built from the namespace's
+    current version token
+    """
+    cache.set(f"cache_version_{namespace}", uuid.uuid4().hex, timeout=None)
+
+
+def increment_counter(key, amount=1):
+    """
+    increment_counter adds amount to a counter kept in the cache, creating it
+    if needed. Counters never expire, so Redis does not evict them.
+    """
+    if not amount:
+        return
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        # First count (or the counter was deleted)
+        if not cache.add(key, amount, timeout=None):
+            cache.incr(key, amount)
+
+
+def get_or_compute(key, compute, timeout, lock_timeout=30, wait=10.0, poll_interval=0.05):
+    """
+    get_or_compute returns the cached value of key, computing and caching it on
+    a miss. Only one caller recomputes a missing value at a time: the others
+    wait for it to appear in the cache (stampede protection) and compute it
+    themselves only if it does not show up within `wait` seconds.
+
+    key: cache key of the value
+    compute: function returning the value to cache
+    timeout: time in seconds the computed value is cached for
+    lock_timeout: time in seconds after which an abandoned recompute lock expires
+    wait: maximum time in seconds to wait for another caller's recompute
+    poll_interval: time in seconds between cache checks while waiting
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f"{key}_lock"
+    if cache.add(lock_key, 1, timeout=lock_timeout):
+        try:
+            value = compute()
+            cache.set(key, value, timeout=timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    # Another worker is already recomputing the value
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return compute()
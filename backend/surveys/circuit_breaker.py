@@ -0,0 +1,147 @@
+"""
+Circuit breaker of the LLM screening. While the LLM fails, is too slow or
+cannot keep up with the live queue, new answers are screened by the local
+classifier instead of piling up or being dropped, and only one screening at
+a time probes whether the LLM has recovered.
+"""
+import logging
+import time
+from django.conf import settings
+from django.core.cache import cache
+from core.celery import LIVE_QUEUE, get_queue_depths
+from .screening_backends import get_backend
+
+logger = logging.getLogger("surveys")
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+STATE_KEY = "screening_breaker_state"
+PROBE_KEY = "screening_breaker_probe"
+QUEUE_CHECKED_KEY = "screening_breaker_queue_checked"
+
+
+def _window_key(kind):
+    window = int(time.time() // settings.SCREENING_BREAKER_WINDOW)
+    return f"screening_breaker_{kind}_{window}"
+
+
+def _add_to_window(kind, amount):
+    key = _window_key(kind)
+    cache.add(key, 0, timeout=2 * settings.SCREENING_BREAKER_WINDOW)
+    try:
+        return cache.incr(key, amount)
+    except ValueError:
+        # Evicted in between
+        cache.set(key, amount, timeout=2 * settings.SCREENING_BREAKER_WINDOW)
+        return amount
+
+
+def get_breaker_state():
+    """
+    get_breaker_state returns the state of the breaker (closed, open or
+    half_open), with when it opened and why if it is not closed
+    """
+    state = cache.get(STATE_KEY)
+    if state is None:
+        return {"state": CLOSED}
+    if time.time() < state["until"]:
+        return {"state": OPEN, **state}
+    return {"state": HALF_OPEN, **state}
+
+
+def trip(reason):
+    """trip opens the breaker for SCREENING_BREAKER_COOLDOWN seconds"""
+    now = time.time()
+    cache.set(STATE_KEY, {"opened": now, "until": now + settings.SCREENING_BREAKER_COOLDOWN, "reason": reason}, timeout=None)
+    cache.delete(PROBE_KEY)
+    logger.warning(f"Screening circuit breaker opened: {reason}")
+
+
+def _live_queue_backlogged():
+    """
+    _live_queue_backlogged tells if more than SCREENING_BREAKER_MAX_QUEUE_DEPTH
+    tasks wait in the live queue. The broker is read at most once every
+    SCREENING_BREAKER_QUEUE_CHECK_INTERVAL seconds, by one caller.
+    """
+    if not cache.add(QUEUE_CHECKED_KEY, 1, timeout=settings.SCREENING_BREAKER_QUEUE_CHECK_INTERVAL):
+        return False
+    try:
+        depth = get_queue_depths()[LIVE_QUEUE]
+    except Exception as e:
+        logger.warning(f"Could not read the task queue depths: {str(e)}")
+        return False
+    if depth > settings.SCREENING_BREAKER_MAX_QUEUE_DEPTH:
+        trip(f"{depth} tasks waiting in the live queue")
+        return True
+    return False
+
+
+def acquire_llm():
+    """
+    acquire_llm tells how the answers about to be screened should be: CLOSED
+    to screen them with the LLM, HALF_OPEN to screen them with the LLM as the
+    probe of its recovery (then report its verdicts to end_probe), or OPEN to
+    screen them locally
+    """
+    if not settings.SCREENING_BREAKER_ENABLED or not get_backend().uses_llm:
+        return CLOSED
+    state = get_breaker_state()["state"]
+    if state == CLOSED:
+        return OPEN if _live_queue_backlogged() else CLOSED
+    if state == HALF_OPEN and cache.add(PROBE_KEY, 1, timeout=settings.SCREENING_BREAKER_COOLDOWN):
+        return HALF_OPEN
+    return OPEN
+
+
+def end_probe(verdicts):
+    """
+    end_probe reports the outcome of the probe: the breaker closes if the
+    LLM screened the probe's answers and opens again for another cooldown if
+    it failed any. If no answer reached the LLM (e.g. every verdict was
+    cached), another screening gets to probe. Returns whether the breaker closed.
+
+    verdicts: verdicts of the probe's answers
+    """
+    outcomes = [bool(verdict.get("error")) for verdict in verdicts if verdict.get("error") or verdict.get("source") == "llm"]
+    if not outcomes:
+        cache.delete(PROBE_KEY)
+        return False
+    if any(outcomes):
+        trip("LLM probe failed")
+        return False
+    # Outcomes counted before the breaker opened do not count against the LLM any more
+    cache.delete_many([STATE_KEY, PROBE_KEY, *(_window_key(kind) for kind in ("answers", "failed", "slow"))])
+    logger.warning("Screening circuit breaker closed: LLM probe succeeded")
+    return True
+
+
+def record_llm_verdicts(verdicts):
+    """
+    record_llm_verdicts counts the answers the LLM screened, failed to screen
+    or screened slower than SCREENING_BREAKER_SLOW_MS in the current window,
+    and opens the breaker when the share of failed or slow answers reaches
+    its threshold
+
+    verdicts: verdicts returned by the LLM screening (cached and local ones are ignored)
+    """
+    screened = failed = slow = 0
+    for verdict in verdicts:
+        if verdict.get("error"):
+            failed += 1
+        elif verdict.get("source") == "llm":
+            screened += 1
+            slow += (verdict.get("latency_ms") or 0) > settings.SCREENING_BREAKER_SLOW_MS
+    if not settings.SCREENING_BREAKER_ENABLED or not screened + failed:
+        return
+
+    answers = _add_to_window("answers", screened + failed)
+    failed = _add_to_window("failed", failed) if failed else cache.get(_window_key("failed"), 0)
+    slow = _add_to_window("slow", slow) if slow else cache.get(_window_key("slow"), 0)
+    if answers < settings.SCREENING_BREAKER_MIN_ANSWERS or get_breaker_state()["state"] != CLOSED:
+        return
+    if failed / answers >= settings.SCREENING_BREAKER_ERROR_RATE:
+        trip(f"{failed} of {answers} answers failed to screen")
+    elif slow / answers >= settings.SCREENING_BREAKER_SLOW_RATE:
+        trip(f"{slow} of {answers} answers took over {settings.SCREENING_BREAKER_SLOW_MS}ms to screen")
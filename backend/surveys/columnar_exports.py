@@ -0,0 +1,233 @@
+import logging
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+from .models import SurveyResponse, QuestionResponse, ExportWatermark
+
+logger = logging.getLogger("surveys")
+
+PART_SUFFIX = '.parquet'
+
+
+def _load_pyarrow():
+    """
+    _load_pyarrow imports pyarrow on first use, so the web process only needs
+    it installed when the analytics export is actually run
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImproperlyConfigured("The analytics export requires pyarrow, install it with `pip install pyarrow`")
+    return pyarrow, pyarrow.parquet
+
+
+def _schema(pa):
+    """
+    _schema returns the Arrow schema of the export: one row per question
+    response, with the columns of its survey response repeated on each row.
+    Survey responses without any question response get a single row with
+    empty question columns.
+    """
+    return pa.schema([
+        ('response_id', pa.int64()),
+        ('created', pa.timestamp('us', tz='UTC')),
+        ('institution_id', pa.int64()),
+        ('survey_template_id', pa.int64()),
+        ('flagged', pa.bool_()),
+        ('student_id', pa.int64()),
+        ('anonymous_student_id', pa.string()),
+        ('question_id', pa.int64()),
+        ('question_type', pa.string()),
+        ('question_category', pa.string()),
+        ('likert_value', pa.int8()),
+        ('text_response', pa.string()),
+    ])
+
+
+def get_institution_export_dir(institution_id):
+    """
+    get_institution_export_dir returns the directory holding an institution's
+    Parquet files, partitioned as month=YYYY-MM/part-<first response id>.parquet
+    """
+    return Path(settings.ANALYTICS_EXPORT_ROOT) / f"institution_{institution_id}"
+
+
+def _part_start_id(path):
+    """_part_start_id returns the first response id of a part file from its name"""
+    try:
+        return int(path.name[len('part-'):-len(PART_SUFFIX)])
+    except ValueError:
+        return None
+
+
+def _remove_unrecorded_parts(export_dir, last_response_id):
+    """
+    _remove_unrecorded_parts deletes part files (and temporary files) left by
+    a run that was interrupted before it moved the watermark; their rows are
+    written again by the current run
+    """
+    for path in export_dir.glob('month=*/*'):
+        if path.name.endswith('.tmp'):
+            path.unlink()
+        elif path.name.endswith(PART_SUFFIX):
+            start_id = _part_start_id(path)
+            if start_id is not None and start_id > last_response_id:
+                path.unlink()
+
+
+def _iter_batches(responses, batch_size):
+    """
+    _iter_batches yields the rows of a survey response queryset in id-ordered
+    keyset batches, together with each batch's question responses grouped by
+    survey response id
+    """
+    responses = responses.order_by('id').values_list(
+        'id', 'created', 'institution_id', 'survey_template_id', 'flagged', 'student_id', 'anonymous_student_id',
+    )
+    last_id = 0
+    while True:
+        batch = list(responses.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return
+        last_id = batch[-1][0]
+
+        answers = {}
+        question_responses = QuestionResponse.objects.filter(
+            survey_response_id__in=[row[0] for row in batch]
+        ).order_by('id').values_list(
+            'survey_response_id', 'question_id', 'question__question_type', 'question__category', 'likert_value', 'text_response',
+        )
+        for survey_response_id, *answer in question_responses:
+            answers.setdefault(survey_response_id, []).append(answer)
+        yield batch, answers
+
+
+def _batch_columns(batch, answers, column_names):
+    """
+    _batch_columns flattens a batch of survey responses into export columns,
+    grouped by the month partition of each response
+    """
+    months = {}
+    no_answer = [(None, None, None, None, None)]
+    for response in batch:
+        month = timezone.localtime(response[1]).strftime('%Y-%m')
+        columns = months.setdefault(month, {name: [] for name in column_names})
+        for answer in answers.get(response[0], no_answer):
+            for name, value in zip(column_names, response + tuple(answer)):
+                columns[name].append(value)
+    return months
+
+
+def export_institution(institution, full=False, batch_size=5000):
+    """
+    export_institution appends the survey responses of an institution that
+    are newer than its ExportWatermark to month-partitioned Parquet files,
+    writing one new part file per month touched, and then moves the
+    watermark. Each part is written to a temporary file and renamed once
+    complete, so readers never see a partial file.
+    NOTE: responses submitted less than ANALYTICS_EXPORT_LAG_SECONDS ago are
+    left for the next run: ids are allocated before their transaction commits,
+    so a younger response with a lower id could still appear after a run has
+    moved the watermark past it. Rows are not rewritten once exported, so
+    flags set or responses deleted afterwards are only picked up by a full
+    export.
+
+    institution: institution to export
+    full: discard the existing files and export every response again
+    batch_size: number of survey responses read per query
+
+    Returns the number of survey responses and rows exported and the paths of
+    the part files written.
+    """
+    pa, pq = _load_pyarrow()
+    schema = _schema(pa)
+    export_dir = get_institution_export_dir(institution.id)
+
+    if full:
+        # Reset the watermark on its own, so an interrupted full export is
+        # resumed from scratch instead of after the files it has deleted
+        ExportWatermark.objects.update_or_create(
+            institution=institution, defaults={'last_response_id': 0, 'last_created': None}
+        )
+
+    with transaction.atomic():
+        # The row lock keeps two runs from exporting the same institution at once
+        watermark, _ = ExportWatermark.objects.select_for_update().get_or_create(institution=institution)
+        export_dir.mkdir(parents=True, exist_ok=True)
+        _remove_unrecorded_parts(export_dir, watermark.last_response_id)
+
+        responses = SurveyResponse.objects.filter(institution=institution, id__gt=watermark.last_response_id)
+        cutoff = timezone.now() - timedelta(seconds=settings.ANALYTICS_EXPORT_LAG_SECONDS)
+        first_recent_id = responses.filter(created__gt=cutoff).order_by('id').values_list('id', flat=True).first()
+        if first_recent_id is not None:
+            responses = responses.filter(id__lt=first_recent_id)
+
+        writers = {}
+        num_responses = num_rows = 0
+        last_response = None
+        try:
+            for batch, answers in _iter_batches(responses, batch_size):
+                for month, columns in _batch_columns(batch, answers, schema.names).items():
+                    if month not in writers:
+                        path = export_dir / f"month={month}" / f"part-{columns['response_id'][0]:012d}{PART_SUFFIX}"
+                        path.parent.mkdir(exist_ok=True)
+                        tmp_path = path.with_name(path.name + '.tmp')
+                        writers[month] = (pq.ParquetWriter(tmp_path, schema), tmp_path, path)
+                    writers[month][0].write_table(pa.Table.from_pydict(columns, schema=schema))
+                    num_rows += len(columns['response_id'])
+                num_responses += len(batch)
+                last_response = batch[-1]
+        except BaseException:
+            for writer, tmp_path, _ in writers.values():
+                writer.close()
+                tmp_path.unlink(missing_ok=True)
+            raise
+
+        paths = []
+        for writer, tmp_path, path in writers.values():
+            writer.close()
+            os.replace(tmp_path, path)
+            paths.append(path)
+
+        if last_response is not None:
+            watermark.last_response_id = last_response[0]
+            watermark.last_created = last_response[1]
+        watermark.save()
+
+    logger.info(f"Exported {num_responses} responses ({num_rows} rows) of institution {institution.id} to {len(paths)} files")
+    return {"responses": num_responses, "rows": num_rows, "files": paths}
+
+
+def list_export_files(institution_id):
+    """
+    list_export_files returns the path (relative to the institution's export
+    directory), size and modification time of each of its Parquet files
+    """
+    export_dir = get_institution_export_dir(institution_id)
+    files = []
+    for path in sorted(export_dir.glob(f'month=*/*{PART_SUFFIX}')):
+        stat = path.stat()
+        files.append({
+            "path": path.relative_to(export_dir).as_posix(),
+            "size": stat.st_size,
+            "modified": datetime.fromtimestamp(stat.st_mtime, tz=dt_timezone.utc),
+        })
+    return files
+
+
+def resolve_export_file(institution_id, relative_path):
+    """
+    resolve_export_file returns the absolute path of one of an institution's
+    Parquet files, or None if relative_path does not name such a file
+    (including paths escaping the institution's export directory)
+    """
+    export_dir = get_institution_export_dir(institution_id).resolve()
+    path = (export_dir / relative_path).resolve()
+    if export_dir not in path.parents or path.suffix != PART_SUFFIX or not path.is_file():
+        return None
+    return path
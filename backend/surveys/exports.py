@@ -0,0 +1,143 @@
+import csv
+import json
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import SurveyResponse, SurveyQuestion, QuestionResponse
+
+# Columns describing the survey response itself; one column per question follows
+RESPONSE_COLUMNS = [
+    'response_id', 'created', 'survey_template_id', 'flagged',
+    'respondent_type', 'student_id', 'email', 'name',
+]
+
+
+def _question_column(question_id):
+    return f"question_{question_id}"
+
+
+def get_export_questions(institution):
+    """
+    get_export_questions returns (id, text) of every question of the
+    institution's survey templates, in the order of the export columns
+    """
+    return list(
+        SurveyQuestion.objects.filter(survey_template__institution=institution)
+        .order_by('survey_template_id', 'order', 'id')
+        .values_list('id', 'question_text')
+    )
+
+
+def iter_response_batches(institution, questions, batch_size=1000):
+    """
+    iter_response_batches yields the survey responses of an institution as
+    lists of dicts, one per response, with the answer to each question pivoted
+    into its own column. Responses are read in id-ordered batches (keyset on
+    id) with one question response query per batch, so memory use does not
+    grow with the size of the export.
+
+    institution: institution whose responses are exported
+    questions: (id, text) pairs from get_export_questions
+    batch_size: number of responses read per query
+    """
+    empty_answers = {_question_column(question_id): None for question_id, _ in questions}
+    responses = SurveyResponse.objects.filter(institution=institution).order_by('id').values_list(
+        'id', 'created', 'survey_template_id', 'flagged',
+        'student_id', 'student__email', 'student__name',
+        'anonymous_student_id', 'anonymous_student__name',
+    )
+
+    last_id = 0
+    while True:
+        batch = list(responses.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return
+        last_id = batch[-1][0]
+
+        answers = {}
+        question_responses = QuestionResponse.objects.filter(
+            survey_response_id__in=[row[0] for row in batch]
+        ).values_list('survey_response_id', 'question_id', 'likert_value', 'text_response')
+        for survey_response_id, question_id, likert_value, text_response in question_responses:
+            answers.setdefault(survey_response_id, {})[_question_column(question_id)] = (
+                likert_value if likert_value is not None else text_response
+            )
+
+        rows = []
+        for response_id, created, template_id, flagged, student_id, student_email, student_name, anonymous_email, anonymous_name in batch:
+            row = {
+                'response_id': response_id,
+                'created': created,
+                'survey_template_id': template_id,
+                'flagged': flagged,
+                'respondent_type': 'registered' if student_id else 'anonymous',
+                'student_id': student_id,
+                'email': student_email if student_id else anonymous_email,
+                'name': student_name if student_id else anonymous_name,
+            }
+            row.update(empty_answers)
+            row.update(answers.get(response_id, {}))
+            rows.append(row)
+        yield rows
+
+
+# First characters that make a spreadsheet read a cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _escape_formula(value):
+    """
+    _escape_formula prefixes a text cell that a spreadsheet would run as a
+    formula (e.g. a student answer starting with =) with a quote, so it is
+    shown as text
+    """
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class _Echo:
+    """_Echo is a file-like object whose write() returns the written value, letting csv.writer produce lines lazily"""
+    def write(self, value):
+        return value
+
+
+def stream_csv(institution):
+    """
+    stream_csv yields the CSV export of an institution's survey responses,
+    starting with a header naming each question column, then the lines of
+    one batch of responses at a time. Text cells that a spreadsheet would
+    run as formulas are escaped.
+    """
+    questions = get_export_questions(institution)
+    writer = csv.writer(_Echo())
+    yield writer.writerow(RESPONSE_COLUMNS + [_escape_formula(f"{question_id}: {text}") for question_id, text in questions])
+    columns = RESPONSE_COLUMNS + [_question_column(question_id) for question_id, _ in questions]
+    for rows in iter_response_batches(institution, questions):
+        yield "".join(writer.writerow([_escape_formula(row[column]) for column in columns]) for row in rows)
+
+
+def stream_ndjson(institution):
+    """
+    stream_ndjson yields the newline-delimited JSON export of an institution's
+    survey responses, one JSON object per response, one batch of responses
+    at a time
+    """
+    questions = get_export_questions(institution)
+    for rows in iter_response_batches(institution, questions):
+        yield "".join(json.dumps(row, cls=DjangoJSONEncoder) + "\n" for row in rows)
+
+
+async def aiter_export(stream, institution):
+    """
+    aiter_export yields the chunks of an export stream (stream_csv or
+    stream_ndjson) for a response served under ASGI, where Django would
+    otherwise read a sync iterator whole before sending it. Each chunk (one
+    batch of responses) is generated in the request's worker thread through
+    sync_to_async.
+    """
+    chunks = stream(institution)
+    while True:
+        chunk = await sync_to_async(next)(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
@@ -0,0 +1,80 @@
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyState:
+    IN_PROGRESS = 'in_progress'
+    DONE = 'done'
+
+
+def _cache_key(idempotency_key):
+    return f"survey_idempotency_{idempotency_key}"
+
+
+def get_idempotency_key(request, data, scope):
+    """
+    get_idempotency_key reads the client's idempotency key from the
+    Idempotency-Key header (or the idempotency_key field of the body) and
+    returns its digest combined with scope, or None if the request has no key.
+    Scoping the key to the respondent keeps one client from replaying the
+    result of another's submission.
+
+    data: the submitted survey
+    scope: string identifying the respondent and survey template of the submission
+
+    Raises ValueError for keys longer than MAX_KEY_LENGTH.
+    """
+    client_key = request.headers.get(IDEMPOTENCY_HEADER) or data.get('idempotency_key')
+    if not client_key:
+        return None
+    client_key = str(client_key)
+    if len(client_key) > MAX_KEY_LENGTH:
+        raise ValueError(f"Idempotency key must be at most {MAX_KEY_LENGTH} characters")
+    return hashlib.sha256(f"{scope}:{client_key}".encode()).hexdigest()
+
+
+def claim_idempotency_key(idempotency_key):
+    """
+    claim_idempotency_key claims an idempotency key for the current request.
+
+    Returns None if the request claimed the key and must process the
+    submission, or the response to send instead: the stored response of the
+    original request, or 409 while that request is still being processed.
+    """
+    if cache.add(_cache_key(idempotency_key), {"state": IdempotencyState.IN_PROGRESS}, timeout=settings.SURVEY_IDEMPOTENCY_LOCK_TIMEOUT):
+        return None
+
+    entry = cache.get(_cache_key(idempotency_key))
+    if entry and entry["state"] == IdempotencyState.DONE:
+        return HttpResponse(entry["body"], status=entry["status"], content_type="application/json")
+    return JsonResponse({
+        "success": False,
+        "message": "This submission is still being processed, please try again shortly.",
+    }, status=409)
+
+
+def store_idempotent_response(idempotency_key, response):
+    """
+    store_idempotent_response saves the response of a successful submission,
+    to be replayed to retries with the same key once the transaction commits,
+    and releases the key of a failed one so that the client can retry it
+    """
+    if response.status_code < 300 and json.loads(response.content).get("success"):
+        entry = {
+            "state": IdempotencyState.DONE,
+            "status": response.status_code,
+            "body": response.content.decode(),
+        }
+        # Only replay the response once the submission is committed
+        transaction.on_commit(
+            lambda: cache.set(_cache_key(idempotency_key), entry, timeout=settings.SURVEY_IDEMPOTENCY_TIMEOUT)
+        )
+    else:
+        cache.delete(_cache_key(idempotency_key))
@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+from .models import User, AnonymousStudent, SurveyTemplate, SurveyQuestion
+from .submissions import build_question_responses, persist_submission
+
+logger = logging.getLogger("surveys")
+
+# Set while a drain task is queued, so a burst of submissions queues one drain
+DRAIN_SCHEDULED_KEY = "survey_ingestion_drain_scheduled"
+
+
+class SubmissionStatus:
+    QUEUED = 'queued'
+    PERSISTED = 'persisted'
+    FAILED = 'failed'
+
+
+def _status_key(submission_id):
+    return f"survey_submission_status_{submission_id}"
+
+
+def _set_status(submission_id, status, **details):
+    cache.set(
+        _status_key(submission_id),
+        {"status": status, **details},
+        timeout=settings.SURVEY_INGESTION_STATUS_TIMEOUT,
+    )
+
+
+def get_submission_status(submission_id):
+    """
+    get_submission_status returns the status of a queued submission (queued,
+    persisted with the id of its survey response, or failed), or None if the
+    submission is unknown or its status has expired
+    """
+    return cache.get(_status_key(submission_id))
+
+
+def _get_client():
+    return get_redis_connection("default")
+
+
+def _ensure_group(client):
+    """_ensure_group creates the stream and its consumer group if they do not exist yet"""
+    try:
+        client.xgroup_create(settings.SURVEY_INGESTION_STREAM, settings.SURVEY_INGESTION_GROUP, id='0', mkstream=True)
+    except ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def enqueue_submission(survey_template, questions, answers, student=None, anonymous_email=None, anonymous_name=None, idempotency_key=None):
+    """
+    enqueue_submission validates a survey submission and appends it to the
+    ingestion stream instead of writing it to the database. A drain task
+    persists it shortly after, in a batch with the other queued submissions.
+
+    survey_template: SurveyTemplate the submission answers
+    questions: SurveyQuestion objects of the template
+    answers: mapping of question id (as a string) to the submitted answer
+    student: registered student submitting the survey
+    anonymous_email, anonymous_name: anonymous student submitting the survey (when student is None)
+    idempotency_key: digest of the submission's idempotency key, if it has one
+
+    Returns the submission id to poll the status of. Raises ValueError for
+    invalid answers and redis errors if the stream cannot be written to.
+    """
+    # Reject invalid answers now, while the client can still be told
+    build_question_responses(questions, answers)
+
+    submission_id = str(uuid.uuid4())
+    payload = {
+        "submission_id": submission_id,
+        "survey_template_id": survey_template.id,
+        "answers": {str(question.id): answers.get(str(question.id)) for question in questions},
+        "student_id": student.id if student is not None else None,
+        "anonymous_email": anonymous_email,
+        "anonymous_name": anonymous_name,
+        "idempotency_key": idempotency_key,
+    }
+    _set_status(submission_id, SubmissionStatus.QUEUED)
+    _get_client().xadd(settings.SURVEY_INGESTION_STREAM, {"payload": json.dumps(payload)})
+
+    if cache.add(DRAIN_SCHEDULED_KEY, 1, timeout=settings.SURVEY_INGESTION_DRAIN_SCHEDULE_TIMEOUT):
+        drain_submission_stream.apply_async(countdown=settings.SURVEY_INGESTION_DRAIN_DELAY)
+    return submission_id
+
+
+def _persist_entries(entries):
+    """
+    _persist_entries writes a batch of stream entries to the database in one
+    transaction, each submission in its own savepoint so an invalid one does
+    not fail the others. Returns the status of each submission.
+    """
+    payloads = [json.loads(fields[b"payload"]) for _, fields in entries]
+
+    template_ids = {payload["survey_template_id"] for payload in payloads}
+    templates = SurveyTemplate.objects.select_related('institution').in_bulk(template_ids)
+    questions = {template_id: [] for template_id in template_ids}
+    for question in SurveyQuestion.objects.filter(survey_template_id__in=template_ids).order_by('order'):
+        questions[question.survey_template_id].append(question)
+    students = User.objects.in_bulk({payload["student_id"] for payload in payloads if payload["student_id"]})
+
+    statuses = {}
+    with transaction.atomic():
+        for payload in payloads:
+            submission_id = payload["submission_id"]
+            try:
+                with transaction.atomic():
+                    survey_template = templates[payload["survey_template_id"]]
+                    student = anonymous_student = None
+                    if payload["student_id"]:
+                        student = students[payload["student_id"]]
+                    else:
+                        anonymous_student, _ = AnonymousStudent.objects.get_or_create(
+                            email=payload["anonymous_email"],
+                            defaults={'name': payload["anonymous_name"], 'survey_template': survey_template},
+                        )
+                    survey_response = persist_submission(
+                        survey_template,
+                        questions[survey_template.id],
+                        payload["answers"],
+                        student=student,
+                        anonymous_student=anonymous_student,
+                        idempotency_key=payload.get("idempotency_key"),
+                    )
+                statuses[submission_id] = (SubmissionStatus.PERSISTED, {"response_id": survey_response.id})
+            except Exception as e:
+                logger.error(f"Error persisting queued submission {submission_id}: {str(e)}")
+                statuses[submission_id] = (SubmissionStatus.FAILED, {"message": "There was an error with your submission."})
+    return statuses
+
+
+def _read_batch(client, consumer):
+    """
+    _read_batch returns the next batch of stream entries for this consumer:
+    first entries another consumer read but never acknowledged (it died
+    mid-batch), then new entries
+    """
+    batch_size = settings.SURVEY_INGESTION_BATCH_SIZE
+    _, entries, *_ = client.xautoclaim(
+        settings.SURVEY_INGESTION_STREAM,
+        settings.SURVEY_INGESTION_GROUP,
+        consumer,
+        min_idle_time=settings.SURVEY_INGESTION_CLAIM_IDLE_MS,
+        start_id='0-0',
+        count=batch_size,
+    )
+    entries = [entry for entry in entries if entry[1]]
+    if entries:
+        return entries
+
+    streams = client.xreadgroup(
+        settings.SURVEY_INGESTION_GROUP,
+        consumer,
+        {settings.SURVEY_INGESTION_STREAM: '>'},
+        count=batch_size,
+    )
+    return streams[0][1] if streams else []
+
+
+@shared_task
+def drain_submission_stream():
+    """
+    drain_submission_stream persists the submissions queued in the ingestion
+    stream, one batched transaction at a time, and queues their text analysis.
+    Runs until the stream is empty, or re-queues itself after
+    SURVEY_INGESTION_DRAIN_SECONDS so other tasks get a worker.
+    """
+    # Submissions arriving from now on queue another drain
+    cache.delete(DRAIN_SCHEDULED_KEY)
+
+    client = _get_client()
+    _ensure_group(client)
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+    deadline = time.monotonic() + settings.SURVEY_INGESTION_DRAIN_SECONDS
+
+    persisted = 0
+    while True:
+        entries = _read_batch(client, consumer)
+        if not entries:
+            break
+
+        statuses = _persist_entries(entries)
+        entry_ids = [entry_id for entry_id, _ in entries]
+        client.xack(settings.SURVEY_INGESTION_STREAM, settings.SURVEY_INGESTION_GROUP, *entry_ids)
+        client.xdel(settings.SURVEY_INGESTION_STREAM, *entry_ids)
+        for submission_id, (status, details) in statuses.items():
+            _set_status(submission_id, status, **details)
+        persisted += len(entries)
+
+        if time.monotonic() >= deadline:
+            if cache.add(DRAIN_SCHEDULED_KEY, 1, timeout=settings.SURVEY_INGESTION_DRAIN_SCHEDULE_TIMEOUT):
+                drain_submission_stream.delay()
+            break
+
+    return f"Persisted {persisted} queued submissions"
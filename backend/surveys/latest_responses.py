@@ -0,0 +1,83 @@
+from django.db import transaction
+from .models import SurveyResponse, LatestResponse
+
+
+def record_latest_response(survey_response):
+    """
+    record_latest_response points the respondent's LatestResponse row at a
+    newly submitted survey response
+
+    survey_response: the saved SurveyResponse
+    """
+    if survey_response.student_id:
+        respondent = {'student_id': survey_response.student_id}
+    elif survey_response.anonymous_student_id:
+        respondent = {'anonymous_student_id': survey_response.anonymous_student_id}
+    else:
+        return
+
+    LatestResponse.objects.update_or_create(
+        **respondent,
+        defaults={
+            'institution_id': survey_response.institution_id,
+            'survey_response': survey_response,
+            'created': survey_response.created,
+            'flagged': survey_response.flagged,
+            'screening_severity': survey_response.screening_severity,
+        },
+    )
+
+
+def record_latest_flag(response_id):
+    """
+    record_latest_flag marks a respondent's latest response as flagged if the
+    response flagged after submission is still their latest one
+
+    response_id: id of the flagged SurveyResponse
+    """
+    LatestResponse.objects.filter(survey_response_id=response_id).update(flagged=True)
+
+
+def record_latest_unflag(response_id):
+    """
+    record_latest_unflag clears the flag of a respondent's latest response if
+    the response whose flag was cleared is still their latest one
+
+    response_id: id of the SurveyResponse whose flag was cleared
+    """
+    LatestResponse.objects.filter(survey_response_id=response_id).update(flagged=False)
+
+
+@transaction.atomic
+def rebuild_latest_responses(institution=None):
+    """
+    rebuild_latest_responses recomputes the LatestResponse rows from the raw
+    SurveyResponse table, streaming responses in chronological order
+
+    institution: institution whose respondents are rebuilt (all when None)
+    """
+    responses = SurveyResponse.objects.all()
+    latest_responses = LatestResponse.objects.all()
+    if institution is not None:
+        responses = responses.filter(institution=institution)
+        latest_responses = latest_responses.filter(institution=institution)
+    latest_responses.delete()
+
+    latest = {}
+    rows = responses.order_by('created', 'id').values_list(
+        'id', 'created', 'flagged', 'screening_severity', 'student_id', 'anonymous_student_id', 'institution_id',
+    )
+    for response_id, created, flagged, screening_severity, student_id, anonymous_student_id, institution_id in rows.iterator(chunk_size=2000):
+        if student_id is None and anonymous_student_id is None:
+            continue
+        latest[(student_id, anonymous_student_id)] = LatestResponse(
+            student_id=student_id,
+            anonymous_student_id=anonymous_student_id,
+            institution_id=institution_id,
+            survey_response_id=response_id,
+            created=created,
+            flagged=flagged,
+            screening_severity=screening_severity,
+        )
+
+    LatestResponse.objects.bulk_create(latest.values(), batch_size=1000)
@@ -1,22 +1,19 @@
-import openai
+import asyncio
+import hashlib
 import json
-from django.conf import settings
+import logging
+import time
+from .circuit_breaker import record_llm_verdicts
+from .screening_backends import get_backend, record_backend_stats
+from .screening_client import create_completion, run_screening, take_stats
+from .verdict_cache import get_cached_verdicts, cache_verdicts
 
-client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-def analyze_mental_health_responses(text, question_text=""):
-    """Analyze text responses for mental health concerns with balanced sensitivity"""
-    if not text:
-        return {"flag": False, "severity": "none", "reason": "No text provided"}
-    
-    try:
-        prompt = f"""Analyze this student mental health survey response for concerning content that may indicate risk to self or others.
+logger = logging.getLogger("surveys")
 
-Question: {question_text}
-Response: "{text}"
-
-Flag as concerning if the response contains:
+SYSTEM_PROMPT = "You are a mental health screening assistant. Your primary goal is to identify concerning content that could indicate risk. When in doubt, err on the side of caution and flag for review. It's better to over-detect than miss genuine distress. Respond with JSON only."
 
-**HIGH SEVERITY - Immediate Risk:**
+# What the model is asked to flag, shared by the single answer and batch prompts
+SCREENING_CRITERIA = """**HIGH SEVERITY - Immediate Risk:**
 - Direct statements about wanting to die, suicide, or ending life
 - Specific mentions of self-harm methods or weapons in harmful context
 - Active plans or preparation for self-harm
@@ -53,29 +50,277 @@ Flag as concerning if the response contains:
 - Lean toward flagging when uncertain - missing genuine distress is worse than over-flagging
 - Pay attention to emotional intensity, not just specific words
 - Consider cumulative effect of multiple concerning elements
-- Look for genuine distress signals even in casual language
+- Look for genuine distress signals even in casual language"""
+
+ANSWER_PROMPT = """Analyze this student mental health survey response for concerning content that may indicate risk to self or others.
+
+Question: {question_text}
+Response: "{text}"
+
+Flag as concerning if the response contains:
+
+{criteria}
 
 Return JSON only: {{"flag": true/false, "severity": "high/medium/low/none", "reason": "specific concerning elements identified"}}"""
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+
+BATCH_PROMPT = """Analyze each of these answers of one student to a mental health survey for concerning content that may indicate risk to self or others. Judge every answer on its own content, using the other answers only as context.
+
+Answers:
+{answers_json}
+
+Flag an answer as concerning if it contains:
+
+{criteria}
+
+Return JSON only, with one result for every answer id: {{"results": [{{"id": <answer id>, "flag": true/false, "severity": "high/medium/low/none", "reason": "specific concerning elements identified"}}]}}"""
+
+# Identifies the prompts that produced a verdict. Cached verdicts of any
+# other prompts or model are ignored (see _screening_version), so editing a
+# prompt or switching backends invalidates them.
+PROMPT_VERSION = hashlib.sha256(
+    "\0".join((SYSTEM_PROMPT, SCREENING_CRITERIA, ANSWER_PROMPT, BATCH_PROMPT)).encode()
+).hexdigest()[:12]
+
+# Model output tokens allowed per screened answer
+MAX_TOKENS_PER_ANSWER = 150
+
+
+class ScreeningError(Exception):
+    """ScreeningError is raised when the model's reply cannot be used as a verdict"""
+
+
+def _parse_verdict(verdict):
+    """_parse_verdict normalizes a verdict returned by the model, or raises ScreeningError if it is malformed"""
+    if not isinstance(verdict, dict):
+        raise ScreeningError(f"Verdict is not an object: {verdict!r}")
+    severity = str(verdict.get("severity", "")).lower()
+    if not isinstance(verdict.get("flag"), bool) or severity not in ("high", "medium", "low", "none"):
+        raise ScreeningError(f"Malformed verdict: {verdict!r}")
+    return {"flag": verdict["flag"], "severity": severity, "reason": str(verdict.get("reason", ""))}
+
+
+def _screening_version(backend):
+    """_screening_version identifies the model and prompts of a backend's verdicts in the verdict cache"""
+    return f"{backend.model}:{PROMPT_VERSION}"
+
+
+def _failed_verdict(error):
+    return {"flag": False, "severity": "none", "reason": f"Analysis failed: {str(error)}", "error": True}
+
+
+def _llm_verdict(verdict, backend, started):
+    """_llm_verdict adds what produced it to a verdict returned by the model"""
+    return {
+        **verdict,
+        "source": "llm",
+        "model": backend.model,
+        "prompt_version": PROMPT_VERSION,
+        "latency_ms": round((time.monotonic() - started) * 1000),
+    }
+
+
+def _cached_verdict(verdict):
+    return {**verdict, "source": "cache", "latency_ms": None}
+
+
+def _cacheable(verdict):
+    """_cacheable returns the part of an LLM verdict that is cached for identical answers"""
+    return {key: verdict[key] for key in ("flag", "severity", "reason", "model", "prompt_version")}
+
+
+async def _screen_answer(backend, text, question_text):
+    """
+    _screen_answer asks the model for the verdict of a single answer and
+    returns it, with whether it is a genuine verdict (rather than a failure)
+    that can be cached
+    """
+    started = time.monotonic()
+    try:
+        response = await create_completion(
+            backend,
             messages=[
-                {
-                    "role": "system", 
-                    "content": "You are a mental health screening assistant. Your primary goal is to identify concerning content that could indicate risk. When in doubt, err on the side of caution and flag for review. It's better to over-detect than miss genuine distress. Respond with JSON only."
-                },
-                {"role": "user", "content": prompt}
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": ANSWER_PROMPT.format(question_text=question_text, text=text, criteria=SCREENING_CRITERIA)}
             ],
             temperature=0.1,  # Lower temperature for more consistent detection
-            max_tokens=150
+            max_tokens=MAX_TOKENS_PER_ANSWER
         )
-        
-        result = json.loads(response.choices[0].message.content)
-        return result
-        
-    except json.JSONDecodeError as e:
-        print(f"JSON parsing error: {e}")
-        return {"flag": False, "severity": "none", "reason": "Unable to parse AI response"}
+        return _llm_verdict(_parse_verdict(json.loads(response.choices[0].message.content)), backend, started), True
+    except (json.JSONDecodeError, ScreeningError) as e:
+        logger.warning(f"Malformed screening reply: {str(e)}")
+        return {"flag": False, "severity": "none", "reason": "Unable to parse AI response", "error": True}, False
+    except Exception as e:
+        logger.warning(f"Screening request failed ({type(e).__name__}): {str(e)}")
+        return _failed_verdict(e), False
+
+
+async def _screen_batch(backend, numbered):
+    """
+    _screen_batch asks the model for the verdicts of several answers at once
+    and returns those of the answers it returned a valid verdict for, keyed
+    by their number
+    """
+    # The answers are sent as JSON so their content cannot break out of the list
+    answers_json = json.dumps(
+        [{"id": number, "question": question_text, "response": text} for number, (_, question_text, text) in numbered.items()],
+        ensure_ascii=False,
+        indent=1,
+    )
+    started = time.monotonic()
+    response = await create_completion(
+        backend,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": BATCH_PROMPT.format(answers_json=answers_json, criteria=SCREENING_CRITERIA)}
+        ],
+        temperature=0.1,
+        max_tokens=MAX_TOKENS_PER_ANSWER * len(numbered),
+        response_format={"type": "json_object"},
+    )
+    results = json.loads(response.choices[0].message.content)["results"]
+
+    verdicts = {}
+    for result in results:
+        try:
+            number = result.get("id")
+            if number in numbered:
+                verdicts[number] = _llm_verdict(_parse_verdict(result), backend, started)
+        except (AttributeError, ScreeningError):
+            continue
+    return verdicts
+
+
+async def _screen_answer_set(backend, answers):
+    """
+    _screen_answer_set screens the answers of one survey response with a
+    single model request, then screens the answers that request returned no
+    usable verdict for on their own, concurrently
+
+    answers: list of (key, question_text, text) tuples
+
+    Returns a dict of key to (verdict, cacheable) tuples.
+    """
+    if len(answers) == 1:
+        key, question_text, text = answers[0]
+        return {key: await _screen_answer(backend, text, question_text)}
+
+    numbered = dict(enumerate(answers, start=1))
+    try:
+        screened = await _screen_batch(backend, numbered)
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        logger.warning(f"Malformed batch screening reply, screening its answers one by one: {str(e)}")
+        screened = {}
     except Exception as e:
-        print(f"Mental health analysis error: {e}")
-        return {"flag": False, "severity": "none", "reason": f"Analysis failed: {str(e)}"}
+        logger.warning(f"Batch screening request failed ({type(e).__name__}): {str(e)}")
+        return {key: (_failed_verdict(e), False) for key, _, _ in answers}
+
+    results = {numbered[number][0]: (verdict, True) for number, verdict in screened.items()}
+    missing = [answer for number, answer in numbered.items() if number not in screened]
+    retried = await asyncio.gather(*(_screen_answer(backend, text, question_text) for _, question_text, text in missing))
+    results.update({key: result for (key, _, _), result in zip(missing, retried)})
+    return results
+
+
+async def _screen_answer_sets(backend, answer_sets):
+    return await asyncio.gather(*(_screen_answer_set(backend, answers) for answers in answer_sets))
+
+
+def _screen_with_rules(backend, texts):
+    """_screen_with_rules screens answers with a backend that needs no model and counts them"""
+    started = time.monotonic()
+    verdicts = [backend.screen(text) for text in texts]
+    record_backend_stats(backend.name, answers=len(texts), latency_ms=round((time.monotonic() - started) * 1000))
+    return verdicts
+
+
+def _record_screening(backend, verdicts):
+    """
+    _record_screening reports the verdicts of a backend's model to the
+    circuit breaker and counts them, with the requests the process sent
+    """
+    record_llm_verdicts(verdicts)
+    stats = take_stats()
+    record_backend_stats(backend.name, answers=len(verdicts), **stats.pop(backend.name, {}))
+    # Requests other threads of the process sent to other backends
+    for name, counts in stats.items():
+        record_backend_stats(name, **counts)
+
+
+def analyze_mental_health_responses(text, question_text=""):
+    """Analyze text responses for mental health concerns with balanced sensitivity"""
+    if not text:
+        return {"flag": False, "severity": "none", "reason": "No text provided", "source": "rules"}
+
+    backend = get_backend()
+    if not backend.uses_llm:
+        return _screen_with_rules(backend, [text])[0]
+
+    cached = get_cached_verdicts([(text, question_text)], _screening_version(backend))
+    if cached[0] is not None:
+        return _cached_verdict(cached[0])
+
+    verdict, cacheable = run_screening(_screen_answer(backend, text, question_text))
+    _record_screening(backend, [verdict])
+    if cacheable:
+        cache_verdicts([(text, question_text, _cacheable(verdict))], _screening_version(backend))
+    return verdict
+
+
+def analyze_mental_health_response_batches(answer_sets):
+    """
+    analyze_mental_health_response_batches screens the text answers of
+    several survey responses (or several parts of one) and returns a verdict
+    for every answer. Each set of answers is sent to the model in a single
+    request, and the requests of all sets are in flight at the same time, up
+    to SCREENING_LLM_CONCURRENCY. Answers with a cached verdict are not sent
+    to the model, and none are with a backend that needs no model (see
+    SCREENING_BACKEND).
+
+    answer_sets: list of lists of (key, question_text, text) tuples; key
+    identifies the answer in the result (e.g. the question id)
+
+    Returns, for each answer set, a dict of key to verdict ({"flag",
+    "severity", "reason"}, as returned by analyze_mental_health_responses).
+    Answers the model leaves out of a reply or answers malformed are screened
+    again on their own.
+    """
+    results = [{} for _ in answer_sets]
+    with_text = []
+    for index, answers in enumerate(answer_sets):
+        for key, question_text, text in answers:
+            if not text:
+                results[index][key] = {"flag": False, "severity": "none", "reason": "No text provided", "source": "rules"}
+            else:
+                with_text.append((index, key, question_text, text))
+
+    backend = get_backend()
+    if not backend.uses_llm:
+        verdicts = _screen_with_rules(backend, [text for _, _, _, text in with_text])
+        for (index, key, _, _), verdict in zip(with_text, verdicts):
+            results[index][key] = verdict
+        return results
+
+    version = _screening_version(backend)
+    cached = get_cached_verdicts([(text, question_text) for _, _, question_text, text in with_text], version)
+    pending = [[] for _ in answer_sets]
+    for (index, key, question_text, text), verdict in zip(with_text, cached):
+        if verdict is not None:
+            results[index][key] = _cached_verdict(verdict)
+        else:
+            pending[index].append((key, question_text, text))
+
+    to_screen = [(index, answers) for index, answers in enumerate(pending) if answers]
+    if not to_screen:
+        return results
+    screened_sets = run_screening(_screen_answer_sets(backend, [answers for _, answers in to_screen]))
+    _record_screening(backend, [verdict for screened in screened_sets for verdict, _ in screened.values()])
+
+    new_verdicts = []
+    for (index, answers), screened in zip(to_screen, screened_sets):
+        for key, question_text, text in answers:
+            verdict, cacheable = screened[key]
+            results[index][key] = verdict
+            if cacheable:
+                new_verdicts.append((text, question_text, _cacheable(verdict)))
+    cache_verdicts(new_verdicts, version)
+    return results
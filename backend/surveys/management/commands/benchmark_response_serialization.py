@@ -0,0 +1,95 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from surveys.models import Institution, SurveyTemplate, SurveyQuestion, SurveyResponse, QuestionResponse, QuestionType
+from surveys.serializers import SurveyResponseSerializer, SURVEY_RESPONSE_FIELDS, serialize_survey_responses
+
+
+class QueryCounter:
+    """QueryCounter is a database execute wrapper counting the queries it sees"""
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare SurveyResponseSerializer with the bulk serialize_survey_responses path. "
+        "With --seed, synthetic responses are created for the run and rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help="Number of synthetic responses to create for the run")
+        parser.add_argument('--questions', type=int, default=10, help="Questions per synthetic response")
+        parser.add_argument('--limit', type=int, default=10000, help="Maximum number of responses to serialize")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['seed']:
+                self._seed(options['seed'], options['questions'])
+
+            survey_responses = SurveyResponse.objects.order_by('-created', '-id')[:options['limit']]
+            if not survey_responses.exists():
+                raise CommandError("No survey responses to serialize, use --seed to create some")
+
+            serializer_queries = QueryCounter()
+            with connection.execute_wrapper(serializer_queries):
+                start = time.perf_counter()
+                expected = SurveyResponseSerializer(survey_responses, many=True).data
+                serializer_seconds = time.perf_counter() - start
+
+            bulk_queries = QueryCounter()
+            with connection.execute_wrapper(bulk_queries):
+                start = time.perf_counter()
+                actual = serialize_survey_responses(survey_responses.values(*SURVEY_RESPONSE_FIELDS))
+                bulk_seconds = time.perf_counter() - start
+
+            # Roll back the synthetic data
+            transaction.set_rollback(True)
+
+        if list(expected) != actual:
+            raise CommandError("serialize_survey_responses output differs from SurveyResponseSerializer")
+
+        self.stdout.write(f"Serialized {len(actual)} responses")
+        self.stdout.write(f"SurveyResponseSerializer:   {serializer_seconds:8.3f}s  {serializer_queries.count} queries")
+        self.stdout.write(f"serialize_survey_responses: {bulk_seconds:8.3f}s  {bulk_queries.count} queries")
+        self.stdout.write(self.style.SUCCESS(f"Speedup: {serializer_seconds / bulk_seconds:.1f}x"))
+
+    def _seed(self, num_responses, num_questions):
+        institution = Institution.objects.create(
+            institution_name="Benchmark University",
+            institution_regex_pattern=r".*@benchmark\.edu",
+        )
+        template = SurveyTemplate.objects.create(institution=institution)
+        questions = [
+            SurveyQuestion.objects.create(
+                survey_template=template,
+                question_text=f"Benchmark question {order}",
+                question_type=QuestionType.TEXT if order % 5 == 0 else QuestionType.LIKERT,
+                order=order,
+            )
+            for order in range(1, num_questions + 1)
+        ]
+        responses = SurveyResponse.objects.bulk_create(
+            [SurveyResponse(survey_template=template, institution=institution) for _ in range(num_responses)],
+            batch_size=1000,
+        )
+        # MySQL does not return the ids of bulk-created rows
+        response_ids = SurveyResponse.objects.filter(survey_template=template).values_list('id', flat=True)
+        QuestionResponse.objects.bulk_create(
+            [
+                QuestionResponse(
+                    survey_response_id=response_id,
+                    question=question,
+                    likert_value=None if question.question_type == QuestionType.TEXT else (response_id + question.order) % 5 + 1,
+                    text_response="Benchmark answer" if question.question_type == QuestionType.TEXT else None,
+                )
+                for response_id in response_ids
+                for question in questions
+            ],
+            batch_size=2000,
+        )
+        self.stdout.write(f"Seeded {len(responses)} responses with {num_questions} questions each")
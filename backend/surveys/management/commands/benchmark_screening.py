@@ -0,0 +1,232 @@
+import json
+import random
+import threading
+import time
+import uuid
+from pathlib import Path
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from surveys.management.commands.load_test_survey_endpoints import percentile
+from surveys.models import Institution, SurveyTemplate, SurveyQuestion, SurveyResponse, QuestionResponse, QuestionType
+from surveys.screening_backends import ChatCompletionsBackend, get_backend, get_backend_stats, override_backend
+from surveys.screening_stub import StubServer
+from surveys.tasks import CONFIRMATION_SCHEDULED_KEY, FLAG_SEVERITIES, _analyze_survey_responses, analyze_survey_responses_async
+
+DEFAULT_CORPUS = Path(__file__).resolve().parents[2] / 'benchmark_data' / 'screening_corpus.json'
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a labelled corpus of synthetic answers through the screening task "
+        "(analyze_survey_responses_async) and report its throughput, latency, LLM calls per response "
+        "and the precision and recall of its flags. With the fake backend, the LLM is a fake one "
+        "(see screening_stub_server) with injected latency and errors. The synthetic responses are "
+        "rolled back afterwards, but the screening still writes to the cache (verdict cache, counts): "
+        "run it against a development cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--responses', type=int, default=200, help="Number of synthetic responses to screen")
+        parser.add_argument('--answers', type=int, default=3, help="Text answers per response")
+        parser.add_argument(
+            '--batch-size', type=int, default=1,
+            help="Responses screened together: 1 runs the task once per response, more replays the micro-batch drain",
+        )
+        parser.add_argument(
+            '--backend', choices=['fake', 'rules', 'openai'], default='fake',
+            help="Screening backend; openai sends the corpus to the OpenAI API and is billed",
+        )
+        parser.add_argument('--latency', type=float, default=200, help="Milliseconds each fake LLM request takes")
+        parser.add_argument('--jitter', type=float, default=100, help="Up to this many more milliseconds a fake LLM request takes")
+        parser.add_argument('--error-every', type=int, default=0, help="Fail every Nth fake LLM request with a server error")
+        parser.add_argument('--rate-limit-every', type=int, default=0, help="Rate limit every Nth fake LLM request")
+        parser.add_argument('--corpus', type=Path, default=DEFAULT_CORPUS, help="Labelled corpus to draw the answers from")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed drawing the answers")
+        parser.add_argument('--warm-cache', action='store_true', help="Reuse the fake LLM verdicts cached by earlier runs")
+        parser.add_argument('--breaker', action='store_true', help="Let the circuit breaker open; its state is shared with the workers")
+
+    def handle(self, *args, **options):
+        for option in ('responses', 'answers', 'batch_size'):
+            if options[option] < 1:
+                raise CommandError(f"--{option.replace('_', '-')} must be at least 1")
+        corpus = self._load_corpus(options['corpus'])
+        server = None
+        if options['backend'] == 'fake':
+            server = StubServer(
+                ('127.0.0.1', 0),
+                latency=options['latency'],
+                jitter=options['jitter'],
+                error_every=options['error_every'],
+                rate_limit_every=options['rate_limit_every'],
+            )
+            threading.Thread(target=server.serve_forever, name="screening-stub", daemon=True).start()
+            # Unless --warm-cache, a model name of its own keeps the verdicts of earlier runs out of the cache
+            model = 'fake-screening-model' if options['warm_cache'] else f"fake-screening-model-{uuid.uuid4().hex[:8]}"
+            # Priced like the openai backend, so the cost is that of screening the corpus with the real model
+            backend = ChatCompletionsBackend(
+                'fake', model, f"http://127.0.0.1:{server.server_address[1]}/v1", 'fake',
+                input_cost=settings.SCREENING_LLM_INPUT_COST,
+                output_cost=settings.SCREENING_LLM_OUTPUT_COST,
+            )
+        else:
+            backend = get_backend(options['backend'])
+
+        # The provisional verdicts of the rolled back responses need no confirmation
+        confirmation_held = cache.add(CONFIRMATION_SCHEDULED_KEY, 1, timeout=None)
+        stats_before = get_backend_stats().get(backend.name, {})
+        try:
+            with override_backend(backend), override_settings(SCREENING_BREAKER_ENABLED=options['breaker']):
+                with transaction.atomic():
+                    pending, labels = self._seed(corpus, options)
+                    elapsed, latencies, results = self._replay(pending, options['batch_size'])
+                    # Roll back the synthetic data
+                    transaction.set_rollback(True)
+        finally:
+            if confirmation_held:
+                cache.delete(CONFIRMATION_SCHEDULED_KEY)
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+        stats_after = get_backend_stats().get(backend.name, {})
+        requests = {stat: stats_after.get(stat, 0) - stats_before.get(stat, 0) for stat in stats_after}
+
+        self._report(options, backend, pending, labels, elapsed, latencies, results, requests, server)
+
+    def _load_corpus(self, path):
+        try:
+            with open(path) as f:
+                corpus = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read the corpus {path}: {str(e)}")
+        by_severity = {}
+        for answer in corpus['answers']:
+            by_severity.setdefault(answer['severity'], []).append(answer['text'])
+        weights = {severity: weight for severity, weight in corpus['severity_weights'].items() if severity in by_severity}
+        if not weights:
+            raise CommandError(f"The corpus {path} has no answers of the severities it weights")
+        return {"questions": corpus['questions'], "by_severity": by_severity, "weights": weights}
+
+    def _seed(self, corpus, options):
+        """
+        _seed creates the synthetic responses, with answers drawn from the
+        corpus by severity, and returns the (response_id, question_ids) to
+        screen with the label of each answer, keyed by (response_id, question_id)
+        """
+        rng = random.Random(options['seed'])
+        institution = Institution.objects.create(
+            institution_name="Benchmark University",
+            institution_regex_pattern=r".*@benchmark\.edu",
+        )
+        template = SurveyTemplate.objects.create(institution=institution)
+        questions = [
+            SurveyQuestion.objects.create(
+                survey_template=template,
+                question_text=corpus['questions'][order % len(corpus['questions'])],
+                question_type=QuestionType.TEXT,
+                order=order,
+            )
+            for order in range(options['answers'])
+        ]
+        SurveyResponse.objects.bulk_create(
+            [SurveyResponse(survey_template=template, institution=institution) for _ in range(options['responses'])],
+            batch_size=1000,
+        )
+        # MySQL does not return the ids of bulk-created rows
+        response_ids = list(SurveyResponse.objects.filter(survey_template=template).order_by('id').values_list('id', flat=True))
+
+        severities = list(corpus['weights'])
+        weights = list(corpus['weights'].values())
+        labels = {}
+        question_responses = []
+        for response_id in response_ids:
+            for question in questions:
+                severity = rng.choices(severities, weights)[0]
+                labels[(response_id, question.id)] = severity
+                question_responses.append(QuestionResponse(
+                    survey_response_id=response_id,
+                    question=question,
+                    text_response=rng.choice(corpus['by_severity'][severity]),
+                ))
+        QuestionResponse.objects.bulk_create(question_responses, batch_size=2000)
+        question_ids = [question.id for question in questions]
+        return [(response_id, question_ids) for response_id in response_ids], labels
+
+    def _replay(self, pending, batch_size):
+        """
+        _replay screens the responses, batch_size at a time, and returns the
+        seconds it took, the latency of each response (that of its batch)
+        and the analysis of each response screened
+        """
+        latencies = []
+        results = {}
+        started = time.perf_counter()
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            batch_started = time.perf_counter()
+            if batch_size == 1:
+                response_id, question_ids = batch[0]
+                result = analyze_survey_responses_async(response_id, question_ids)
+                # The task returns an error message if the analysis failed
+                if isinstance(result, dict):
+                    results[response_id] = result
+            else:
+                results.update(_analyze_survey_responses(batch))
+            latencies.extend([time.perf_counter() - batch_started] * len(batch))
+        return time.perf_counter() - started, latencies, results
+
+    def _report(self, options, backend, pending, labels, elapsed, latencies, results, requests, server):
+        responses = len(pending)
+        answers = len(labels)
+        latencies = sorted(latencies)
+        self.stdout.write(
+            f"Screened {responses} responses ({answers} answers) with the {backend.name} backend, "
+            f"{options['batch_size']} response(s) per task, in {settings.SURVEY_ANALYSIS_MODE} mode"
+        )
+        self.stdout.write(f"Throughput: {responses / elapsed:.1f} responses/s, {answers / elapsed:.1f} answers/s")
+        self.stdout.write(
+            f"Latency: p50 {percentile(latencies, 0.5) * 1000:.0f}ms, p99 {percentile(latencies, 0.99) * 1000:.0f}ms, "
+            f"max {latencies[-1] * 1000:.0f}ms"
+        )
+        self.stdout.write(
+            f"LLM calls: {requests.get('requests', 0) / responses:.2f} per response "
+            f"({requests.get('requests', 0)} requests, {requests.get('errors', 0)} failed), "
+            f"{requests.get('prompt_tokens', 0)} prompt and {requests.get('completion_tokens', 0)} completion tokens, "
+            f"${requests.get('cost_microdollars', 0) / 1e6:.4f} estimated cost"
+        )
+        if server is not None:
+            self.stdout.write(
+                f"Fake LLM: {server.stats['errors']} injected server errors, {server.stats['rate_limited']} injected "
+                f"rate limits; tokens are estimated and priced as {settings.SCREENING_LLM_MODEL}"
+            )
+
+        # Flags of the responses, against a response labelled concerning if any answer is
+        flagged = {response_id for response_id, result in results.items() if result['flagged']}
+        concerning = {response_id for (response_id, _), severity in labels.items() if severity in FLAG_SEVERITIES}
+        self._write_scores("Response flags", flagged, concerning, len(results))
+
+        verdicts = {
+            (response_id, int(question_id)): verdict
+            for response_id, result in results.items()
+            for question_id, verdict in result['verdicts'].items()
+        }
+        flagged = {key for key, verdict in verdicts.items() if verdict.get('flag') and verdict.get('severity') in FLAG_SEVERITIES}
+        concerning = {key for key in verdicts if labels[key] in FLAG_SEVERITIES}
+        self._write_scores("Answer flags", flagged, concerning, len(verdicts))
+        agreeing = sum(verdict.get('severity') == labels[key] for key, verdict in verdicts.items())
+        provisional = sum(bool(verdict.get('provisional')) for verdict in verdicts.values())
+        self.stdout.write(
+            f"Severity matches the label for {agreeing / len(verdicts) if verdicts else 0:.1%} of the {len(verdicts)} answers "
+            f"screened; {provisional} provisional verdicts, {responses - len(results)} responses failed"
+        )
+
+    def _write_scores(self, label, predicted, actual, total):
+        true_positives = len(predicted & actual)
+        precision = true_positives / len(predicted) if predicted else 0
+        recall = true_positives / len(actual) if actual else 0
+        self.stdout.write(
+            f"{label}: precision {precision:.1%}, recall {recall:.1%} "
+            f"({len(actual)} of {total} concerning, {len(predicted)} flagged, {true_positives} correctly)"
+        )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from surveys.models import Institution
+from surveys.columnar_exports import export_institution
+
+
+class Command(BaseCommand):
+    help = (
+        "Append survey responses submitted since the last run to the month-partitioned "
+        "Parquet analytics export of each institution. Use --full to rewrite the export."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--institution', type=int, help="Only export the institution with this id")
+        parser.add_argument('--full', action='store_true', help="Discard the existing files and export every response again")
+
+    def handle(self, *args, **options):
+        institutions = Institution.objects.order_by('id')
+        if options['institution'] is not None:
+            institutions = institutions.filter(id=options['institution'])
+            if not institutions.exists():
+                raise CommandError(f"Institution {options['institution']} does not exist")
+
+        for institution in institutions:
+            result = export_institution(institution, full=options['full'])
+            self.stdout.write(
+                f"{institution.institution_name}: {result['responses']} responses, "
+                f"{result['rows']} rows, {len(result['files'])} files"
+            )
+        self.stdout.write(self.style.SUCCESS("Analytics export complete"))
@@ -0,0 +1,86 @@
+import asyncio
+import time
+import uuid
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(sorted_values, fraction):
+    """percentile returns the value at the given fraction (0-1) of a sorted list"""
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the hash link survey endpoints of a running server, e.g. to compare the "
+        "WSGI and ASGI (ASYNC_SURVEY_VIEWS) deployments. Fetches the survey questions and, "
+        "with --submit, posts anonymous submissions, which are saved to that server's database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('hash_link', help="Hash link of the survey template to load test")
+        parser.add_argument('--url', default='http://localhost:8000', help="Base URL of the server")
+        parser.add_argument('--requests', type=int, default=1000, help="Number of requests per endpoint")
+        parser.add_argument('--concurrency', type=int, default=50, help="Number of requests in flight at once")
+        parser.add_argument('--submit', action='store_true', help="Also post anonymous survey submissions")
+        parser.add_argument('--email-domain', default='example.edu', help="Email domain of the anonymous submissions")
+
+    def handle(self, *args, **options):
+        asyncio.run(self._run(options))
+
+    async def _run(self, options):
+        limits = httpx.Limits(max_connections=options['concurrency'])
+        async with httpx.AsyncClient(base_url=options['url'], limits=limits, timeout=30) as client:
+            questions_url = f"/api/get-user-survey-questions/{options['hash_link']}/"
+            response = await client.get(questions_url)
+            if response.status_code != 200:
+                raise CommandError(f"GET {questions_url} returned {response.status_code}: {response.text[:200]}")
+            questions = response.json()["questions"]
+
+            await self._load(client, "GET questions", options, lambda: client.get(questions_url))
+
+            if options['submit']:
+                submit_url = f"/api/survey/link/{options['hash_link']}/"
+
+                def submit():
+                    name = uuid.uuid4().hex[:12]
+                    answers = {
+                        str(question['id']): 1 if question['type'] == 'likert' else "Load test answer"
+                        for question in questions
+                    }
+                    return client.post(submit_url, json={
+                        "student_name": name,
+                        "school_email": f"{name}@{options['email_domain']}",
+                        **answers,
+                    })
+
+                await self._load(client, "POST submission", options, submit)
+
+    async def _load(self, client, label, options, send):
+        """_load sends the requests of one endpoint with bounded concurrency and reports their latency"""
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        latencies = []
+        errors = 0
+
+        async def one_request():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await send()
+                    if response.status_code >= 300 or not response.json().get("success", True):
+                        errors += 1
+                except (httpx.HTTPError, ValueError):
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one_request() for _ in range(options['requests'])))
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        self.stdout.write(
+            f"{label}: {len(latencies)} requests in {elapsed:.2f}s ({len(latencies) / elapsed:.0f} req/s), "
+            f"p50 {percentile(latencies, 0.5) * 1000:.1f}ms, p99 {percentile(latencies, 0.99) * 1000:.1f}ms, "
+            f"{errors} errors"
+        )
@@ -0,0 +1,120 @@
+import time
+from datetime import date, datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from surveys.llm_services import PROMPT_VERSION
+from surveys.models import Institution, QuestionResponse, ReanalysisRun
+from surveys.reanalysis import create_run, dispatch_chunks, get_run_progress
+from surveys.screening_backends import get_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-screen historical text answers with the current screening prompt and model, in chunks of "
+        "QuestionResponse ids fanned out to the Celery workers. Progress is saved as chunks finish: "
+        "an interrupted run is continued with --resume."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--resume', type=int, metavar='RUN_ID', help="Continue the run with this id")
+        parser.add_argument('--institution', type=int, help="Only re-screen the answers of the institution with this id")
+        parser.add_argument('--since', type=date.fromisoformat, help="Only re-screen answers of responses submitted from this date (YYYY-MM-DD)")
+        parser.add_argument('--start-id', type=int, help="First QuestionResponse id to re-screen")
+        parser.add_argument('--end-id', type=int, help="QuestionResponse id to stop before")
+        parser.add_argument('--chunk-size', type=int, help="QuestionResponse ids per chunk task")
+        parser.add_argument('--budget', type=int, help="LLM requests per minute the run may send, across all workers")
+        parser.add_argument('--max-in-flight', type=int, help="Chunk tasks queued at a time")
+        parser.add_argument('--rescreen', action='store_true', help="Also re-screen answers already screened with the current prompt")
+        parser.add_argument('--poll-interval', type=float, default=5.0, help="Seconds between progress reports")
+
+    def handle(self, *args, **options):
+        if options['resume'] is not None:
+            run = self._resume(options)
+        else:
+            run = self._create(options)
+            if run is None:
+                self.stdout.write("No text answers to re-screen")
+                return
+            self.stdout.write(f"Started reanalysis {run.id} of QuestionResponse ids {run.start_id}-{run.end_id - 1}")
+
+        started = time.monotonic()
+        initial = get_run_progress(run)
+        try:
+            while True:
+                dispatch_chunks(run, options['max_in_flight'])
+                progress = get_run_progress(run)
+                self._report(progress, initial, time.monotonic() - started)
+                if run.finished is not None:
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(
+                f"Interrupted. Queued chunks still run on the workers; continue with --resume {run.id}"
+            )
+            return
+
+        self.stdout.write(self.style.SUCCESS(f"Reanalysis {run.id} complete"))
+        if progress['failed']:
+            self.stdout.write(self.style.WARNING(
+                f"{progress['failed']} answers could not be screened; run the command again to retry them "
+                f"(answers already screened are skipped)"
+            ))
+
+    def _create(self, options):
+        institution = None
+        if options['institution'] is not None:
+            institution = Institution.objects.filter(id=options['institution']).first()
+            if institution is None:
+                raise CommandError(f"Institution {options['institution']} does not exist")
+
+        start_id = options['start_id']
+        if options['since'] is not None:
+            since = timezone.make_aware(datetime.combine(options['since'], datetime.min.time()))
+            first = QuestionResponse.objects.filter(survey_response__created__gte=since).aggregate(first=Min('id'))['first']
+            if first is None:
+                return None
+            start_id = max(start_id or first, first)
+
+        return create_run(
+            start_id=start_id,
+            end_id=options['end_id'],
+            institution=institution,
+            chunk_size=options['chunk_size'],
+            budget=options['budget'],
+            skip_screened=not options['rescreen'],
+        )
+
+    def _resume(self, options):
+        run = ReanalysisRun.objects.filter(id=options['resume']).first()
+        if run is None:
+            raise CommandError(f"Reanalysis {options['resume']} does not exist")
+        if run.prompt_version != PROMPT_VERSION:
+            raise CommandError(
+                f"Reanalysis {run.id} screens with prompt version {run.prompt_version}, the current one is "
+                f"{PROMPT_VERSION}; start a new run"
+            )
+        if run.model != get_backend().model:
+            raise CommandError(
+                f"Reanalysis {run.id} screens with model {run.model!r}, the current screening backend with "
+                f"{get_backend().model!r}; start a new run"
+            )
+        if options['budget']:
+            # Read by the chunk tasks, so this also throttles the ones already queued
+            run.budget = options['budget']
+            run.save(update_fields=['budget'])
+        self.stdout.write(f"Resuming reanalysis {run.id} of QuestionResponse ids {run.start_id}-{run.end_id - 1}")
+        return run
+
+    def _report(self, progress, initial, elapsed):
+        """_report writes the progress of the run, with the throughput and ETA of this invocation"""
+        done = progress['done'] - initial['done']
+        answers = progress['answers'] - initial['answers']
+        remaining = progress['chunks'] - progress['done']
+        eta = timedelta(seconds=round(remaining * elapsed / done)) if done else "unknown"
+        self.stdout.write(
+            f"Chunks {progress['done']}/{progress['chunks']}: {progress['answers']} answers "
+            f"({progress['skipped']} skipped, {progress['rules']} rules, {progress['cached']} cached, "
+            f"{progress['llm']} LLM, {progress['failed']} failed), {progress['flagged']} responses newly flagged; "
+            f"{answers / elapsed if elapsed else 0:.1f} answers/s, ETA {eta}"
+        )
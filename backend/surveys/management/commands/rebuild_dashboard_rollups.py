@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from surveys.models import Institution
+from surveys.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily dashboard rollups from the raw survey responses"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--institution',
+            type=int,
+            help="Only rebuild the rollups of the institution with this id",
+        )
+
+    def handle(self, *args, **options):
+        institutions = Institution.objects.all()
+        if options['institution'] is not None:
+            institutions = institutions.filter(id=options['institution'])
+            if not institutions.exists():
+                raise CommandError(f"Institution {options['institution']} does not exist")
+
+        for institution in institutions:
+            rebuild_rollups(institution)
+            self.stdout.write(f"Rebuilt rollups for {institution.institution_name}")
+
+        self.stdout.write(self.style.SUCCESS("Dashboard rollups rebuilt"))
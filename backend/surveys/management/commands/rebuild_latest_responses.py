@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from surveys.models import Institution
+from surveys.latest_responses import rebuild_latest_responses
+
+
+class Command(BaseCommand):
+    help = "Rebuild the latest response index of every respondent from the raw survey responses"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--institution',
+            type=int,
+            help="Only rebuild the respondents of the institution with this id",
+        )
+
+    def handle(self, *args, **options):
+        institution = None
+        if options['institution'] is not None:
+            institution = Institution.objects.filter(id=options['institution']).first()
+            if institution is None:
+                raise CommandError(f"Institution {options['institution']} does not exist")
+
+        rebuild_latest_responses(institution)
+        self.stdout.write(self.style.SUCCESS("Latest response index rebuilt"))
@@ -0,0 +1,54 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand
+from surveys.circuit_breaker import CLOSED, get_breaker_state
+from surveys.prescreening import get_prescreen_stats, reset_prescreen_stats
+from surveys.screening_backends import get_backend, get_backend_stats, reset_backend_stats
+from surveys.verdict_cache import get_verdict_cache_stats, reset_verdict_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Show how many answer screenings were served without calling the LLM"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Reset the counts after showing them")
+
+    def handle(self, *args, **options):
+        prescreen = get_prescreen_stats()
+        prescreened = prescreen['high'] + prescreen['benign'] + prescreen['forwarded']
+        settled = prescreen['high'] + prescreen['benign']
+        self.stdout.write(
+            f"Prescreener: {prescreen['high']} high risk, {prescreen['benign']} benign, "
+            f"{prescreen['forwarded']} forwarded ({settled / prescreened if prescreened else 0:.1%} of answers settled locally)"
+        )
+
+        stats = get_verdict_cache_stats()
+        lookups = stats['hits'] + stats['misses']
+        hit_rate = stats['hits'] / lookups if lookups else 0
+        self.stdout.write(
+            f"Verdict cache: {stats['hits']} hits, {stats['misses']} misses ({hit_rate:.1%} of lookups served from the cache)"
+        )
+
+        self.stdout.write(f"Screening backend: {get_backend().name}")
+        for name, counts in get_backend_stats().items():
+            requests = counts['requests']
+            self.stdout.write(
+                f"  {name}: {counts['answers']} answers, {requests} requests ({counts['errors']} failed), "
+                f"{counts['latency_ms'] / (requests or counts['answers']):.0f}ms mean latency, "
+                f"{counts['prompt_tokens']} prompt and {counts['completion_tokens']} completion tokens, "
+                f"${counts['cost_microdollars'] / 1e6:.4f} estimated cost"
+            )
+
+        breaker = get_breaker_state()
+        if breaker['state'] == CLOSED:
+            self.stdout.write("LLM circuit breaker: closed")
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"LLM circuit breaker: {breaker['state']} since {datetime.fromtimestamp(breaker['opened']):%Y-%m-%d %H:%M:%S} "
+                f"({breaker['reason']}); new answers get provisional local verdicts"
+            ))
+
+        if options['reset']:
+            reset_prescreen_stats()
+            reset_verdict_cache_stats()
+            reset_backend_stats()
+            self.stdout.write(self.style.SUCCESS("Counts reset"))
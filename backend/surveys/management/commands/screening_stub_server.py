@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from surveys.screening_stub import StubServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a fake LLM on the chat completions API for the 'fake' screening backend "
+        "(SCREENING_BACKEND=fake), with deterministic verdicts and injectable latency and errors. "
+        "GET /v1/stats returns the counts of the requests served."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help="Address to listen on")
+        parser.add_argument('--port', type=int, default=8089, help="Port to listen on")
+        parser.add_argument('--latency', type=float, default=200, help="Milliseconds each request takes")
+        parser.add_argument('--jitter', type=float, default=0, help="Up to this many more milliseconds a request takes")
+        parser.add_argument('--error-every', type=int, default=0, help="Fail every Nth request with a server error")
+        parser.add_argument('--rate-limit-every', type=int, default=0, help="Rate limit every Nth request")
+
+    def handle(self, *args, **options):
+        server = StubServer(
+            (options['host'], options['port']),
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_every=options['error_every'],
+            rate_limit_every=options['rate_limit_every'],
+        )
+        self.stdout.write(f"Fake LLM listening on http://{options['host']}:{options['port']}/v1")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(
+                f"Served {server.stats['requests']} requests ({server.stats['errors']} failed, "
+                f"{server.stats['rate_limited']} rate limited)"
+            )
@@ -0,0 +1,18 @@
+import time
+from django.core.management.base import BaseCommand
+from core.celery import get_queue_depths
+
+
+class Command(BaseCommand):
+    help = "Show how many tasks are waiting in each Celery queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watch', type=float, metavar='SECONDS', help="Show the depths again every SECONDS seconds")
+
+    def handle(self, *args, **options):
+        while True:
+            depths = get_queue_depths()
+            self.stdout.write(", ".join(f"{queue}: {depth}" for queue, depth in depths.items()))
+            if not options['watch']:
+                break
+            time.sleep(options['watch'])
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:14
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0007_alter_surveyresponse_student_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyLikertRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('category', models.CharField(choices=[('general', 'General Question'), ('sleep', 'Sleep Quality'), ('stress', 'Stress Level'), ('support', 'Support Perception')], max_length=20)),
+                ('likert_value', models.PositiveSmallIntegerField(validators=[django.core.validators.MaxValueValidator(5), django.core.validators.MinValueValidator(1)])),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('institution', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='surveys.institution')),
+            ],
+            options={
+                'unique_together': {('institution', 'day', 'category', 'likert_value')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyResponseRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('num_responses', models.PositiveIntegerField(default=0)),
+                ('num_respondents', models.PositiveIntegerField(default=0)),
+                ('num_flagged', models.PositiveIntegerField(default=0)),
+                ('institution', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='surveys.institution')),
+            ],
+            options={
+                'unique_together': {('institution', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_latest_responses(apps, schema_editor):
+    SurveyResponse = apps.get_model('surveys', 'SurveyResponse')
+    LatestResponse = apps.get_model('surveys', 'LatestResponse')
+
+    latest = {}
+    rows = SurveyResponse.objects.order_by('created', 'id').values_list(
+        'id', 'created', 'flagged', 'student_id', 'anonymous_student_id',
+        'student__institution_details_id', 'anonymous_student__survey_template__institution_id',
+    )
+    for row in rows.iterator(chunk_size=2000):
+        response_id, created, flagged, student_id, anonymous_student_id, student_institution_id, anonymous_institution_id = row
+        if student_id is None and anonymous_student_id is None:
+            continue
+        latest[(student_id, anonymous_student_id)] = LatestResponse(
+            student_id=student_id,
+            anonymous_student_id=anonymous_student_id,
+            institution_id=student_institution_id if student_id else anonymous_institution_id,
+            survey_response_id=response_id,
+            created=created,
+            flagged=flagged,
+        )
+    LatestResponse.objects.bulk_create(latest.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0008_dailylikertrollup_dailyresponserollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestResponse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField()),
+                ('flagged', models.BooleanField(default=False)),
+                ('anonymous_student', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='latest_response', to='surveys.anonymousstudent')),
+                ('institution', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='surveys.institution')),
+                ('student', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='latest_response', to=settings.AUTH_USER_MODEL)),
+                ('survey_response', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='surveys.surveyresponse')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['institution', 'flagged'], name='surveys_lat_institu_ede8fb_idx')],
+            },
+        ),
+        migrations.RunPython(populate_latest_responses, migrations.RunPython.noop),
+    ]
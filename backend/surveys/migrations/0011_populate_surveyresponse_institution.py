@@ -0,0 +1,46 @@
+from collections import defaultdict
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def populate_institution(apps, schema_editor):
+    """
+    populate_institution copies the institution of every existing survey
+    response onto it, one committed batch of BATCH_SIZE responses at a time
+    """
+    SurveyResponse = apps.get_model('surveys', 'SurveyResponse')
+
+    last_id = 0
+    while True:
+        batch = list(
+            SurveyResponse.objects.filter(id__gt=last_id, institution__isnull=True)
+            .order_by('id')
+            .values_list('id', 'student_id', 'student__institution_details_id', 'anonymous_student__survey_template__institution_id')
+            [:BATCH_SIZE]
+        )
+        if not batch:
+            break
+
+        ids_by_institution = defaultdict(list)
+        for response_id, student_id, student_institution_id, anonymous_institution_id in batch:
+            institution_id = student_institution_id if student_id else anonymous_institution_id
+            if institution_id is not None:
+                ids_by_institution[institution_id].append(response_id)
+
+        for institution_id, response_ids in ids_by_institution.items():
+            SurveyResponse.objects.filter(id__in=response_ids).update(institution_id=institution_id)
+        last_id = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+    # Commit every batch separately instead of locking the whole table
+    atomic = False
+
+    dependencies = [
+        ('surveys', '0010_surveyresponse_institution_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_institution, migrations.RunPython.noop),
+    ]
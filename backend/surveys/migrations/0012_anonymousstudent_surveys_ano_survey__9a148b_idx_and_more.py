@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('surveys', '0011_populate_surveyresponse_institution'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='anonymousstudent',
+            index=models.Index(fields=['survey_template', 'created_at'], name='surveys_ano_survey__9a148b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='surveyresponse',
+            index=models.Index(fields=['institution', 'flagged', 'created'], name='surveys_sur_institu_aaf946_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='surveyresponse',
+            index=models.Index(fields=['survey_template', 'created'], name='surveys_sur_survey__0b6750_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='surveyresponse',
+            index=models.Index(fields=['created'], name='surveys_sur_created_b740be_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['institution_details', 'date_joined'], name='surveys_use_institu_b5735e_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0012_anonymousstudent_surveys_ano_survey__9a148b_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_response_id', models.BigIntegerField(default=0)),
+                ('last_created', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('institution', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='export_watermark', to='surveys.institution')),
+            ],
+        ),
+    ]
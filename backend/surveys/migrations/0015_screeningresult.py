@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0014_surveyresponse_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScreeningResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('severity', models.PositiveSmallIntegerField(choices=[(0, 'None'), (1, 'Low'), (2, 'Medium'), (3, 'High')])),
+                ('flagged', models.BooleanField(default=False)),
+                ('reason', models.TextField(blank=True)),
+                ('source', models.CharField(choices=[('rules', 'Local rules'), ('cache', 'Cached verdict'), ('llm', 'LLM')], max_length=10)),
+                ('model', models.CharField(blank=True, max_length=100)),
+                ('prompt_version', models.CharField(blank=True, max_length=32)),
+                ('latency_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='latestresponse',
+            name='screening_severity',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'None'), (1, 'Low'), (2, 'Medium'), (3, 'High')], default=0),
+        ),
+        migrations.AddField(
+            model_name='surveyresponse',
+            name='screening_severity',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'None'), (1, 'Low'), (2, 'Medium'), (3, 'High')], default=0),
+        ),
+        migrations.AddIndex(
+            model_name='latestresponse',
+            index=models.Index(fields=['institution', 'flagged', 'screening_severity'], name='surveys_lat_institu_8670fd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='surveyresponse',
+            index=models.Index(fields=['institution', 'flagged', 'screening_severity', 'created'], name='surveys_sur_institu_48ae3d_idx'),
+        ),
+        migrations.AddField(
+            model_name='screeningresult',
+            name='institution',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='surveys.institution'),
+        ),
+        migrations.AddField(
+            model_name='screeningresult',
+            name='question_response',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='screening_results', to='surveys.questionresponse'),
+        ),
+        migrations.AddField(
+            model_name='screeningresult',
+            name='survey_response',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='screening_results', to='surveys.surveyresponse'),
+        ),
+        migrations.AddIndex(
+            model_name='screeningresult',
+            index=models.Index(fields=['institution', 'severity', 'created'], name='surveys_scr_institu_6bca6e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='screeningresult',
+            index=models.Index(fields=['prompt_version'], name='surveys_scr_prompt__4d2374_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0015_screeningresult'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReanalysisRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prompt_version', models.CharField(max_length=32)),
+                ('model', models.CharField(max_length=100)),
+                ('start_id', models.BigIntegerField()),
+                ('end_id', models.BigIntegerField()),
+                ('skip_screened', models.BooleanField(default=True)),
+                ('budget', models.PositiveIntegerField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('institution', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='surveys.institution')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReanalysisChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_id', models.BigIntegerField()),
+                ('end_id', models.BigIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('queued', 'Queued'), ('done', 'Done')], default='pending', max_length=10)),
+                ('queued', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('answers', models.PositiveIntegerField(default=0)),
+                ('skipped', models.PositiveIntegerField(default=0)),
+                ('rules', models.PositiveIntegerField(default=0)),
+                ('cached', models.PositiveIntegerField(default=0)),
+                ('llm', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('flagged', models.PositiveIntegerField(default=0)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='surveys.reanalysisrun')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['run', 'status', 'start_id'], name='surveys_rea_run_id_32295d_idx')],
+                'unique_together': {('run', 'start_id')},
+            },
+        ),
+    ]
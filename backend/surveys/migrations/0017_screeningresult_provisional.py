@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0016_reanalysis'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='screeningresult',
+            name='provisional',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='screeningresult',
+            index=models.Index(fields=['provisional', 'question_response'], name='surveys_scr_provisi_1a2af7_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+from surveys.rollups import rebuild_rollups
+
+
+def populate_rollups(apps, schema_editor):
+    """
+    populate_rollups computes the daily dashboard rollups of every
+    institution from the survey responses submitted before they existed,
+    one committed institution at a time
+    """
+    Institution = apps.get_model('surveys', 'Institution')
+    for institution in Institution.objects.all():
+        rebuild_rollups(institution, apps)
+
+
+class Migration(migrations.Migration):
+    # Commit every institution separately instead of locking the rollup tables throughout
+    atomic = False
+
+    dependencies = [
+        ('surveys', '0017_screeningresult_provisional'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:49
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0018_populate_dashboard_rollups'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='dailyresponserollup',
+            name='num_flagged',
+        ),
+    ]
@@ -122,6 +122,11 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     objects = UserManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['institution_details', 'date_joined']),
+        ]
+
     def __str__(self):
         return self.email
 
@@ -156,6 +161,11 @@ class AnonymousStudent(models.Model):
     name = models.CharField(null=True, max_length=250)
     survey_template = models.ForeignKey(SurveyTemplate, on_delete=models.CASCADE, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['survey_template', 'created_at']),
+        ]
     
     def __str__(self):
         return self.email
@@ -212,6 +222,19 @@ class SurveyQuestion(models.Model):
         super().save(*args, **kwargs)
 
 
+class ScreeningSeverity(models.IntegerChoices):
+    NONE = 0, 'None'
+    LOW = 1, 'Low'
+    MEDIUM = 2, 'Medium'
+    HIGH = 3, 'High'
+
+
+class ScreeningSource(models.TextChoices):
+    RULES = 'rules', 'Local rules'
+    CACHE = 'cache', 'Cached verdict'
+    LLM = 'llm', 'LLM'
+
+
 class SurveyResponse(models.Model):
     """
     SurveyResponse represents a complete survey submission by a student
@@ -223,8 +246,27 @@ class SurveyResponse(models.Model):
     survey_template = models.ForeignKey(SurveyTemplate, on_delete=models.CASCADE, null=True, blank=True)
     # OR Option 2: Provide a default value
     # survey_template = models.ForeignKey(SurveyTemplate, on_delete=models.CASCADE, default=1)
+    # Institution the response is counted under (the student's institution, or
+    # the institution of the anonymous student's survey template)
+    institution = models.ForeignKey(Institution, on_delete=models.CASCADE, null=True, blank=True)
     created = models.DateTimeField(auto_now_add=True)
     flagged = models.BooleanField(default=False)
+    # Highest severity the text screening found in the response's answers
+    screening_severity = models.PositiveSmallIntegerField(choices=ScreeningSeverity.choices, default=ScreeningSeverity.NONE)
+    # Digest of the client's idempotency key and the respondent; a retried
+    # submission can never be saved twice
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+
+    class Meta:
+        # Match the (created, id) ordering of the paginated response APIs;
+        # InnoDB appends the primary key to every secondary index
+        indexes = [
+            models.Index(fields=['institution', 'created']),
+            models.Index(fields=['institution', 'flagged', 'created']),
+            models.Index(fields=['institution', 'flagged', 'screening_severity', 'created']),
+            models.Index(fields=['survey_template', 'created']),
+            models.Index(fields=['created']),
+        ]
     
     def __str__(self):
         name = None
@@ -254,4 +296,174 @@ class QuestionResponse(models.Model):
     def __str__(self):
         if self.question.question_type == QuestionType.LIKERT:
             return f"Likert response: {self.likert_value}"
-        return f"Text response: {self.text_response[:30]}..."
\ No newline at end of file
+        return f"Text response: {self.text_response[:30]}..."
+
+class ScreeningResult(models.Model):
+    """
+    ScreeningResult is the verdict of the text screening on one answer: its
+    severity and the reason given, and what produced it (local rules, a
+    cached verdict or the LLM, with the model and prompt version). An answer
+    screened again, e.g. with a new prompt, gets a new result.
+    """
+    question_response = models.ForeignKey(QuestionResponse, on_delete=models.CASCADE, related_name='screening_results')
+    survey_response = models.ForeignKey(SurveyResponse, on_delete=models.CASCADE, related_name='screening_results')
+    institution = models.ForeignKey(Institution, on_delete=models.CASCADE, null=True, blank=True)
+    severity = models.PositiveSmallIntegerField(choices=ScreeningSeverity.choices)
+    flagged = models.BooleanField(default=False)
+    reason = models.TextField(blank=True)
+    source = models.CharField(max_length=10, choices=ScreeningSource.choices)
+    model = models.CharField(max_length=100, blank=True)
+    prompt_version = models.CharField(max_length=32, blank=True)
+    # Duration of the LLM request that produced the verdict (shared by the answers of a batch)
+    latency_ms = models.PositiveIntegerField(null=True, blank=True)
+    # Set on verdicts of the local classifier used while the LLM was
+    # unavailable; the answer is screened again by the LLM once it recovers
+    provisional = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['institution', 'severity', 'created']),
+            models.Index(fields=['prompt_version']),
+            models.Index(fields=['provisional', 'question_response']),
+        ]
+
+    def __str__(self):
+        return f"{self.question_response_id}: {self.get_severity_display()} ({self.source})"
+
+
+class DailyResponseRollup(models.Model):
+    """
+    DailyResponseRollup holds the per-institution, per-day survey response
+    counters read by the dashboard. NOTE: num_respondents counts respondents
+    whose first response of the calendar month was submitted on this day, so
+    summing a month's rows gives the number of unique respondents that month.
+    """
+    institution = models.ForeignKey(Institution, on_delete=models.CASCADE)
+    day = models.DateField()
+    num_responses = models.PositiveIntegerField(default=0)
+    num_respondents = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('institution', 'day')
+
+    def __str__(self):
+        return f"{self.institution_id} - {self.day}: {self.num_responses} responses"
+
+
+class DailyLikertRollup(models.Model):
+    """
+    DailyLikertRollup counts the Likert answers given per institution, day,
+    question category and Likert value
+    """
+    institution = models.ForeignKey(Institution, on_delete=models.CASCADE)
+    day = models.DateField()
+    category = models.CharField(max_length=20, choices=QuestionCategory.choices)
+    likert_value = models.PositiveSmallIntegerField(validators=[MaxValueValidator(5), MinValueValidator(1)])
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('institution', 'day', 'category', 'likert_value')
+
+    def __str__(self):
+        return f"{self.institution_id} - {self.day} - {self.category}={self.likert_value}: {self.count}"
+
+
+class LatestResponse(models.Model):
+    """
+    LatestResponse points at the most recent survey response of a registered
+    or anonymous respondent, together with its submission time, flagged state
+    and institution, so "whose latest response is flagged" is a single indexed
+    scan. NOTE: exactly one of student and anonymous_student is set.
+    """
+    student = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True, related_name='latest_response')
+    anonymous_student = models.OneToOneField(AnonymousStudent, on_delete=models.CASCADE, null=True, blank=True, related_name='latest_response')
+    institution = models.ForeignKey(Institution, on_delete=models.CASCADE, null=True, blank=True)
+    survey_response = models.OneToOneField(SurveyResponse, on_delete=models.CASCADE, related_name='+')
+    created = models.DateTimeField()
+    flagged = models.BooleanField(default=False)
+    screening_severity = models.PositiveSmallIntegerField(choices=ScreeningSeverity.choices, default=ScreeningSeverity.NONE)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['institution', 'flagged']),
+            models.Index(fields=['institution', 'flagged', 'screening_severity']),
+        ]
+
+    def __str__(self):
+        return f"{self.student or self.anonymous_student} - {str(self.created)}"
+
+
+class ExportWatermark(models.Model):
+    """
+    ExportWatermark records how far the columnar analytics export of an
+    institution has got: every survey response with an id up to
+    last_response_id has been written to the institution's Parquet files
+    """
+    institution = models.OneToOneField(Institution, on_delete=models.CASCADE, related_name='export_watermark')
+    last_response_id = models.BigIntegerField(default=0)
+    last_created = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.institution_id}: {self.last_response_id}"
+
+
+class ReanalysisStatus(models.TextChoices):
+    PENDING = 'pending', 'Pending'
+    QUEUED = 'queued', 'Queued'
+    DONE = 'done', 'Done'
+
+
+class ReanalysisRun(models.Model):
+    """
+    ReanalysisRun is a re-screening of the historical text answers with a
+    range of QuestionResponse ids, split into ReanalysisChunk rows that
+    record how far it has got, so an interrupted run can be resumed
+    """
+    prompt_version = models.CharField(max_length=32)
+    model = models.CharField(max_length=100)
+    institution = models.ForeignKey(Institution, on_delete=models.CASCADE, null=True, blank=True)
+    start_id = models.BigIntegerField()
+    end_id = models.BigIntegerField()
+    # Answers already screened with the run's prompt version are not screened again
+    skip_screened = models.BooleanField(default=True)
+    # Maximum number of LLM requests per minute, across all workers
+    budget = models.PositiveIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+    # Set once every chunk is done
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Reanalysis {self.id} ({self.prompt_version}): {self.start_id}-{self.end_id}"
+
+
+class ReanalysisChunk(models.Model):
+    """
+    ReanalysisChunk is the range [start_id, end_id) of QuestionResponse ids
+    one Celery task of a ReanalysisRun re-screens, with what came of it
+    """
+    run = models.ForeignKey(ReanalysisRun, on_delete=models.CASCADE, related_name='chunks')
+    start_id = models.BigIntegerField()
+    end_id = models.BigIntegerField()
+    status = models.CharField(max_length=10, choices=ReanalysisStatus.choices, default=ReanalysisStatus.PENDING)
+    queued = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    # Text answers in the range, and how each was screened
+    answers = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    rules = models.PositiveIntegerField(default=0)
+    cached = models.PositiveIntegerField(default=0)
+    llm = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    # Survey responses newly flagged by the re-screening
+    flagged = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('run', 'start_id')
+        indexes = [
+            models.Index(fields=['run', 'status', 'start_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.run_id}: {self.start_id}-{self.end_id} ({self.status})"
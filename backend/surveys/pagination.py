@@ -0,0 +1,156 @@
+import base64
+import json
+from datetime import datetime
+from django.conf import settings
+from django.db.models import CharField, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+class PaginationError(ValueError):
+    """PaginationError is raised for malformed cursors, page sizes or filters"""
+
+
+def encode_cursor(position):
+    """
+    encode_cursor turns a (timestamp, key) or (rank, timestamp, key) position
+    into an opaque cursor string
+    """
+    *rank, timestamp, key = position
+    payload = json.dumps([*rank, timestamp.isoformat(), key], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, ranked=False, key_type=int):
+    """
+    decode_cursor turns a cursor produced by encode_cursor back into a
+    (timestamp, key) position, or a (rank, timestamp, key) one if ranked.
+    The key must be a key_type and the rank a number, so a crafted cursor
+    fails here rather than in the query.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        *rank, timestamp, key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if len(rank) != int(ranked):
+            raise ValueError("Cursor of another ordering")
+        # bool is an int subclass, but never a key or rank
+        if isinstance(key, bool) or not isinstance(key, key_type):
+            raise ValueError("Cursor key of another type")
+        if rank and (isinstance(rank[0], bool) or not isinstance(rank[0], (int, float))):
+            raise ValueError("Cursor rank is not a number")
+        return (*rank, datetime.fromisoformat(timestamp), key)
+    except (ValueError, TypeError):
+        raise PaginationError("Invalid cursor")
+
+
+def get_page_size(request):
+    """
+    get_page_size reads the page_size query parameter, falling back to
+    API_PAGE_SIZE and capping it at API_MAX_PAGE_SIZE
+    """
+    page_size = request.query_params.get('page_size')
+    if page_size is None:
+        return settings.API_PAGE_SIZE
+    try:
+        page_size = int(page_size)
+    except ValueError:
+        raise PaginationError("page_size must be an integer")
+    if page_size < 1:
+        raise PaginationError("page_size must be positive")
+    return min(page_size, settings.API_MAX_PAGE_SIZE)
+
+
+def _parse_bound(value, end_of_day=False):
+    """
+    _parse_bound parses a date or datetime query parameter into an aware datetime.
+    Plain dates are taken as the start (or the end, if end_of_day) of that day.
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise PaginationError(f"Invalid date: {value}")
+        parsed = datetime.combine(day, datetime.max.time() if end_of_day else datetime.min.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_by_date_range(queryset, request, field):
+    """
+    filter_by_date_range applies the created_after / created_before query
+    parameters to the given date field of a queryset
+    """
+    created_after = request.query_params.get('created_after')
+    created_before = request.query_params.get('created_before')
+    if created_after:
+        queryset = queryset.filter(**{f'{field}__gte': _parse_bound(created_after)})
+    if created_before:
+        queryset = queryset.filter(**{f'{field}__lte': _parse_bound(created_before, end_of_day=True)})
+    return queryset
+
+
+def filter_survey_responses(queryset, request):
+    """
+    filter_survey_responses applies the created_after, created_before,
+    template and flagged query parameters to a SurveyResponse queryset
+    """
+    queryset = filter_by_date_range(queryset, request, 'created')
+
+    template = request.query_params.get('template')
+    if template:
+        if not template.isdigit():
+            raise PaginationError("template must be a survey template id")
+        queryset = queryset.filter(survey_template_id=int(template))
+
+    flagged = request.query_params.get('flagged')
+    if flagged:
+        if flagged.lower() not in ('true', 'false'):
+            raise PaginationError("flagged must be true or false")
+        queryset = queryset.filter(flagged=flagged.lower() == 'true')
+
+    return queryset
+
+
+def paginate(queryset, cursor, page_size, time_field='created', key_field='id', rank_field=None):
+    """
+    paginate returns one page of a queryset, newest first, using keyset
+    pagination on (time_field, key_field): fetching any page costs the same
+    index range scan as fetching the first one.
+
+    queryset: queryset to paginate (model instances or .values() rows)
+    cursor: cursor returned with the previous page, or None for the first page
+    page_size: maximum number of rows in the page
+    time_field: timestamp field the rows are ordered by
+    key_field: unique field breaking ties between equal timestamps
+    rank_field: integer field ordering the rows (highest first) before time_field, if any
+
+    Returns the rows of the page and the cursor of the next page (None on the last page).
+    """
+    fields = [field for field in (rank_field, time_field, key_field) if field]
+    queryset = queryset.order_by(*[f'-{field}' for field in fields])
+    if cursor:
+        # Integer keys (ids) or text ones (e.g. emails)
+        key_type = str if isinstance(queryset.model._meta.get_field(key_field), CharField) else int
+        *rank, timestamp, key = decode_cursor(cursor, ranked=bool(rank_field), key_type=key_type)
+        # Equivalent to (time_field, key_field) < (timestamp, key); the leading
+        # time_field <= timestamp bound lets the database use an index range
+        after = (
+            Q(**{f'{time_field}__lte': timestamp}) &
+            (Q(**{f'{time_field}__lt': timestamp}) | Q(**{f'{key_field}__lt': key}))
+        )
+        if rank_field:
+            # (rank_field, time_field, key_field) < (rank, timestamp, key)
+            after = Q(**{f'{rank_field}__lte': rank[0]}) & (Q(**{f'{rank_field}__lt': rank[0]}) | after)
+        queryset = queryset.filter(after)
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        if isinstance(last, dict):
+            next_cursor = encode_cursor([last[field] for field in fields])
+        else:
+            next_cursor = encode_cursor([getattr(last, field) for field in fields])
+    return rows, next_cursor
@@ -0,0 +1,237 @@
+import re
+import unicodedata
+from collections import deque
+from django.core.cache import cache
+from .caching import increment_counter
+from .verdict_cache import normalize_answer
+
+# First person statements of immediate risk, from the high severity criteria
+# of the screening prompt. A match flags the answer without asking the LLM.
+HIGH_SEVERITY_PHRASES = (
+    "want to kill myself", "going to kill myself", "kill myself", "killing myself",
+    "want to die", "wanna die", "end my life", "ending my life", "take my own life",
+    "taking my own life", "take my life", "end it all", "time to end this life",
+    "gunshot and die", "commit suicide", "i'm suicidal", "i am suicidal", "feel suicidal",
+    "feeling suicidal", "hang myself", "hanging myself", "slit my wrists", "overdose on purpose",
+    "better off dead", "shoot up the school", "kill them all", "kill everyone",
+)
+
+# Words that, before a high severity phrase in the same clause, make it
+# something other than a first person statement of risk: a negation ("I
+# would never want to die") or someone else's words or story ("the movie
+# where he wanted to end it all"). Such answers, like those quoting the
+# phrase, are left to the LLM.
+NEGATION_CUES = frozenset((
+    "not", "no", "never", "nobody", "none", "neither", "nor", "don't", "dont", "doesn't", "doesnt",
+    "didn't", "didnt", "won't", "wont", "wouldn't", "wouldnt", "can't", "cant", "cannot", "isn't",
+    "wasn't", "aren't", "haven't", "hasn't", "shouldn't", "used", "anymore", "longer",
+))
+THIRD_PERSON_CUES = frozenset((
+    "he", "she", "they", "him", "her", "his", "them", "their", "he's", "she's", "they're", "someone",
+    "somebody", "friend", "friend's", "brother", "sister", "cousin", "character", "movie", "film", "show",
+    "book", "song", "lyrics", "story", "game", "video", "said", "says", "saying", "joke", "joking", "kidding",
+))
+
+# Whole answers that carry no information to screen. Answers like "no",
+# "none" or "nothing" are deliberately absent: their meaning depends on the
+# question ("Do you feel safe?").
+BENIGN_ANSWERS = frozenset((
+    "n/a", "na", "not applicable", "no comment", "no comments", "nothing to add",
+    "fine", "good", "great", "ok", "okay", "all good", "pretty good", "doing well",
+    "doing good", "i'm fine", "i'm good", "i'm okay", "i'm ok", "i am fine", "i am good",
+    "i am okay", "i'm doing well", "i'm doing good", "i am doing well",
+))
+
+# Phrases of the medium and low severity criteria of the screening prompt,
+# used by classify_answer while the LLM is unavailable
+MEDIUM_SEVERITY_PHRASES = (
+    "hopeless", "no hope", "can't take it anymore", "cannot take it anymore", "can't do this anymore",
+    "no point in living", "no point anymore", "what's the point", "give up", "giving up", "worthless",
+    "a burden", "better off without me", "make it stop", "be done with everything", "done with everything",
+    "trapped", "no way out", "want to disappear", "wish i was dead", "wish i were dead", "thinking about death",
+    "think about dying", "self harm", "self-harm", "hurt myself", "hurting myself", "cutting myself",
+    "drinking to cope", "getting high", "numb the pain", "nobody cares", "no one cares", "all alone",
+)
+LOW_SEVERITY_PHRASES = (
+    "sad", "depressed", "depression", "anxious", "anxiety", "panic", "stressed", "overwhelmed",
+    "can't sleep", "cannot sleep", "not sleeping", "can't focus", "can't concentrate", "not eating",
+    "lonely", "isolated", "crying", "cry every", "miserable", "exhausted", "failing", "bullied",
+    "lost interest", "don't enjoy", "no motivation", "unmotivated", "scared", "afraid",
+)
+
+HIGH_KEY = "screening_prescreen_high"
+BENIGN_KEY = "screening_prescreen_benign"
+FORWARDED_KEY = "screening_prescreen_forwarded"
+
+
+class PhraseMatcher:
+    """
+    PhraseMatcher finds every occurrence of a set of phrases in a text in a
+    single pass (Aho-Corasick automaton). Only occurrences that start and end
+    on word boundaries count, so "skill myself" does not match "kill myself".
+    """
+
+    def __init__(self, phrases):
+        # Trie of the phrases: goto transitions, failure links and the phrases ending at each node
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for phrase in phrases:
+            node = 0
+            for char in phrase:
+                if char not in self._goto[node]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[node][char] = len(self._goto) - 1
+                node = self._goto[node][char]
+            self._output[node].append(phrase)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find(self, text):
+        """find returns the phrases occurring in text as whole words, in order of occurrence"""
+        return [phrase for _, phrase in self.find_spans(text)]
+
+    def find_spans(self, text):
+        """find_spans returns the (start, phrase) of every phrase occurring in text as a whole word, in order of occurrence"""
+        matches = []
+        node = 0
+        for end, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for phrase in self._output[node]:
+                start = end - len(phrase) + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (end + 1 == len(text) or not text[end + 1].isalnum()):
+                    matches.append((start, phrase))
+        return matches
+
+
+_high_severity_matcher = PhraseMatcher(HIGH_SEVERITY_PHRASES)
+_medium_severity_matcher = PhraseMatcher(MEDIUM_SEVERITY_PHRASES)
+_low_severity_matcher = PhraseMatcher(LOW_SEVERITY_PHRASES)
+
+_WHITESPACE = re.compile(r"\s+")
+# Ends a clause: punctuation, or a conjunction starting another statement
+_CLAUSE_BREAK = re.compile(r"[.!?;:,()]|\b(?:but|and|so|though|although|because)\b")
+_WORD = re.compile(r"[\w']+")
+
+
+def _is_hedged(text, start):
+    """
+    _is_hedged tells if the phrase starting at start of text is quoted, or
+    preceded in its clause by a negation or third person cue
+    """
+    if text.count('"', 0, start) % 2:
+        return True
+    clause = _CLAUSE_BREAK.split(text[:start])[-1]
+    return any(word in NEGATION_CUES or word in THIRD_PERSON_CUES for word in _WORD.findall(clause))
+
+
+def _find_high_risk_phrases(text):
+    """
+    _find_high_risk_phrases returns the high severity phrases of an answer
+    stated outright, and those that are negated, quoted or about someone else
+    """
+    text = unicodedata.normalize("NFKC", str(text)).casefold()
+    for quote, replacement in (("’", "'"), ("‘", "'"), ("“", '"'), ("”", '"')):
+        text = text.replace(quote, replacement)
+    text = _WHITESPACE.sub(" ", text)
+    stated, hedged = [], []
+    for start, phrase in _high_severity_matcher.find_spans(text):
+        (hedged if _is_hedged(text, start) else stated).append(phrase)
+    return stated, hedged
+
+
+def prescreen_answer(text):
+    """
+    prescreen_answer screens an answer locally, without the LLM
+
+    Returns a high severity verdict if the answer states a high severity
+    phrase outright, a verdict of no concern if the whole answer is a benign
+    filler answer, and None if the answer has to be screened by the LLM,
+    e.g. because its high severity phrases are negated or quoted.
+    """
+    stated, hedged = _find_high_risk_phrases(text)
+    if stated:
+        return {"flag": True, "severity": "high", "reason": f"Contains high risk phrase: \"{stated[0]}\"", "source": "rules"}
+    if hedged:
+        return None
+    normalized = normalize_answer(text)
+    if normalized in BENIGN_ANSWERS:
+        return {"flag": False, "severity": "none", "reason": "Answer carries nothing to screen", "source": "rules"}
+    return None
+
+
+def classify_answer(text):
+    """
+    classify_answer screens an answer with the local rules alone, for when
+    the LLM cannot be used. Like the LLM, it leans toward flagging. Unless
+    the prescreening settles the answer, the verdict is marked provisional:
+    it is to be confirmed by the LLM.
+    """
+    verdict = prescreen_answer(text)
+    if verdict is not None:
+        return verdict
+    _, hedged = _find_high_risk_phrases(text)
+    if hedged:
+        reason = f"Contains \"{hedged[0]}\", negated, quoted or about someone else (screened locally)"
+        return {"flag": True, "severity": "medium", "reason": reason, "source": "rules", "provisional": True}
+    normalized = normalize_answer(text)
+    for severity, matcher in (("medium", _medium_severity_matcher), ("low", _low_severity_matcher)):
+        matches = matcher.find(normalized)
+        if matches:
+            reason = f"Contains \"{matches[0]}\" (screened locally)"
+            return {"flag": True, "severity": severity, "reason": reason, "source": "rules", "provisional": True}
+    return {"flag": False, "severity": "none", "reason": "No concerning phrase found (screened locally)", "source": "rules", "provisional": True}
+
+
+def prescreen_answers(answers):
+    """
+    prescreen_answers prescreens several answers and counts how many were
+    settled locally and how many have to go to the LLM
+
+    answers: list of (key, question_text, text) tuples
+
+    Returns the verdicts of the answers settled locally, keyed by key, and
+    the answers left for the LLM.
+    """
+    verdicts = {}
+    forwarded = []
+    for key, question_text, text in answers:
+        verdict = prescreen_answer(text)
+        if verdict is None:
+            forwarded.append((key, question_text, text))
+        else:
+            verdicts[key] = verdict
+
+    high = sum(verdict["flag"] for verdict in verdicts.values())
+    increment_counter(HIGH_KEY, high)
+    increment_counter(BENIGN_KEY, len(verdicts) - high)
+    increment_counter(FORWARDED_KEY, len(forwarded))
+    return verdicts, forwarded
+
+
+def get_prescreen_stats():
+    """get_prescreen_stats returns the number of answers prescreened as high severity, as benign and forwarded to the LLM"""
+    counts = cache.get_many([HIGH_KEY, BENIGN_KEY, FORWARDED_KEY])
+    return {
+        "high": counts.get(HIGH_KEY, 0),
+        "benign": counts.get(BENIGN_KEY, 0),
+        "forwarded": counts.get(FORWARDED_KEY, 0),
+    }
+
+
+def reset_prescreen_stats():
+    """reset_prescreen_stats sets the prescreening counts back to zero"""
+    cache.delete_many([HIGH_KEY, BENIGN_KEY, FORWARDED_KEY])
@@ -0,0 +1,261 @@
+"""
+Re-screening of historical text answers, e.g. after the screening prompt or
+model changed. A run splits a range of QuestionResponse ids into chunks that
+Celery tasks re-screen in parallel; every chunk records when it is done, so
+a run interrupted at any point resumes where it stopped.
+"""
+import logging
+import random
+import time
+from collections import defaultdict
+from datetime import timedelta
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Exists, Max, Min, OuterRef, Q, Sum
+from django.utils import timezone
+from .llm_services import PROMPT_VERSION, analyze_mental_health_response_batches
+from .circuit_breaker import HALF_OPEN, OPEN, acquire_llm, end_probe
+from .models import QuestionResponse, ReanalysisChunk, ReanalysisRun, ReanalysisStatus, ScreeningResult
+from .prescreening import prescreen_answers
+from .screening_backends import get_backend
+from .screening import build_screening_result
+from .tasks import _save_rescreened_results, schedule_confirmation
+
+logger = logging.getLogger("surveys")
+
+# Counts kept on every chunk, summed into the progress of the run
+CHUNK_COUNTS = ('answers', 'skipped', 'rules', 'cached', 'llm', 'failed', 'flagged')
+# Count of the answers screened by each verdict source
+SOURCE_COUNTS = {"rules": 'rules', "cache": 'cached', "llm": 'llm'}
+
+
+def _text_answers(institution_id=None):
+    answers = QuestionResponse.objects.filter(text_response__gt='')
+    if institution_id is not None:
+        answers = answers.filter(survey_response__institution_id=institution_id)
+    return answers
+
+
+def create_run(start_id=None, end_id=None, institution=None, chunk_size=None, budget=None, skip_screened=True):
+    """
+    create_run creates a reanalysis run of the text answers with a
+    QuestionResponse id in [start_id, end_id) (by default all of them), split
+    into chunks of chunk_size ids
+
+    institution: only re-screen the answers of this institution's responses
+    chunk_size: QuestionResponse ids per chunk, SCREENING_REANALYSIS_CHUNK_SIZE by default
+    budget: LLM requests per minute the run may send, SCREENING_REANALYSIS_BUDGET by default
+    skip_screened: leave out the answers already screened with the current prompt version
+
+    Returns the run, or None if there is no text answer to re-screen.
+    """
+    answers = _text_answers(institution.id if institution else None)
+    if start_id is not None:
+        answers = answers.filter(id__gte=start_id)
+    if end_id is not None:
+        answers = answers.filter(id__lt=end_id)
+    bounds = answers.aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return None
+
+    chunk_size = chunk_size or settings.SCREENING_REANALYSIS_CHUNK_SIZE
+    with transaction.atomic():
+        run = ReanalysisRun.objects.create(
+            prompt_version=PROMPT_VERSION,
+            model=get_backend().model,
+            institution=institution,
+            start_id=bounds['first'],
+            end_id=bounds['last'] + 1,
+            skip_screened=skip_screened,
+            budget=budget or settings.SCREENING_REANALYSIS_BUDGET,
+        )
+        ReanalysisChunk.objects.bulk_create(
+            [
+                ReanalysisChunk(run=run, start_id=start, end_id=min(start + chunk_size, run.end_id))
+                for start in range(run.start_id, run.end_id, chunk_size)
+            ],
+            batch_size=1000,
+        )
+    return run
+
+
+def dispatch_chunks(run, max_in_flight=None):
+    """
+    dispatch_chunks queues the next pending chunks of a run, keeping at most
+    max_in_flight (SCREENING_REANALYSIS_MAX_IN_FLIGHT by default) queued at a
+    time. Chunks queued more than SCREENING_REANALYSIS_CHUNK_TIMEOUT seconds
+    ago are taken to be lost (e.g. the worker died) and queued again.
+
+    Returns the number of chunks queued.
+    """
+    max_in_flight = max_in_flight or settings.SCREENING_REANALYSIS_MAX_IN_FLIGHT
+    stale = timezone.now() - timedelta(seconds=settings.SCREENING_REANALYSIS_CHUNK_TIMEOUT)
+    lost = ReanalysisChunk.objects.filter(run=run, status=ReanalysisStatus.QUEUED, queued__lt=stale)
+    if lost.update(status=ReanalysisStatus.PENDING):
+        logger.warning(f"Reanalysis {run.id}: queuing again chunks not done after {settings.SCREENING_REANALYSIS_CHUNK_TIMEOUT}s")
+
+    in_flight = ReanalysisChunk.objects.filter(run=run, status=ReanalysisStatus.QUEUED).count()
+    if in_flight >= max_in_flight:
+        return 0
+    chunk_ids = list(
+        ReanalysisChunk.objects
+        .filter(run=run, status=ReanalysisStatus.PENDING)
+        .order_by('start_id')
+        .values_list('id', flat=True)[:max_in_flight - in_flight]
+    )
+    ReanalysisChunk.objects.filter(id__in=chunk_ids).update(status=ReanalysisStatus.QUEUED, queued=timezone.now())
+    for chunk_id in chunk_ids:
+        reanalyze_chunk.delay(chunk_id)
+    return len(chunk_ids)
+
+
+def get_run_progress(run):
+    """
+    get_run_progress returns the number of chunks of a run in total and done,
+    and the counts of the done chunks summed (see CHUNK_COUNTS). Marks the
+    run finished once every chunk is done.
+    """
+    progress = ReanalysisChunk.objects.filter(run=run).aggregate(
+        chunks=Count('id'),
+        done=Count('id', filter=Q(status=ReanalysisStatus.DONE)),
+        **{count: Sum(count) for count in CHUNK_COUNTS},
+    )
+    progress.update({count: progress[count] or 0 for count in CHUNK_COUNTS})
+    if progress['done'] == progress['chunks'] and run.finished is None:
+        run.finished = timezone.now()
+        run.save(update_fields=['finished'])
+    return progress
+
+
+def _acquire_budget(run, requests):
+    """
+    _acquire_budget waits until requests more LLM requests fit in the run's
+    budget for the current minute. The workers of a run share one count per
+    minute, kept in the cache.
+    """
+    while True:
+        window = int(time.time() // 60)
+        key = f"reanalysis_budget_{run.id}_{window}"
+        cache.add(key, 0, timeout=120)
+        used = cache.incr(key, requests)
+        # More requests than the whole budget go through alone, in a minute of their own
+        if used <= run.budget or used == requests:
+            return
+        cache.decr(key, requests)
+        time.sleep((window + 1) * 60 - time.time() + random.uniform(0, 1))
+
+
+def _wait_for_llm():
+    """
+    _wait_for_llm waits while the LLM circuit breaker is open, and returns
+    whether the LLM is to be used normally (CLOSED) or as the probe of its
+    recovery (HALF_OPEN)
+    """
+    while True:
+        state = acquire_llm()
+        if state != OPEN:
+            return state
+        time.sleep(settings.SCREENING_BREAKER_COOLDOWN / 4 + random.uniform(0, 1))
+
+
+def _screen(run, answer_sets):
+    """
+    _screen screens the answers of several survey responses with the LLM,
+    SCREENING_LLM_CONCURRENCY batches at a time, within the run's budget and
+    pausing while the LLM circuit breaker is open
+
+    answer_sets: dict of survey response id to its (key, question_text, text) answers
+
+    Returns the verdicts, keyed by answer key.
+    """
+    batch_size = settings.SURVEY_ANALYSIS_BATCH_SIZE
+    batches = [
+        answers[start:start + batch_size]
+        for answers in answer_sets.values()
+        for start in range(0, len(answers), batch_size)
+    ]
+    verdicts = {}
+    step = settings.SCREENING_LLM_CONCURRENCY
+    for start in range(0, len(batches), step):
+        state = _wait_for_llm()
+        # A request per batch; cached verdicts need none, answers a reply
+        # leaves out need one more each
+        _acquire_budget(run, len(batches[start:start + step]))
+        screened = {}
+        for batch_verdicts in analyze_mental_health_response_batches(batches[start:start + step]):
+            screened.update(batch_verdicts)
+        if state == HALF_OPEN and end_probe(screened.values()):
+            schedule_confirmation(countdown=0)
+        verdicts.update(screened)
+    return verdicts
+
+
+@shared_task(acks_late=True)
+def reanalyze_chunk(chunk_id):
+    """
+    Re-screen the text answers of a reanalysis chunk, store their verdicts,
+    update the severity of their survey responses and flag the responses
+    found concerning. Responses are never unflagged: a flag may already
+    have been acted on.
+    """
+    chunk = ReanalysisChunk.objects.select_related('run').get(id=chunk_id)
+    run = chunk.run
+    if chunk.status == ReanalysisStatus.DONE:
+        return
+    model = get_backend().model
+    if run.prompt_version != PROMPT_VERSION or run.model != model:
+        # A worker running other prompts or another model than the run (e.g.
+        # mid-deploy) leaves the chunk to be queued again once it times out
+        logger.error(
+            f"Reanalysis {run.id} uses prompt version {run.prompt_version} and model {run.model!r}, "
+            f"this worker {PROMPT_VERSION} and {model!r}"
+        )
+        return
+
+    rows = _text_answers(run.institution_id).filter(id__gte=chunk.start_id, id__lt=chunk.end_id)
+    if run.skip_screened:
+        rows = rows.annotate(screened=Exists(
+            ScreeningResult.objects.filter(
+                question_response=OuterRef('pk'), prompt_version=run.prompt_version, model=run.model,
+            )
+        ))
+    rows = rows.values(
+        'id', 'text_response', 'question__question_text', 'survey_response_id',
+        'survey_response__institution_id', *(['screened'] if run.skip_screened else []),
+    )
+
+    counts = dict.fromkeys(CHUNK_COUNTS, 0)
+    answers = []
+    survey_responses = {}
+    for row in rows:
+        counts['answers'] += 1
+        if row.get('screened'):
+            counts['skipped'] += 1
+            continue
+        # Answers are keyed by QuestionResponse id
+        answers.append((row['id'], row['question__question_text'], row['text_response']))
+        survey_responses[row['id']] = (row['survey_response_id'], row['survey_response__institution_id'])
+
+    verdicts = {}
+    if settings.SCREENING_PRESCREEN_ENABLED:
+        verdicts, answers = prescreen_answers(answers)
+    answer_sets = defaultdict(list)
+    for answer in answers:
+        answer_sets[survey_responses[answer[0]][0]].append(answer)
+    verdicts.update(_screen(run, answer_sets))
+
+    results = []
+    for question_response_id, verdict in verdicts.items():
+        if verdict.get("error"):
+            counts['failed'] += 1
+            continue
+        counts[SOURCE_COUNTS[verdict["source"]]] += 1
+        survey_response_id, institution_id = survey_responses[question_response_id]
+        results.append(build_screening_result(question_response_id, survey_response_id, institution_id, verdict))
+
+    with transaction.atomic():
+        counts['flagged'] = _save_rescreened_results(results)
+        ReanalysisChunk.objects.filter(id=chunk.id).update(status=ReanalysisStatus.DONE, finished=timezone.now(), **counts)
+    return counts
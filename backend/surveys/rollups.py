@@ -0,0 +1,143 @@
+from collections import Counter, defaultdict
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import SurveyResponse, QuestionResponse, DailyResponseRollup, DailyLikertRollup
+
+
+def _increment(model, keys, **deltas):
+    """
+    _increment adds deltas to the counters of the rollup row identified by
+    keys, creating the row if it does not exist yet
+
+    model: rollup model to update
+    keys: lookup identifying a single rollup row
+    deltas: counter field name -> amount to add
+    """
+    increments = {field: F(field) + delta for field, delta in deltas.items()}
+    # The row usually exists already, making this a single UPDATE
+    if model.objects.filter(**keys).update(**increments):
+        return
+    row, created = model.objects.get_or_create(**keys, defaults=deltas)
+    if not created:
+        model.objects.filter(pk=row.pk).update(**increments)
+
+
+def _is_first_response_of_month(survey_response):
+    """
+    _is_first_response_of_month checks whether a newly created response is its
+    respondent's first one in the calendar month it was submitted in
+    """
+    if survey_response.student_id:
+        respondent = {'student_id': survey_response.student_id}
+    else:
+        respondent = {'anonymous_student_id': survey_response.anonymous_student_id}
+    created = timezone.localtime(survey_response.created)
+    return not SurveyResponse.objects.filter(
+        created__year=created.year,
+        created__month=created.month,
+        **respondent,
+    ).exclude(pk=survey_response.pk).exists()
+
+
+def record_survey_response(survey_response, question_responses):
+    """
+    record_survey_response adds a newly submitted survey response to the daily
+    rollups of its institution. Must be called once, after the response and its
+    question responses have been saved.
+
+    survey_response: the saved SurveyResponse
+    question_responses: the QuestionResponse objects saved with it
+    """
+    institution_id = survey_response.institution_id
+    if institution_id is None:
+        return
+
+    day = timezone.localdate(survey_response.created)
+    _increment(
+        DailyResponseRollup,
+        {'institution_id': institution_id, 'day': day},
+        num_responses=1,
+        num_respondents=1 if _is_first_response_of_month(survey_response) else 0,
+    )
+
+    likert_counts = Counter(
+        (question_response.question.category, question_response.likert_value)
+        for question_response in question_responses
+        if question_response.likert_value is not None
+    )
+    for (category, likert_value), count in likert_counts.items():
+        _increment(
+            DailyLikertRollup,
+            {'institution_id': institution_id, 'day': day, 'category': category, 'likert_value': likert_value},
+            count=count,
+        )
+
+
+def _rollup_models(apps):
+    """
+    _rollup_models returns the SurveyResponse, QuestionResponse and rollup
+    models, from the app registry of a data migration (historical models) or
+    the current ones when apps is None
+    """
+    if apps is None:
+        return SurveyResponse, QuestionResponse, DailyResponseRollup, DailyLikertRollup
+    return tuple(
+        apps.get_model('surveys', name)
+        for name in ('SurveyResponse', 'QuestionResponse', 'DailyResponseRollup', 'DailyLikertRollup')
+    )
+
+
+@transaction.atomic
+def rebuild_rollups(institution, apps=None):
+    """
+    rebuild_rollups recomputes every daily rollup row of an institution from
+    the raw SurveyResponse and QuestionResponse tables
+
+    institution: institution whose rollups are rebuilt
+    apps: app registry of the data migration calling it, None otherwise
+    """
+    SurveyResponse, QuestionResponse, DailyResponseRollup, DailyLikertRollup = _rollup_models(apps)
+    DailyResponseRollup.objects.filter(institution_id=institution.id).delete()
+    DailyLikertRollup.objects.filter(institution_id=institution.id).delete()
+
+    responses = SurveyResponse.objects.filter(institution_id=institution.id)
+
+    # Walk responses chronologically so each respondent is counted on the day
+    # of their first response of every month
+    daily = defaultdict(Counter)
+    seen_respondent_months = set()
+    rows = responses.order_by('created', 'id').values_list(
+        'created', 'student_id', 'anonymous_student_id'
+    )
+    for created, student_id, anonymous_student_id in rows.iterator(chunk_size=2000):
+        created = timezone.localtime(created)
+        counters = daily[created.date()]
+        counters['num_responses'] += 1
+        respondent_month = (student_id, anonymous_student_id, created.year, created.month)
+        if respondent_month not in seen_respondent_months:
+            seen_respondent_months.add(respondent_month)
+            counters['num_respondents'] += 1
+
+    DailyResponseRollup.objects.bulk_create([
+        DailyResponseRollup(institution_id=institution.id, day=day, **counters)
+        for day, counters in daily.items()
+    ], batch_size=1000)
+
+    likert_rows = (
+        QuestionResponse.objects.filter(survey_response__in=responses, likert_value__isnull=False)
+        .annotate(day=TruncDate('survey_response__created'))
+        .values('day', 'question__category', 'likert_value')
+        .annotate(count=Count('id'))
+    )
+    DailyLikertRollup.objects.bulk_create([
+        DailyLikertRollup(
+            institution_id=institution.id,
+            day=row['day'],
+            category=row['question__category'],
+            likert_value=row['likert_value'],
+            count=row['count'],
+        )
+        for row in likert_rows
+    ], batch_size=1000)
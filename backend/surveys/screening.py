@@ -0,0 +1,93 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models.functions import Greatest
+from .models import ScreeningResult, ScreeningSeverity, SurveyResponse, LatestResponse
+
+SEVERITIES = {
+    "none": ScreeningSeverity.NONE,
+    "low": ScreeningSeverity.LOW,
+    "medium": ScreeningSeverity.MEDIUM,
+    "high": ScreeningSeverity.HIGH,
+}
+
+
+def build_screening_result(question_response_id, survey_response_id, institution_id, verdict):
+    """build_screening_result returns the (unsaved) ScreeningResult storing a verdict"""
+    return ScreeningResult(
+        question_response_id=question_response_id,
+        survey_response_id=survey_response_id,
+        institution_id=institution_id,
+        severity=SEVERITIES[verdict["severity"]],
+        flagged=verdict["flag"],
+        reason=verdict["reason"],
+        source=verdict["source"],
+        model=verdict.get("model", ""),
+        prompt_version=verdict.get("prompt_version", ""),
+        latency_ms=verdict.get("latency_ms"),
+        provisional=verdict.get("provisional", False),
+    )
+
+
+def save_screening_results(survey_response_id, institution_id, verdicts, question_response_ids):
+    """
+    save_screening_results stores the screening verdicts of a survey
+    response's answers in one bulk INSERT and records the highest severity
+    found on the response and on its respondent's latest response. Verdicts
+    of failed screenings are not stored; while any answer failed, the
+    recorded severity can only go up.
+
+    survey_response_id: id of the screened SurveyResponse
+    institution_id: id of the response's institution
+    verdicts: dict of question id to verdict, as returned by the screening
+    question_response_ids: dict of question id to the id of the QuestionResponse answering it
+
+    Returns the highest severity found.
+    """
+    results = [
+        build_screening_result(question_response_ids[question_id], survey_response_id, institution_id, verdict)
+        for question_id, verdict in verdicts.items()
+        if not verdict.get("error")
+    ]
+    severity = max((result.severity for result in results), default=ScreeningSeverity.NONE)
+    if any(verdict.get("error") for verdict in verdicts.values()):
+        new_severity = Greatest('screening_severity', severity)
+    else:
+        new_severity = severity
+
+    with transaction.atomic():
+        ScreeningResult.objects.bulk_create(results)
+        SurveyResponse.objects.filter(id=survey_response_id).update(screening_severity=new_severity)
+        LatestResponse.objects.filter(survey_response_id=survey_response_id).update(screening_severity=new_severity)
+    return severity
+
+
+def refresh_screening_severities(survey_response_ids):
+    """
+    refresh_screening_severities recomputes the severity recorded on survey
+    responses (and on their respondents' latest responses) from the latest
+    stored result of each of their answers, e.g. after some of their answers
+    were screened again. Returns the severity of each response, keyed by id.
+    """
+    latest = {}
+    results = (
+        ScreeningResult.objects
+        .filter(survey_response_id__in=survey_response_ids)
+        .order_by('question_response_id', 'id')
+        .values_list('question_response_id', 'survey_response_id', 'severity')
+    )
+    for question_response_id, survey_response_id, severity in results:
+        latest[question_response_id] = (survey_response_id, severity)
+
+    severities = dict.fromkeys(survey_response_ids, ScreeningSeverity.NONE)
+    for survey_response_id, severity in latest.values():
+        severities[survey_response_id] = max(severities[survey_response_id], severity)
+
+    # One UPDATE per severity rather than one per response
+    by_severity = defaultdict(list)
+    for survey_response_id, severity in severities.items():
+        by_severity[severity].append(survey_response_id)
+    with transaction.atomic():
+        for severity, ids in by_severity.items():
+            SurveyResponse.objects.filter(id__in=ids).update(screening_severity=severity)
+            LatestResponse.objects.filter(survey_response_id__in=ids).update(screening_severity=severity)
+    return severities
@@ -0,0 +1,123 @@
+"""
+Backends screening the text answers the prescreening does not settle,
+selected with SCREENING_BACKEND. Chat completions backends (the OpenAI API,
+or the deterministic fake LLM of manage.py screening_stub_server) are sent
+the screening prompts; the rules backend screens locally. Each backend
+counts its requests, latency, tokens and cost.
+"""
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from .caching import increment_counter
+from .prescreening import classify_answer
+
+# Counts kept per backend; cost is in millionths of a dollar
+STATS = ('answers', 'requests', 'errors', 'latency_ms', 'prompt_tokens', 'completion_tokens', 'cost_microdollars')
+
+
+class ChatCompletionsBackend:
+    """
+    ChatCompletionsBackend screens answers with a model served over the
+    chat completions protocol, priced in dollars per million input and
+    output tokens
+    """
+    uses_llm = True
+
+    def __init__(self, name, model, base_url, api_key, input_cost=0.0, output_cost=0.0):
+        self.name = name
+        self.model = model
+        self.base_url = base_url
+        self.api_key = api_key
+        self.input_cost = input_cost
+        self.output_cost = output_cost
+
+    def cost_microdollars(self, prompt_tokens, completion_tokens):
+        # Dollars per million tokens are millionths of a dollar per token
+        return round(prompt_tokens * self.input_cost + completion_tokens * self.output_cost)
+
+
+class RulesBackend:
+    """RulesBackend screens answers locally with the phrase rules of surveys/prescreening.py"""
+    uses_llm = False
+    name = 'rules'
+    model = ''
+
+    def screen(self, text):
+        verdict = classify_answer(text)
+        verdict.pop("provisional", None)
+        return verdict
+
+
+def _openai_backend():
+    return ChatCompletionsBackend(
+        'openai',
+        settings.SCREENING_LLM_MODEL,
+        settings.OPENAI_BASE_URL,
+        settings.OPENAI_API_KEY,
+        input_cost=settings.SCREENING_LLM_INPUT_COST,
+        output_cost=settings.SCREENING_LLM_OUTPUT_COST,
+    )
+
+
+def _fake_backend():
+    return ChatCompletionsBackend('fake', 'fake-screening-model', settings.SCREENING_FAKE_LLM_URL, 'fake')
+
+
+# Name of each backend and the function creating it
+BACKENDS = {
+    'openai': _openai_backend,
+    'fake': _fake_backend,
+    'rules': RulesBackend,
+}
+
+_backends = {}
+_override = None
+
+
+def get_backend(name=None):
+    """get_backend returns the screening backend with the given name, SCREENING_BACKEND by default"""
+    if name is None and _override is not None:
+        return _override
+    name = name or settings.SCREENING_BACKEND
+    if name not in _backends:
+        if name not in BACKENDS:
+            raise ImproperlyConfigured(f"Unknown screening backend: {name}")
+        _backends[name] = BACKENDS[name]()
+    return _backends[name]
+
+
+@contextmanager
+def override_backend(backend):
+    """override_backend makes get_backend return the given backend instead of that of SCREENING_BACKEND, e.g. in a benchmark"""
+    global _override
+    previous, _override = _override, backend
+    try:
+        yield backend
+    finally:
+        _override = previous
+
+
+def _stats_key(name, stat):
+    return f"screening_backend_{name}_{stat}"
+
+
+def record_backend_stats(name, **counts):
+    """record_backend_stats adds to the counts of a backend (see STATS)"""
+    for stat, amount in counts.items():
+        increment_counter(_stats_key(name, stat), amount)
+
+
+def get_backend_stats():
+    """get_backend_stats returns the counts of every backend that has screened answers, keyed by backend name"""
+    keys = {(name, stat): _stats_key(name, stat) for name in BACKENDS for stat in STATS}
+    found = cache.get_many(list(keys.values()))
+    stats = {}
+    for (name, stat), key in keys.items():
+        stats.setdefault(name, {})[stat] = found.get(key, 0)
+    return {name: counts for name, counts in stats.items() if counts['answers'] or counts['requests']}
+
+
+def reset_backend_stats():
+    """reset_backend_stats sets the counts of every backend back to zero"""
+    cache.delete_many([_stats_key(name, stat) for name in BACKENDS for stat in STATS])
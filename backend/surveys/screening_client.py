@@ -0,0 +1,172 @@
+"""
+Asyncio engine for the screening requests to the LLM. A Celery task hands it
+coroutines to run, so one worker process keeps many requests in flight over
+a single pooled HTTP client instead of blocking on one request at a time.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+import httpx
+import openai
+from django.conf import settings
+
+logger = logging.getLogger("surveys")
+
+# Errors worth retrying: the request may succeed if sent again later
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+class _Engine:
+    """
+    _Engine is the event loop of the process, run in a background thread,
+    with a client per screening API, the semaphore bounding the requests
+    in flight and the counts of the requests sent since take_stats
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=self.loop.run_forever, name="screening-engine", daemon=True)
+        thread.start()
+        self.clients = {}
+        self.semaphore = None
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+    def setup(self):
+        # Runs on the engine loop, which the clients and semaphore belong to
+        self.semaphore = asyncio.Semaphore(settings.SCREENING_LLM_CONCURRENCY)
+
+    def get_client(self, backend):
+        """get_client returns the client of the API of a backend, creating it on first use. Must be called on the engine loop."""
+        key = (backend.base_url, backend.api_key)
+        if key not in self.clients:
+            concurrency = settings.SCREENING_LLM_CONCURRENCY
+            self.clients[key] = openai.AsyncOpenAI(
+                api_key=backend.api_key,
+                base_url=backend.base_url,
+                timeout=settings.SCREENING_LLM_TIMEOUT,
+                # Retries are made by create_completion, outside of the concurrency limit
+                max_retries=0,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+                    timeout=settings.SCREENING_LLM_TIMEOUT,
+                ),
+            )
+        return self.clients[key]
+
+    def count(self, backend, **counts):
+        with self.stats_lock:
+            self.stats.setdefault(backend.name, Counter()).update(counts)
+
+
+def _get_engine():
+    """_get_engine returns the engine of the current process, starting it on first use"""
+    global _engine
+    # A forked Celery worker does not inherit the parent's loop thread
+    if _engine is None or _engine.pid != os.getpid():
+        with _engine_lock:
+            if _engine is None or _engine.pid != os.getpid():
+                engine = _Engine()
+                asyncio.run_coroutine_threadsafe(_setup(engine), engine.loop).result()
+                _engine = engine
+    return _engine
+
+
+async def _setup(engine):
+    engine.setup()
+
+
+def run_screening(coroutine):
+    """
+    run_screening runs a coroutine on the screening engine and returns its
+    result, blocking the calling (sync) code until it is done
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, _get_engine().loop).result()
+
+
+def _retry_delay(attempt, error):
+    """_retry_delay returns the seconds to wait before retrying: the server's Retry-After, or exponential backoff with jitter"""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), settings.SCREENING_LLM_MAX_BACKOFF)
+        except ValueError:
+            pass
+    backoff = settings.SCREENING_LLM_RETRY_BACKOFF * 2 ** attempt
+    return min(backoff, settings.SCREENING_LLM_MAX_BACKOFF) * random.uniform(0.5, 1)
+
+
+def take_stats():
+    """
+    take_stats returns the counts of the requests the process sent to each
+    backend since the last call ({backend name: Counter of requests, errors,
+    latency_ms, prompt_tokens, completion_tokens and cost_microdollars}) and
+    starts counting again
+    """
+    engine = _get_engine()
+    with engine.stats_lock:
+        stats, engine.stats = engine.stats, {}
+    return stats
+
+
+async def _send(engine, backend, kwargs):
+    """_send sends one chat completion request to a backend and counts it"""
+    started = time.monotonic()
+    try:
+        response = await engine.get_client(backend).chat.completions.create(model=backend.model, **kwargs)
+    except Exception:
+        engine.count(backend, requests=1, errors=1, latency_ms=round((time.monotonic() - started) * 1000))
+        raise
+    usage = getattr(response, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    engine.count(
+        backend,
+        requests=1,
+        latency_ms=round((time.monotonic() - started) * 1000),
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cost_microdollars=backend.cost_microdollars(prompt_tokens, completion_tokens),
+    )
+    return response
+
+
+async def create_completion(backend, **kwargs):
+    """
+    create_completion sends a chat completion request to the model of a
+    screening backend (see surveys/screening_backends.py) with at most
+    SCREENING_LLM_CONCURRENCY requests of the process in flight, each limited
+    to SCREENING_LLM_TIMEOUT seconds. Timeouts, connection errors, rate
+    limiting and server errors are retried up to SCREENING_LLM_MAX_RETRIES
+    times with backoff; the last error is raised.
+
+    Must be awaited on the screening engine (see run_screening).
+    """
+    engine = _get_engine()
+    attempt = 0
+    while True:
+        try:
+            async with engine.semaphore:
+                return await _send(engine, backend, kwargs)
+        except RETRYABLE_ERRORS as e:
+            if attempt >= settings.SCREENING_LLM_MAX_RETRIES:
+                raise
+            delay = _retry_delay(attempt, e)
+            logger.warning(f"Screening request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            attempt += 1
+            # Wait without holding a concurrency slot
+            await asyncio.sleep(delay)
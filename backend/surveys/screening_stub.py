@@ -0,0 +1,125 @@
+"""
+Fake LLM serving the chat completions API for the 'fake' screening backend,
+so load tests and benchmarks of the screening run without network access
+or API costs. Its verdicts are the deterministic ones of the local phrase
+rules; latency, server errors and rate limiting can be injected.
+"""
+import json
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .prescreening import classify_answer
+
+ANSWER_PATTERN = re.compile(r'Response: "(.*)"\n\nFlag as concerning', re.S)
+
+
+def _verdict(text):
+    verdict = classify_answer(text)
+    return {"flag": verdict["flag"], "severity": verdict["severity"], "reason": verdict["reason"]}
+
+
+def fake_screening_reply(prompt):
+    """
+    fake_screening_reply returns what the fake LLM replies to a screening
+    prompt (see surveys/llm_services.py): the verdict of its answer, or the
+    verdicts of its answers for the batch prompt
+    """
+    if "Answers:\n" in prompt:
+        answers, _ = json.JSONDecoder().raw_decode(prompt.split("Answers:\n", 1)[1])
+        return json.dumps({"results": [{"id": answer["id"], **_verdict(answer["response"])} for answer in answers]})
+    match = ANSWER_PATTERN.search(prompt)
+    return json.dumps(_verdict(match.group(1) if match else ""))
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    StubServer answers POST /v1/chat/completions like the OpenAI API, after
+    latency milliseconds plus up to jitter more (the same for the same
+    request). Every error_every-th request fails with a 500 and every
+    rate_limit_every-th with a 429, unless they are 0.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, latency=0, jitter=0, error_every=0, rate_limit_every=0):
+        super().__init__(address, _StubHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_every = error_every
+        self.rate_limit_every = rate_limit_every
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0}
+
+    def next_outcome(self):
+        """next_outcome counts a request and returns the status it is to be answered with"""
+        with self.lock:
+            self.stats["requests"] += 1
+            number = self.stats["requests"]
+            if self.error_every and number % self.error_every == 0:
+                self.stats["errors"] += 1
+                return 500
+            if self.rate_limit_every and number % self.rate_limit_every == 0:
+                self.stats["rate_limited"] += 1
+                return 429
+        return 200
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            with self.server.lock:
+                self._send_json(200, dict(self.server.stats))
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        server = self.server
+        delay = server.latency + server.jitter * (zlib.crc32(body) % 1000) / 1000
+        time.sleep(delay / 1000)
+        status = server.next_outcome()
+        if status == 500:
+            self._send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+            return
+        if status == 429:
+            self._send_json(429, {"error": {"message": "Injected rate limit", "type": "rate_limit_error"}}, [("Retry-After", "1")])
+            return
+
+        request = json.loads(body)
+        prompt = request["messages"][-1]["content"]
+        content = fake_screening_reply(prompt)
+        # Roughly four characters a token
+        prompt_tokens = sum(len(message["content"]) for message in request["messages"]) // 4
+        completion_tokens = len(content) // 4
+        self._send_json(200, {
+            "id": f"chatcmpl-stub-{zlib.crc32(body)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", ""),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
@@ -17,7 +17,7 @@ class SurveyResponseSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = SurveyResponse
-        fields = ['id', 'student', 'anonymous_student', 'survey_template', 'created', 'flagged', 'question_responses']
+        fields = ['id', 'student', 'anonymous_student', 'survey_template', 'created', 'flagged', 'screening_severity', 'question_responses']
 
 class SurveyTemplateSerializer(serializers.ModelSerializer):
     questions = SurveyQuestionSerializer(many=True, read_only=True)
@@ -39,4 +39,47 @@ class InstitutionSerializer(serializers.ModelSerializer):
 class AnonymousStudentSerializer(serializers.ModelSerializer):
     class Meta:
         model = AnonymousStudent
-        fields = "__all__"
\ No newline at end of file
+        fields = "__all__"
+
+
+# Fields of the response rows passed to serialize_survey_responses, in the
+# order SurveyResponseSerializer outputs them
+SURVEY_RESPONSE_FIELDS = ['id', 'student', 'anonymous_student', 'survey_template', 'created', 'flagged', 'screening_severity']
+
+_created_field = serializers.DateTimeField()
+
+
+def serialize_survey_responses(response_rows, batch_size=2000):
+    """
+    serialize_survey_responses is a read-only fast path producing the same
+    output as SurveyResponseSerializer(responses, many=True).data. Question
+    responses are fetched in bulk (one query per batch_size responses instead
+    of one per response) and everything is built as plain dicts, skipping the
+    per-object ModelSerializer machinery.
+
+    response_rows: SurveyResponse rows from .values(*SURVEY_RESPONSE_FIELDS)
+    batch_size: maximum number of response ids per question response query
+    """
+    responses = []
+    responses_by_id = {}
+    for row in response_rows:
+        response = dict(row)
+        response['created'] = _created_field.to_representation(response['created'])
+        response['question_responses'] = []
+        responses.append(response)
+        responses_by_id[response['id']] = response
+
+    response_ids = list(responses_by_id)
+    for start in range(0, len(response_ids), batch_size):
+        question_responses = QuestionResponse.objects.filter(
+            survey_response_id__in=response_ids[start:start + batch_size]
+        ).order_by('id').values_list('id', 'survey_response_id', 'question_id', 'likert_value', 'text_response')
+        for question_response_id, survey_response_id, question_id, likert_value, text_response in question_responses:
+            responses_by_id[survey_response_id]['question_responses'].append({
+                'id': question_response_id,
+                'question': question_id,
+                'likert_value': likert_value,
+                'text_response': text_response,
+            })
+
+    return responses
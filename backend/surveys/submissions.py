@@ -0,0 +1,105 @@
+from django.db import IntegrityError, transaction
+from .models import SurveyResponse, QuestionResponse, QuestionType
+from .rollups import record_survey_response
+from .latest_responses import record_latest_response
+from .analytics import invalidate_dashboard
+from .tasks import queue_survey_analysis
+
+# Likert answers at or above this value flag the response on submission
+LIKERT_FLAG_THRESHOLD = 3
+
+
+def build_question_responses(questions, answers):
+    """
+    build_question_responses turns the submitted answers into unsaved
+    QuestionResponse objects and decides whether the Likert answers flag the
+    submission
+
+    questions: SurveyQuestion objects of the survey template
+    answers: mapping of question id (as a string) to the submitted answer
+
+    Returns the QuestionResponse objects and whether the submission is flagged.
+    Raises ValueError for Likert answers that are not an integer from 1 to 5.
+    """
+    should_flag = False
+    question_responses = []
+    for question in questions:
+        response_value = answers.get(str(question.id))
+
+        if question.question_type == QuestionType.LIKERT:
+            likert_value = int(response_value)
+            if not 1 <= likert_value <= 5:
+                raise ValueError(f"Likert answer to question {question.id} must be between 1 and 5")
+            text_response = None
+            if likert_value >= LIKERT_FLAG_THRESHOLD:
+                should_flag = True
+        else:
+            likert_value = None
+            text_response = response_value
+
+        question_responses.append(QuestionResponse(
+            question=question,
+            likert_value=likert_value,
+            text_response=text_response,
+        ))
+    return question_responses, should_flag
+
+
+def persist_submission(survey_template, questions, answers, student=None, anonymous_student=None, idempotency_key=None):
+    """
+    persist_submission saves a survey submission in a single transaction: the
+    SurveyResponse (already carrying its Likert flag), all of its question
+    responses in one bulk INSERT, and the dashboard rollup and latest response
+    updates. Nothing is left behind if any step fails. The text analysis task
+    is queued once the transaction commits, so the worker always finds the
+    response.
+
+    survey_template: SurveyTemplate the submission answers
+    questions: SurveyQuestion objects of the template
+    answers: mapping of question id (as a string) to the submitted answer
+    student: registered student submitting the survey
+    anonymous_student: anonymous student submitting the survey (when student is None)
+    idempotency_key: digest of the submission's idempotency key, if it has one
+
+    Returns the saved SurveyResponse. If a response with the same idempotency
+    key already exists, nothing is saved and that response is returned.
+    """
+    question_responses, should_flag = build_question_responses(questions, answers)
+
+    if student is not None:
+        respondent = {'student': student, 'institution_id': student.institution_details_id}
+    else:
+        # Anonymous students belong to the institution of the template they first answered
+        respondent = {
+            'anonymous_student': anonymous_student,
+            'institution_id': (anonymous_student.survey_template or survey_template).institution_id,
+        }
+
+    try:
+        with transaction.atomic():
+            survey_response = SurveyResponse.objects.create(
+                survey_template=survey_template,
+                flagged=should_flag,
+                idempotency_key=idempotency_key,
+                **respondent,
+            )
+            for question_response in question_responses:
+                question_response.survey_response = survey_response
+            QuestionResponse.objects.bulk_create(question_responses)
+
+            # Add the response to the institution's dashboard rollups and make it
+            # the respondent's latest response
+            record_survey_response(survey_response, question_responses)
+            record_latest_response(survey_response)
+            invalidate_dashboard(survey_response.institution_id)
+
+            question_ids = [question.id for question in questions]
+            transaction.on_commit(lambda: queue_survey_analysis(survey_response.id, question_ids))
+    except IntegrityError:
+        # A concurrent retry of the same submission was saved first
+        existing = SurveyResponse.objects.filter(idempotency_key=idempotency_key).first() if idempotency_key else None
+        if existing is None:
+            raise
+        return existing
+
+    return survey_response
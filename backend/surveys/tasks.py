@@ -1,31 +1,432 @@
+import json
+import logging
+import time
 from celery import shared_task
-from .llm_services import analyze_mental_health_responses
-from .models import SurveyResponse, QuestionResponse, SurveyQuestion
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django_redis import get_redis_connection
+from .circuit_breaker import HALF_OPEN, OPEN, acquire_llm, end_probe
+from .llm_services import analyze_mental_health_responses, analyze_mental_health_response_batches
+from .prescreening import classify_answer, prescreen_answers
+from .screening import SEVERITIES, build_screening_result, refresh_screening_severities, save_screening_results
+from .models import Institution, SurveyResponse, QuestionResponse, QuestionType, ScreeningResult
+from .analytics import invalidate_dashboard
+from .rollups import rebuild_rollups
+from .latest_responses import record_latest_flag, record_latest_unflag, rebuild_latest_responses
+
+logger = logging.getLogger("surveys")
+
+# Set while a drain of the pending analysis list is queued, so a burst of
+# submissions queues one drain
+ANALYSIS_DRAIN_SCHEDULED_KEY = "survey_analysis_drain_scheduled"
+# Set while a confirmation of provisional verdicts is queued
+CONFIRMATION_SCHEDULED_KEY = "screening_confirmation_scheduled"
+
+# Verdict severities that flag a survey response
+FLAG_SEVERITIES = ('high', 'medium')
+
+
+def _is_concerning(verdict):
+    return bool(verdict.get('flag')) and verdict.get('severity') in FLAG_SEVERITIES
+
+
+def _flag_survey_response(survey_response):
+    """
+    _flag_survey_response flags a survey response and updates the dashboard
+    counts, unless it is flagged already
+
+    survey_response: SurveyResponse with at least its institution field loaded
+    """
+    with transaction.atomic():
+        flipped = SurveyResponse.objects.filter(id=survey_response.id, flagged=False).update(
+            flagged=True,
+        )
+        if flipped:
+            record_latest_flag(survey_response.id)
+            invalidate_dashboard(survey_response.institution_id)
+
+
+def _unflag_overturned(survey_response_ids):
+    """
+    _unflag_overturned clears the flag of the survey responses that were
+    flagged by provisional local verdicts only, which the LLM has since
+    overturned: none of the latest verdicts of their answers is concerning,
+    no verdict stored other than provisionally flagged them and no Likert
+    answer flags them. Returns the number of responses unflagged.
+
+    survey_response_ids: ids of the survey responses whose answers were screened again
+    """
+    # submissions imports this module
+    from .submissions import LIKERT_FLAG_THRESHOLD
+
+    concerning = [SEVERITIES[severity] for severity in FLAG_SEVERITIES]
+    verdicts = ScreeningResult.objects.filter(survey_response_id=OuterRef('pk'), flagged=True, severity__in=concerning)
+    likert_flags = QuestionResponse.objects.filter(
+        survey_response_id=OuterRef('pk'),
+        question__question_type=QuestionType.LIKERT,
+        likert_value__gte=LIKERT_FLAG_THRESHOLD,
+    )
+    overturned = (
+        SurveyResponse.objects
+        .filter(id__in=survey_response_ids, flagged=True, screening_severity__lt=min(concerning))
+        .filter(Exists(verdicts.filter(provisional=True)))
+        .exclude(Exists(verdicts.filter(provisional=False)))
+        .exclude(Exists(likert_flags))
+        .only('institution')
+    )
+    unflagged = 0
+    with transaction.atomic():
+        for survey_response in overturned:
+            if SurveyResponse.objects.filter(id=survey_response.id, flagged=True).update(flagged=False):
+                record_latest_unflag(survey_response.id)
+                invalidate_dashboard(survey_response.institution_id)
+                unflagged += 1
+    return unflagged
+
+
+def _screen_answer_sets(answer_sets):
+    """
+    _screen_answer_sets screens the text answers of several survey responses
+    and returns the verdicts of each, keyed by question id. In the batched
+    analysis mode the answers go to the model in concurrent requests of up to
+    SURVEY_ANALYSIS_BATCH_SIZE answers of one response; in the per_question
+    mode one at a time, stopping at the first concerning answer of a response.
+
+    answer_sets: list of lists of (question_id, question_text, text) tuples
+    """
+    if settings.SURVEY_ANALYSIS_MODE == 'per_question':
+        results = []
+        for answers in answer_sets:
+            verdicts = {}
+            for question_id, question_text, text in answers:
+                verdicts[question_id] = analyze_mental_health_responses(text=text, question_text=question_text)
+                if _is_concerning(verdicts[question_id]):
+                    break
+            results.append(verdicts)
+        return results
+
+    batch_size = settings.SURVEY_ANALYSIS_BATCH_SIZE
+    batches = []
+    owners = []
+    for index, answers in enumerate(answer_sets):
+        for start in range(0, len(answers), batch_size):
+            batches.append(answers[start:start + batch_size])
+            owners.append(index)
+    results = [{} for _ in answer_sets]
+    for index, batch_verdicts in zip(owners, analyze_mental_health_response_batches(batches)):
+        results[index].update(batch_verdicts)
+    return results
+
+
+def _screen_with_fallback(answer_sets):
+    """
+    _screen_with_fallback screens the text answers of several survey
+    responses (see _screen_answer_sets) unless the LLM circuit breaker is
+    open. The answers left to the local classifier, all of them while the
+    breaker is open and those the LLM failed to screen, get provisional
+    verdicts, which the LLM confirms later.
+    """
+    if not any(answer_sets):
+        return [{} for _ in answer_sets]
+
+    state = acquire_llm()
+    if state == OPEN:
+        screened_sets = [{} for _ in answer_sets]
+    else:
+        screened_sets = _screen_answer_sets(answer_sets)
+        if state == HALF_OPEN and end_probe([verdict for screened in screened_sets for verdict in screened.values()]):
+            schedule_confirmation(countdown=0)
+
+    provisional = False
+    for answers, screened in zip(answer_sets, screened_sets):
+        for question_id, _, text in answers:
+            if state == OPEN or screened.get(question_id, {}).get("error"):
+                screened[question_id] = classify_answer(text)
+                provisional = provisional or screened[question_id].get("provisional", False)
+    if provisional:
+        schedule_confirmation()
+    return screened_sets
+
+
+def _load_answers(pending):
+    """
+    _load_answers loads the text answers to screen of several survey
+    responses, with their question texts, in one joined query
+
+    pending: list of (response_id, question_ids) tuples
+
+    Returns, keyed by response id, the (question_id, question_text, text)
+    answers in question_ids order and the id of the QuestionResponse
+    answering each question.
+    """
+    positions = {
+        response_id: {question_id: position for position, question_id in enumerate(question_ids)}
+        for response_id, question_ids in pending
+    }
+    answers = {response_id: ([], {}) for response_id in positions}
+    rows = (
+        QuestionResponse.objects
+        .filter(survey_response_id__in=positions, text_response__gt='')
+        .values_list('id', 'survey_response_id', 'question_id', 'question__question_text', 'text_response')
+    )
+    for question_response_id, response_id, question_id, question_text, text in rows:
+        if question_id in positions[response_id]:
+            answers[response_id][0].append((question_id, question_text, text))
+            answers[response_id][1][question_id] = question_response_id
+    for response_id, (response_answers, _) in answers.items():
+        response_answers.sort(key=lambda answer: positions[response_id][answer[0]])
+    return answers
+
+
+def _analyze_survey_responses(pending):
+    """
+    _analyze_survey_responses screens the text answers of several survey
+    responses with one database read and one screening pass, flags the
+    concerning responses and stores the verdict of every answer screened
+
+    pending: list of (response_id, question_ids) tuples
+
+    Returns the analysis of each response that exists, keyed by response id.
+    """
+    survey_responses = SurveyResponse.objects.only('institution').in_bulk(
+        [response_id for response_id, _ in pending]
+    )
+    loaded = _load_answers([(response_id, question_ids) for response_id, question_ids in pending if response_id in survey_responses])
+
+    # Answers settled by the local prescreener skip the LLM, and an obvious
+    # high risk answer flags its response right away
+    verdicts = {}
+    forwarded = {}
+    flagged_early = set()
+    for response_id, (answers, _) in loaded.items():
+        verdicts[response_id] = {}
+        forwarded[response_id] = answers
+        if settings.SCREENING_PRESCREEN_ENABLED:
+            verdicts[response_id], forwarded[response_id] = prescreen_answers(answers)
+        if any(_is_concerning(verdict) for verdict in verdicts[response_id].values()):
+            flagged_early.add(response_id)
+            _flag_survey_response(survey_responses[response_id])
+
+    response_ids = list(forwarded)
+    for response_id, screened in zip(response_ids, _screen_with_fallback([forwarded[response_id] for response_id in response_ids])):
+        verdicts[response_id].update(screened)
+
+    results = {}
+    for response_id, response_verdicts in verdicts.items():
+        survey_response = survey_responses[response_id]
+        flagged = any(_is_concerning(verdict) for verdict in response_verdicts.values())
+        if flagged and response_id not in flagged_early:
+            _flag_survey_response(survey_response)
+        save_screening_results(response_id, survey_response.institution_id, response_verdicts, loaded[response_id][1])
+        results[response_id] = {
+            "response_id": response_id,
+            "flagged": flagged,
+            "verdicts": {str(question_id): verdict for question_id, verdict in response_verdicts.items()},
+        }
+    return results
 
 
 @shared_task
 def analyze_survey_responses_async(response_id, question_ids):
-    """Analyze survey answers and update flag in database"""
+    """
+    Analyze survey answers, update flag in database and store the verdict of
+    every text answer analyzed. Returns the verdicts, keyed by question id.
+    """
     try:
-        for question_id in question_ids:
-            question = SurveyQuestion.objects.get(id=question_id)
-            question_response = QuestionResponse.objects.filter(
-                survey_response_id=response_id,
-                question=question
-            ).first()
-            if question_response and question_response.text_response:
-                question_text = question.question_text
-                result = analyze_mental_health_responses(
-                    text=question_response.text_response,
-                    question_text=question_text
-                )
-                if result['flag'] and result['severity'] in ['high', 'medium']:
-                    SurveyResponse.objects.filter(id=response_id).update(
-                        flagged=True,
-                    )
-                    return f"Response {response_id} flagged: {result['reason']}"
-        return f"Response {response_id} analyzed - no concerns"
+        results = _analyze_survey_responses([(response_id, question_ids)])
+        if response_id not in results:
+            raise SurveyResponse.DoesNotExist(f"Survey response {response_id} does not exist")
+        return results[response_id]
     except Exception as e:
-        print(f"Error analyzing response {response_id}: {str(e)}")
+        logger.exception(f"Error analyzing response {response_id}: {str(e)}")
         return f"Error: {str(e)}"
 
+
+def queue_survey_analysis(response_id, question_ids):
+    """
+    queue_survey_analysis queues the text analysis of a survey response: as
+    a task of its own, or with SURVEY_ANALYSIS_MICROBATCH on the pending
+    analysis list, which a drain task started SURVEY_ANALYSIS_MICROBATCH_WINDOW
+    seconds later screens together with the other responses queued meanwhile
+    """
+    if not settings.SURVEY_ANALYSIS_MICROBATCH:
+        analyze_survey_responses_async.delay(response_id, question_ids)
+        return
+
+    get_redis_connection("default").rpush(
+        settings.SURVEY_ANALYSIS_PENDING_LIST,
+        json.dumps({"response_id": response_id, "question_ids": question_ids}),
+    )
+    if cache.add(ANALYSIS_DRAIN_SCHEDULED_KEY, 1, timeout=settings.SURVEY_ANALYSIS_DRAIN_SCHEDULE_TIMEOUT):
+        drain_pending_analyses.apply_async(countdown=settings.SURVEY_ANALYSIS_MICROBATCH_WINDOW)
+
+
+@shared_task
+def drain_pending_analyses():
+    """
+    drain_pending_analyses screens the survey responses on the pending
+    analysis list, SURVEY_ANALYSIS_MICROBATCH_SIZE at a time. Runs until the
+    list is empty, or re-queues itself after SURVEY_ANALYSIS_DRAIN_SECONDS
+    so other tasks get a worker.
+
+    NOTE: responses are taken off the list before they are screened. If a
+    batch fails, its responses are analyzed again one task each; the
+    analysis of a batch whose worker is killed is lost (reanalyze_responses
+    screens such answers).
+    """
+    # Responses queued from now on queue another drain
+    cache.delete(ANALYSIS_DRAIN_SCHEDULED_KEY)
+
+    client = get_redis_connection("default")
+    batch_size = settings.SURVEY_ANALYSIS_MICROBATCH_SIZE
+    deadline = time.monotonic() + settings.SURVEY_ANALYSIS_DRAIN_SECONDS
+
+    analyzed = 0
+    while True:
+        pipeline = client.pipeline()
+        pipeline.lrange(settings.SURVEY_ANALYSIS_PENDING_LIST, 0, batch_size - 1)
+        pipeline.ltrim(settings.SURVEY_ANALYSIS_PENDING_LIST, batch_size, -1)
+        entries, _ = pipeline.execute()
+        if not entries:
+            break
+
+        pending = [(entry["response_id"], entry["question_ids"]) for entry in map(json.loads, entries)]
+        try:
+            _analyze_survey_responses(pending)
+        except Exception as e:
+            logger.error(f"Error analyzing a batch of {len(pending)} responses, analyzing them one by one: {str(e)}")
+            for response_id, question_ids in pending:
+                analyze_survey_responses_async.delay(response_id, question_ids)
+        analyzed += len(pending)
+
+        if time.monotonic() >= deadline:
+            if cache.add(ANALYSIS_DRAIN_SCHEDULED_KEY, 1, timeout=settings.SURVEY_ANALYSIS_DRAIN_SCHEDULE_TIMEOUT):
+                drain_pending_analyses.delay()
+            break
+
+    return f"Analyzed {analyzed} queued responses"
+
+
+def schedule_confirmation(countdown=None):
+    """
+    schedule_confirmation queues the confirmation of the provisional verdicts
+    by the LLM in countdown seconds (SCREENING_BREAKER_COOLDOWN by default),
+    unless one is queued already
+    """
+    if countdown is None:
+        countdown = settings.SCREENING_BREAKER_COOLDOWN
+    if cache.add(CONFIRMATION_SCHEDULED_KEY, 1, timeout=countdown + settings.SURVEY_ANALYSIS_DRAIN_SCHEDULE_TIMEOUT):
+        confirm_provisional_results.apply_async(countdown=countdown)
+
+
+def _save_rescreened_results(results):
+    """
+    _save_rescreened_results stores the verdicts of answers screened again,
+    recomputes the severity of their survey responses from the latest
+    verdict of each answer and flags the responses found concerning.
+    Responses are never unflagged: a flag may already have been acted on.
+
+    results: unsaved ScreeningResult objects
+
+    Returns the number of responses newly flagged.
+    """
+    concerning_severities = {SEVERITIES[severity] for severity in FLAG_SEVERITIES}
+    concerning = {result.survey_response_id for result in results if result.flagged and result.severity in concerning_severities}
+    flagged = 0
+    with transaction.atomic():
+        ScreeningResult.objects.bulk_create(results, batch_size=1000)
+        refresh_screening_severities({result.survey_response_id for result in results})
+        for survey_response in SurveyResponse.objects.only('institution').filter(id__in=concerning, flagged=False):
+            _flag_survey_response(survey_response)
+            flagged += 1
+    return flagged
+
+
+@shared_task
+def confirm_provisional_results():
+    """
+    confirm_provisional_results screens again with the LLM the answers whose
+    latest verdict is provisional, SCREENING_CONFIRMATION_BATCH_SIZE at a
+    time, stores the LLM verdicts and clears the flags they overturn. Once
+    the breaker's cooldown is over, its first batch probes whether the LLM
+    has recovered. Re-queues itself while the circuit breaker is open or the
+    LLM fails, and after SURVEY_ANALYSIS_DRAIN_SECONDS so other tasks get a
+    worker.
+    """
+    cache.delete(CONFIRMATION_SCHEDULED_KEY)
+    deadline = time.monotonic() + settings.SURVEY_ANALYSIS_DRAIN_SECONDS
+    batch_size = settings.SURVEY_ANALYSIS_BATCH_SIZE
+
+    confirmed = unflagged = 0
+    while True:
+        if time.monotonic() >= deadline:
+            schedule_confirmation(countdown=0)
+            break
+
+        superseded = ScreeningResult.objects.filter(question_response_id=OuterRef('question_response_id'), id__gt=OuterRef('id'))
+        pending = list(
+            ScreeningResult.objects
+            .filter(provisional=True)
+            .exclude(Exists(superseded))
+            .order_by('id')
+            .values(
+                'question_response_id', 'survey_response_id', 'institution_id',
+                'question_response__question__question_text', 'question_response__text_response',
+            )[:settings.SCREENING_CONFIRMATION_BATCH_SIZE]
+        )
+        if not pending:
+            break
+        state = acquire_llm()
+        if state == OPEN:
+            schedule_confirmation()
+            break
+
+        answer_sets = {}
+        for row in pending:
+            answer_sets.setdefault(row['survey_response_id'], []).append(
+                (row['question_response_id'], row['question_response__question__question_text'], row['question_response__text_response'])
+            )
+        batches = [
+            answers[start:start + batch_size]
+            for answers in answer_sets.values()
+            for start in range(0, len(answers), batch_size)
+        ]
+        verdicts = {}
+        for batch_verdicts in analyze_mental_health_response_batches(batches):
+            verdicts.update(batch_verdicts)
+        if state == HALF_OPEN:
+            end_probe(list(verdicts.values()))
+
+        results = [
+            build_screening_result(row['question_response_id'], row['survey_response_id'], row['institution_id'], verdicts[row['question_response_id']])
+            for row in pending
+            if not verdicts[row['question_response_id']].get("error")
+        ]
+        _save_rescreened_results(results)
+        unflagged += _unflag_overturned({result.survey_response_id for result in results})
+        confirmed += len(results)
+        if len(results) < len(pending):
+            # The LLM is failing again; the rest waits for the next attempt
+            schedule_confirmation()
+            break
+
+    return f"Confirmed {confirmed} provisional verdicts, {unflagged} responses unflagged"
+
+
+@shared_task
+def rebuild_institution_aggregates(institution_id):
+    """
+    rebuild_institution_aggregates recomputes the dashboard rollups and the
+    LatestResponse rows of an institution after a bulk deletion (e.g. of a
+    survey template and its responses), off the request that deleted them
+    """
+    institution = Institution.objects.filter(id=institution_id).first()
+    if institution is None:
+        return f"Institution {institution_id} no longer exists"
+    with transaction.atomic():
+        rebuild_rollups(institution)
+        rebuild_latest_responses(institution)
+    invalidate_dashboard(institution_id)
+    return f"Rebuilt the aggregates of institution {institution_id}"
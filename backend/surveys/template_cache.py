@@ -0,0 +1,123 @@
+import json
+import re
+import time
+from dataclasses import dataclass
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from .caching import get_version, aget_version, bump_version
+from .models import SurveyTemplate, SurveyQuestion
+
+
+@dataclass(frozen=True)
+class CompiledTemplate:
+    """
+    CompiledTemplate is everything the public hash link endpoints need to know
+    about a survey template, loaded once and shared by every request of the
+    process. NOTE: the model instances it holds are shared as well and must
+    not be modified.
+    """
+    template: SurveyTemplate
+    questions: tuple
+    email_pattern: re.Pattern
+    # Body of the get_user_survey_questions response, encoded once
+    questions_json: bytes
+    version: str
+    compiled_at: float
+
+    def missing_answers(self, answers):
+        """
+        missing_answers returns the (shortened) text of each question that has
+        no answer in a submission
+        """
+        return [
+            question.question_text[:30] + "..."
+            for question in self.questions
+            if str(question.id) not in answers
+        ]
+
+
+# hash_link -> CompiledTemplate, local to the process
+_compiled_templates = {}
+
+
+def _version_namespace(template_id):
+    return f"survey_template_{template_id}"
+
+
+def _compile(template, version):
+    """_compile builds the CompiledTemplate of a SurveyTemplate"""
+    questions = tuple(SurveyQuestion.objects.filter(survey_template=template).order_by('order'))
+    questions_data = [{
+        'id': q.id,
+        'text': q.question_text,
+        'type': q.question_type,
+        'category': q.category,
+        'answer_choices': q.answer_choices,
+        'order': q.order
+    } for q in questions]
+    questions_json = json.dumps({
+        "success": True,
+        "template_id": template.id,
+        "questions": questions_data,
+    }, cls=DjangoJSONEncoder).encode()
+
+    return CompiledTemplate(
+        template=template,
+        questions=questions,
+        email_pattern=re.compile(template.institution.institution_regex_pattern, re.IGNORECASE),
+        questions_json=questions_json,
+        version=version,
+        compiled_at=time.monotonic(),
+    )
+
+
+def get_compiled_template(hash_link):
+    """
+    get_compiled_template returns the CompiledTemplate of the survey template
+    with the given hash link, or None if there is no such template. A cached
+    template is reused as long as its version token in Redis is unchanged and
+    it is younger than SURVEY_TEMPLATE_CACHE_MAX_AGE, so serving it costs a
+    single cache read instead of the template and question queries.
+    """
+    hash_link = str(hash_link)
+    compiled = _compiled_templates.get(hash_link)
+    if compiled is not None:
+        fresh = time.monotonic() - compiled.compiled_at < settings.SURVEY_TEMPLATE_CACHE_MAX_AGE
+        if fresh and get_version(_version_namespace(compiled.template.id)) == compiled.version:
+            return compiled
+
+    template = SurveyTemplate.objects.select_related('institution').filter(hash_link=hash_link).first()
+    if template is None:
+        _compiled_templates.pop(hash_link, None)
+        return None
+
+    # Read the version before the questions, so a change committed while
+    # compiling leaves the entry stale rather than hiding the change
+    version = get_version(_version_namespace(template.id))
+    compiled = _compile(template, version)
+    _compiled_templates[hash_link] = compiled
+    return compiled
+
+
+async def aget_compiled_template(hash_link):
+    """
+    aget_compiled_template is the async version of get_compiled_template: a
+    cached template costs one async cache read, and compiling a missing one
+    runs in a worker thread
+    """
+    compiled = _compiled_templates.get(str(hash_link))
+    if compiled is not None:
+        fresh = time.monotonic() - compiled.compiled_at < settings.SURVEY_TEMPLATE_CACHE_MAX_AGE
+        if fresh and await aget_version(_version_namespace(compiled.template.id)) == compiled.version:
+            return compiled
+    return await sync_to_async(get_compiled_template)(hash_link)
+
+
+def invalidate_compiled_template(template_id):
+    """
+    invalidate_compiled_template makes every process recompile a survey
+    template once the current transaction commits
+    """
+    transaction.on_commit(lambda: bump_version(_version_namespace(template_id)))
@@ -1,3 +1,573 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import json
+import types
+from datetime import timedelta
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
 
-# Create your tests here.
+from . import circuit_breaker
+from .analytics import get_dashboard_data
+from .exports import stream_csv
+from .idempotency import claim_idempotency_key, store_idempotent_response
+from .latest_responses import record_latest_response
+from .llm_services import ScreeningError, _parse_verdict, _screen_answer_set
+from .models import (
+    DailyResponseRollup, Institution, QuestionCategory, QuestionResponse, QuestionType, ScreeningSeverity, SurveyQuestion,
+    SurveyResponse, SurveyTemplate, User,
+)
+from .pagination import PaginationError, decode_cursor, encode_cursor, paginate
+from .prescreening import PhraseMatcher, classify_answer, prescreen_answer
+from .rollups import rebuild_rollups
+from .screening import save_screening_results
+from .screening_backends import ChatCompletionsBackend
+from .tasks import confirm_provisional_results, rebuild_institution_aggregates
+
+# Tests keep the cache in process instead of the shared Redis cache
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def craft_cursor(payload):
+    """craft_cursor encodes an arbitrary JSON payload the way encode_cursor does, as a client could"""
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+class PhraseMatcherTests(SimpleTestCase):
+    def test_finds_whole_word_phrases_in_order(self):
+        matcher = PhraseMatcher(("kill myself", "die", "want to die"))
+        self.assertEqual(matcher.find("i want to die, i could kill myself"), ["want to die", "die", "kill myself"])
+
+    def test_ignores_phrases_inside_words(self):
+        matcher = PhraseMatcher(("kill myself", "die"))
+        self.assertEqual(matcher.find("i need to skill myself up on diet plans"), [])
+
+    def test_find_spans_returns_starts(self):
+        matcher = PhraseMatcher(("end it all",))
+        self.assertEqual(matcher.find_spans("why not end it all"), [(8, "end it all")])
+
+
+class PrescreenAnswerTests(SimpleTestCase):
+    def assertHigh(self, text):
+        verdict = prescreen_answer(text)
+        self.assertIsNotNone(verdict, text)
+        self.assertEqual(verdict["severity"], "high", text)
+        self.assertTrue(verdict["flag"], text)
+
+    def assertForwarded(self, text):
+        self.assertIsNone(prescreen_answer(text), text)
+
+    def test_flags_first_person_statements(self):
+        self.assertHigh("I want to kill myself")
+        self.assertHigh("Honestly I want to kill myself most days.")
+        self.assertHigh("I don't know, I just want to die")
+        self.assertHigh("He left and now I want to die")
+        self.assertHigh("I feel suicidal and I don’t know who to tell.")
+
+    def test_forwards_negated_phrases(self):
+        self.assertForwarded("I do not want to kill myself")
+        self.assertForwarded("I never feel suicidal")
+        self.assertForwarded("I would never want to die")
+        self.assertForwarded("I don’t want to end my life, I just need a break")
+        self.assertForwarded("I used to want to die but I'm doing better")
+
+    def test_forwards_third_person_phrases(self):
+        self.assertForwarded("the movie where he wanted to end it all was sad")
+        self.assertForwarded("My friend told me she wants to end it all")
+        self.assertForwarded("They keep saying they will kill everyone")
+
+    def test_forwards_quoted_phrases(self):
+        self.assertForwarded('My favourite song is "End It All"')
+        self.assertForwarded("We read a poem called “Time to end this life” in class")
+
+    def test_settles_benign_filler_answers(self):
+        verdict = prescreen_answer("Fine.")
+        self.assertEqual(verdict["severity"], "none")
+        self.assertFalse(verdict["flag"])
+
+    def test_forwards_everything_else(self):
+        self.assertForwarded("No")
+        self.assertForwarded("School has been stressful lately")
+
+
+class ClassifyAnswerTests(SimpleTestCase):
+    def test_high_severity_phrases_are_final(self):
+        verdict = classify_answer("I want to kill myself")
+        self.assertEqual(verdict["severity"], "high")
+        self.assertNotIn("provisional", verdict)
+
+    def test_negated_phrases_lean_toward_flagging_provisionally(self):
+        verdict = classify_answer("I never feel suicidal")
+        self.assertEqual(verdict["severity"], "medium")
+        self.assertTrue(verdict["provisional"])
+
+    def test_medium_and_low_phrases_are_provisional(self):
+        self.assertEqual(classify_answer("I feel hopeless")["severity"], "medium")
+        self.assertEqual(classify_answer("I've been sad")["severity"], "low")
+        verdict = classify_answer("Basketball practice was fun")
+        self.assertEqual(verdict["severity"], "none")
+        self.assertTrue(verdict["provisional"])
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    SCREENING_BACKEND='openai',
+    SCREENING_BREAKER_ENABLED=True,
+    SCREENING_BREAKER_WINDOW=60,
+    SCREENING_BREAKER_MIN_ANSWERS=10,
+    SCREENING_BREAKER_ERROR_RATE=0.5,
+    SCREENING_BREAKER_SLOW_MS=1000,
+    SCREENING_BREAKER_SLOW_RATE=0.5,
+    SCREENING_BREAKER_MAX_QUEUE_DEPTH=100,
+    SCREENING_BREAKER_QUEUE_CHECK_INTERVAL=60,
+    SCREENING_BREAKER_COOLDOWN=60,
+)
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(circuit_breaker, 'get_queue_depths', return_value={'live': 0})
+        self.get_queue_depths = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def llm_verdicts(self, count, error=False, latency_ms=100):
+        if error:
+            return [{"flag": False, "severity": "none", "error": True}] * count
+        return [{"flag": False, "severity": "none", "source": "llm", "latency_ms": latency_ms}] * count
+
+    def trip_cooled_down(self):
+        """trip_cooled_down opens the breaker with its cooldown already over"""
+        with override_settings(SCREENING_BREAKER_COOLDOWN=0):
+            circuit_breaker.trip("test")
+
+    def test_closed_by_default(self):
+        self.assertEqual(circuit_breaker.get_breaker_state(), {"state": circuit_breaker.CLOSED})
+        self.assertEqual(circuit_breaker.acquire_llm(), circuit_breaker.CLOSED)
+
+    def test_opens_when_enough_answers_fail(self):
+        circuit_breaker.record_llm_verdicts(self.llm_verdicts(4, error=True))
+        self.assertEqual(circuit_breaker.acquire_llm(), circuit_breaker.CLOSED)
+        circuit_breaker.record_llm_verdicts(self.llm_verdicts(6, error=True))
+        self.assertEqual(circuit_breaker.get_breaker_state()["state"], circuit_breaker.OPEN)
+        self.assertEqual(circuit_breaker.acquire_llm(), circuit_breaker.OPEN)
+
+    def test_opens_when_enough_answers_are_slow(self):
+        circuit_breaker.record_llm_verdicts(self.llm_verdicts(5) + self.llm_verdicts(5, latency_ms=5000))
+        self.assertEqual(circuit_breaker.get_breaker_state()["state"], circuit_breaker.OPEN)
+
+    def test_ignores_cached_and_local_verdicts(self):
+        circuit_breaker.record_llm_verdicts([{"flag": False, "severity": "none", "source": "cache"}] * 20)
+        circuit_breaker.record_llm_verdicts([{"flag": False, "severity": "none", "source": "rules"}] * 20)
+        self.assertEqual(circuit_breaker.get_breaker_state()["state"], circuit_breaker.CLOSED)
+
+    def test_opens_when_the_live_queue_is_backlogged(self):
+        self.get_queue_depths.return_value = {'live': 500}
+        self.assertEqual(circuit_breaker.acquire_llm(), circuit_breaker.OPEN)
+        self.assertEqual(circuit_breaker.get_breaker_state()["state"], circuit_breaker.OPEN)
+
+    def test_one_probe_at_a_time_after_the_cooldown(self):
+        self.trip_cooled_down()
+        self.assertEqual(circuit_breaker.get_breaker_state()["state"], circuit_breaker.HALF_OPEN)
+        self.assertEqual(circuit_breaker.acquire_llm(), circuit_breaker.HALF_OPEN)
+        self.assertEqual(circuit_breaker.acquire_llm(), circuit_breaker.OPEN)
+
+    def test_successful_probe_closes(self):
+        self.trip_cooled_down()
+        self.assertEqual(circuit_breaker.acquire_llm(), circuit_breaker.HALF_OPEN)
+        self.assertTrue(circuit_breaker.end_probe(self.llm_verdicts(2)))
+        self.assertEqual(circuit_breaker.get_breaker_state()["state"], circuit_breaker.CLOSED)
+
+    def test_failed_probe_opens_again(self):
+        self.trip_cooled_down()
+        self.assertEqual(circuit_breaker.acquire_llm(), circuit_breaker.HALF_OPEN)
+        self.assertFalse(circuit_breaker.end_probe(self.llm_verdicts(1) + self.llm_verdicts(1, error=True)))
+        self.assertEqual(circuit_breaker.get_breaker_state()["state"], circuit_breaker.OPEN)
+
+    def test_probe_without_llm_outcome_lets_another_probe(self):
+        self.trip_cooled_down()
+        self.assertEqual(circuit_breaker.acquire_llm(), circuit_breaker.HALF_OPEN)
+        self.assertFalse(circuit_breaker.end_probe([{"flag": False, "severity": "none", "source": "cache"}]))
+        self.assertEqual(circuit_breaker.acquire_llm(), circuit_breaker.HALF_OPEN)
+
+    @override_settings(SCREENING_BREAKER_ENABLED=False)
+    def test_disabled_breaker_stays_closed(self):
+        circuit_breaker.trip("test")
+        self.assertEqual(circuit_breaker.acquire_llm(), circuit_breaker.CLOSED)
+
+
+def _completion(content):
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))])
+
+
+class BatchScreeningTests(SimpleTestCase):
+    backend = ChatCompletionsBackend('test', 'test-model', 'http://llm.invalid/v1', 'test')
+    answers = [(1, "Q1", "first"), (2, "Q2", "second"), (3, "Q3", "third")]
+
+    def screen(self, replies):
+        """screen screens the answers, the model replying to each request with the next reply"""
+        prompts = []
+
+        async def create_completion(backend, **kwargs):
+            prompts.append(kwargs["messages"][-1]["content"])
+            return _completion(replies[len(prompts) - 1])
+
+        with mock.patch('surveys.llm_services.create_completion', create_completion):
+            return asyncio.run(_screen_answer_set(self.backend, self.answers)), prompts
+
+    def test_parse_verdict_normalizes_severity(self):
+        verdict = _parse_verdict({"flag": True, "severity": "HIGH", "reason": "x"})
+        self.assertEqual(verdict, {"flag": True, "severity": "high", "reason": "x"})
+
+    def test_parse_verdict_rejects_malformed_verdicts(self):
+        for verdict in ([], {"flag": "yes", "severity": "high"}, {"flag": True, "severity": "extreme"}):
+            with self.assertRaises(ScreeningError):
+                _parse_verdict(verdict)
+
+    def test_one_request_for_the_whole_batch(self):
+        reply = json.dumps({"results": [
+            {"id": number, "flag": number == 2, "severity": "medium" if number == 2 else "none", "reason": ""}
+            for number in (1, 2, 3)
+        ]})
+        results, prompts = self.screen([reply])
+        self.assertEqual(len(prompts), 1)
+        self.assertEqual({key: verdict["severity"] for key, (verdict, _) in results.items()}, {1: "none", 2: "medium", 3: "none"})
+        self.assertTrue(all(cacheable for _, cacheable in results.values()))
+        self.assertEqual(results[2][0]["model"], "test-model")
+
+    def test_missing_and_malformed_verdicts_are_screened_again(self):
+        reply = json.dumps({"results": [
+            {"id": 1, "flag": False, "severity": "none", "reason": ""},
+            {"id": 2, "flag": "maybe", "severity": "none"},
+        ]})
+        single = json.dumps({"flag": True, "severity": "low", "reason": "retried"})
+        results, prompts = self.screen([reply, single, single])
+        self.assertEqual(len(prompts), 3)
+        self.assertEqual(results[1][0]["severity"], "none")
+        self.assertEqual(results[2][0]["reason"], "retried")
+        self.assertEqual(results[3][0]["reason"], "retried")
+
+    def test_unparsable_reply_screens_every_answer_again(self):
+        single = json.dumps({"flag": False, "severity": "none", "reason": ""})
+        results, prompts = self.screen(["not json", single, single, single])
+        self.assertEqual(len(prompts), 4)
+        self.assertFalse(any(verdict.get("error") for verdict, _ in results.values()))
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        now = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor((now, 42))), (now, 42))
+        self.assertEqual(decode_cursor(encode_cursor((3, now, 42)), ranked=True), (3, now, 42))
+
+    def test_invalid_cursors(self):
+        now = timezone.now()
+        for cursor in ("garbage", "", "e30", encode_cursor((3, now, 42))):
+            with self.assertRaises(PaginationError):
+                decode_cursor(cursor)
+        with self.assertRaises(PaginationError):
+            decode_cursor(encode_cursor((now, 42)), ranked=True)
+
+    def test_cursors_with_keys_or_ranks_of_another_type(self):
+        for payload, ranked, key_type in (
+            (["2024-01-01T00:00:00", [1]], False, int),
+            (["2024-01-01T00:00:00", "1"], False, int),
+            (["2024-01-01T00:00:00", True], False, int),
+            (["2024-01-01T00:00:00", 1], False, str),
+            (["high", "2024-01-01T00:00:00", 1], True, int),
+            ([{"a": 1}, "2024-01-01T00:00:00", 1], True, int),
+        ):
+            with self.assertRaises(PaginationError, msg=payload):
+                decode_cursor(craft_cursor(payload), ranked=ranked, key_type=key_type)
+        self.assertEqual(decode_cursor(craft_cursor(["2024-01-01T00:00:00", "a@test.edu"]), key_type=str)[1], "a@test.edu")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PaginateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.institution = Institution.objects.create(institution_name="Test University", institution_regex_pattern=r".*@test\.edu")
+        template = SurveyTemplate.objects.create(institution=cls.institution)
+        SurveyResponse.objects.bulk_create([
+            SurveyResponse(survey_template=template, institution=cls.institution, flagged=True, screening_severity=index % 4)
+            for index in range(25)
+        ])
+        # Ties on created, broken by id
+        now = timezone.now()
+        for index, response in enumerate(SurveyResponse.objects.order_by('id')):
+            SurveyResponse.objects.filter(id=response.id).update(created=now - timedelta(minutes=index // 3))
+        cls.admin = User.objects.create_admin(email="admin@test.edu", password="password", institution_details=cls.institution)
+
+    def walk(self, queryset, page_size, **kwargs):
+        rows, cursor = paginate(queryset, None, page_size, **kwargs)
+        pages = [rows]
+        while cursor:
+            rows, cursor = paginate(queryset, cursor, page_size, **kwargs)
+            pages.append(rows)
+        return pages
+
+    def test_pages_cover_every_row_once_newest_first(self):
+        queryset = SurveyResponse.objects.values('id', 'created')
+        pages = self.walk(queryset, 4)
+        self.assertTrue(all(len(page) == 4 for page in pages[:-1]))
+        rows = [row for page in pages for row in page]
+        self.assertEqual([row['id'] for row in rows], list(queryset.order_by('-created', '-id').values_list('id', flat=True)))
+
+    def test_ranked_pages_cover_every_row_once_most_severe_first(self):
+        queryset = SurveyResponse.objects.all()
+        rows = [row for page in self.walk(queryset, 7, rank_field='screening_severity') for row in page]
+        expected = list(queryset.order_by('-screening_severity', '-created', '-id'))
+        self.assertEqual(rows, expected)
+
+    def test_invalid_cursor_is_a_bad_request(self):
+        self.client.force_login(self.admin)
+        for url in ("/api/student-responses/?cursor=garbage", "/api/flagged-responses/?sort=severity&cursor=garbage"):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 400, url)
+            self.assertEqual(response.json(), {"error": "Invalid cursor"})
+
+    def test_crafted_cursor_is_a_bad_request(self):
+        self.client.force_login(self.admin)
+        for url in (
+            f"/api/student-responses/?cursor={craft_cursor(['2024-01-01T00:00:00', [1]])}",
+            f"/api/flagged-responses/?sort=severity&cursor={craft_cursor([[3], '2024-01-01T00:00:00', 1])}",
+            f"/api/students/?student_type=anonymous&anonymous_cursor={craft_cursor(['2024-01-01T00:00:00', 1])}",
+        ):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 400, url)
+
+    def test_cursor_follows_the_api_pages(self):
+        self.client.force_login(self.admin)
+        seen = []
+        url = "/api/flagged-responses/?sort=severity&page_size=10"
+        while url:
+            body = self.client.get(url).json()
+            seen.extend(response['id'] for response in body['results'])
+            url = body['next_cursor'] and f"/api/flagged-responses/?sort=severity&page_size=10&cursor={body['next_cursor']}"
+        self.assertEqual(sorted(seen), sorted(SurveyResponse.objects.values_list('id', flat=True)))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StudentsFlagFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        institution = Institution.objects.create(institution_name="Test University", institution_regex_pattern=r".*@test\.edu")
+        template = SurveyTemplate.objects.create(institution=institution)
+        cls.student_ids = {}
+        for name, flagged in (("flagged", True), ("unflagged", False), ("silent", None)):
+            student = User.objects.create_student(f"{name}@test.edu", "password", institution, name)
+            cls.student_ids[name] = student.id
+            if flagged is not None:
+                record_latest_response(SurveyResponse.objects.create(
+                    survey_template=template, institution=institution, student=student, flagged=flagged,
+                ))
+        cls.admin = User.objects.create_admin(email="admin@test.edu", password="password", institution_details=institution)
+
+    def students(self, flagged):
+        self.client.force_login(self.admin)
+        body = self.client.get(f"/api/students/?student_type=registered&flagged={flagged}").json()
+        return {student['id'] for student in body['registered_students']}
+
+    def test_flagged_students(self):
+        self.assertEqual(self.students("true"), {self.student_ids["flagged"]})
+
+    def test_unflagged_students_include_those_who_never_responded(self):
+        self.assertEqual(self.students("false"), {self.student_ids["unflagged"], self.student_ids["silent"]})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.institution = Institution.objects.create(institution_name="Test University", institution_regex_pattern=r".*@test\.edu")
+        cls.template = SurveyTemplate.objects.create(institution=cls.institution)
+        cls.question = SurveyQuestion.objects.create(survey_template=cls.template, question_text="How are you?", question_type=QuestionType.TEXT, order=1)
+        for index in range(3):
+            response = SurveyResponse.objects.create(survey_template=cls.template, institution=cls.institution)
+            QuestionResponse.objects.create(survey_response=response, question=cls.question, text_response=f"Answer {index}")
+        cls.admin = User.objects.create_admin(email="admin@test.edu", password="password", institution_details=cls.institution)
+
+    def test_csv_escapes_formulas(self):
+        formulas = ['=HYPERLINK("http://example.com")', "+1+1", "-2+3", "@SUM(A1)"]
+        for text in formulas:
+            response = SurveyResponse.objects.create(survey_template=self.template, institution=self.institution)
+            QuestionResponse.objects.create(survey_response=response, question=self.question, text_response=text)
+        rows = list(csv.reader("".join(stream_csv(self.institution)).splitlines()))
+        answers = [row[-1] for row in rows[1:]]
+        self.assertEqual(answers, ["Answer 0", "Answer 1", "Answer 2"] + [f"'{text}" for text in formulas])
+
+    async def test_asgi_export_is_streamed_asynchronously(self):
+        for export_format in ('csv', 'ndjson'):
+            url = f"/api/export/responses/{export_format}/"
+            await self.async_client.aforce_login(self.admin)
+            response = await self.async_client.get(url)
+            self.assertTrue(response.is_async, export_format)
+            content = b"".join([chunk async for chunk in response])
+
+            await sync_to_async(self.client.force_login)(self.admin)
+            wsgi_response = await sync_to_async(self.client.get)(url)
+            self.assertFalse(wsgi_response.is_async, export_format)
+            self.assertEqual(content, await sync_to_async(b"".join)(wsgi_response.streaming_content), export_format)
+            self.assertEqual(content.count(b"Answer"), 3, export_format)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_first_request_claims_the_key(self):
+        self.assertIsNone(claim_idempotency_key("key"))
+        self.assertEqual(claim_idempotency_key("key").status_code, 409)
+
+    def test_successful_response_is_replayed_once_committed(self):
+        claim_idempotency_key("key")
+        with self.captureOnCommitCallbacks(execute=True):
+            store_idempotent_response("key", JsonResponse({"success": True, "response_id": 7}, status=201))
+        replayed = claim_idempotency_key("key")
+        self.assertEqual(replayed.status_code, 201)
+        self.assertEqual(json.loads(replayed.content), {"success": True, "response_id": 7})
+
+    def test_failed_response_releases_the_key(self):
+        claim_idempotency_key("key")
+        store_idempotent_response("key", JsonResponse({"success": False}, status=400))
+        self.assertIsNone(claim_idempotency_key("key"))
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    SCREENING_BACKEND='openai',
+    SCREENING_BREAKER_ENABLED=True,
+    SCREENING_BREAKER_COOLDOWN=60,
+    SCREENING_BREAKER_MAX_QUEUE_DEPTH=100,
+)
+class ConfirmProvisionalResultsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for target, value in (('surveys.circuit_breaker.get_queue_depths', {'live': 0}), ('surveys.tasks.schedule_confirmation', None)):
+            patcher = mock.patch(target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        institution = Institution.objects.create(institution_name="Test University", institution_regex_pattern=r".*@test\.edu")
+        template = SurveyTemplate.objects.create(institution=institution)
+        self.text = SurveyQuestion.objects.create(survey_template=template, question_text="How are you?", question_type=QuestionType.TEXT, order=1)
+        self.likert = SurveyQuestion.objects.create(survey_template=template, question_text="Stress?", question_type=QuestionType.LIKERT, order=2)
+        self.template = template
+
+    def flagged_response(self, likert_value=1):
+        """flagged_response creates a response flagged by a provisional local verdict of its text answer"""
+        response = SurveyResponse.objects.create(survey_template=self.template, institution=self.template.institution, flagged=True)
+        answer = QuestionResponse.objects.create(survey_response=response, question=self.text, text_response="I feel hopeless")
+        QuestionResponse.objects.create(survey_response=response, question=self.likert, likert_value=likert_value)
+        verdict = {"flag": True, "severity": "medium", "reason": "local", "source": "rules", "provisional": True}
+        save_screening_results(response.id, response.institution_id, {self.text.id: verdict}, {self.text.id: answer.id})
+        return response
+
+    def confirm(self, severity):
+        verdict = {"flag": severity != "none", "severity": severity, "reason": "llm", "source": "llm", "latency_ms": 10}
+
+        def screen(batches):
+            return [{key: dict(verdict) for key, _, _ in answers} for answers in batches]
+
+        with mock.patch('surveys.tasks.analyze_mental_health_response_batches', side_effect=screen) as screened:
+            confirm_provisional_results()
+        return screened
+
+    def test_overturned_provisional_flag_is_cleared(self):
+        response = self.flagged_response()
+        self.confirm("none")
+        response.refresh_from_db()
+        self.assertFalse(response.flagged)
+        self.assertEqual(response.screening_severity, ScreeningSeverity.NONE)
+
+    def test_confirmed_flag_is_kept(self):
+        response = self.flagged_response()
+        self.confirm("medium")
+        response.refresh_from_db()
+        self.assertTrue(response.flagged)
+        self.assertEqual(response.screening_severity, ScreeningSeverity.MEDIUM)
+
+    def test_likert_flag_is_kept(self):
+        response = self.flagged_response(likert_value=5)
+        self.confirm("none")
+        response.refresh_from_db()
+        self.assertTrue(response.flagged)
+
+    def test_waits_while_the_breaker_is_open(self):
+        self.flagged_response()
+        circuit_breaker.trip("test")
+        screened = self.confirm("none")
+        screened.assert_not_called()
+
+    def test_probes_the_llm_after_the_cooldown(self):
+        response = self.flagged_response()
+        with override_settings(SCREENING_BREAKER_COOLDOWN=0):
+            circuit_breaker.trip("test")
+        self.confirm("none")
+        self.assertEqual(circuit_breaker.get_breaker_state()["state"], circuit_breaker.CLOSED)
+        response.refresh_from_db()
+        self.assertFalse(response.flagged)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TemplateDeletionTests(TestCase):
+    def setUp(self):
+        self.institution = Institution.objects.create(institution_name="Test University", institution_regex_pattern=r".*@test\.edu")
+        self.admin = User.objects.create_admin(email="admin@test.edu", password="password", institution_details=self.institution)
+        self.templates = [SurveyTemplate.objects.create(institution=self.institution) for _ in range(2)]
+        for template in self.templates:
+            SurveyResponse.objects.create(survey_template=template, institution=self.institution, flagged=True)
+        rebuild_rollups(self.institution)
+
+    def test_aggregates_are_rebuilt_after_the_commit(self):
+        self.client.force_login(self.admin)
+        with mock.patch('surveys.views.rebuild_institution_aggregates.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.delete(
+                    "/api/survey-templates/", data=json.dumps({"template_id": self.templates[0].id}), content_type="application/json",
+                )
+                delay.assert_not_called()
+        self.assertTrue(response.json()["success"])
+        delay.assert_called_once_with(self.institution.id)
+
+    def test_rebuild_drops_the_deleted_responses(self):
+        self.templates[0].delete()
+        rebuild_institution_aggregates(self.institution.id)
+        rollup = DailyResponseRollup.objects.get(institution=self.institution)
+        self.assertEqual(rollup.num_responses, 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QuestionDeletionTests(TestCase):
+    def setUp(self):
+        self.institution = Institution.objects.create(institution_name="Test University", institution_regex_pattern=r".*@test\.edu")
+        self.admin = User.objects.create_admin(email="admin@test.edu", password="password", institution_details=self.institution)
+        self.template = SurveyTemplate.objects.create(institution=self.institution)
+        self.questions = [
+            SurveyQuestion.objects.create(
+                survey_template=self.template, question_text=f"Stress {order}?", question_type=QuestionType.LIKERT,
+                category=QuestionCategory.STRESS, order=order,
+            )
+            for order in (1, 2)
+        ]
+        response = SurveyResponse.objects.create(survey_template=self.template, institution=self.institution)
+        for question, likert_value in zip(self.questions, (5, 1)):
+            QuestionResponse.objects.create(survey_response=response, question=question, likert_value=likert_value)
+        rebuild_rollups(self.institution)
+
+    def test_deleted_answers_leave_the_likert_rollups(self):
+        dashboard = get_dashboard_data(self.institution)
+        self.assertEqual((dashboard['num_high_stress'], dashboard['num_low_stress']), (1, 1))
+        self.client.force_login(self.admin)
+        with mock.patch('surveys.views.rebuild_institution_aggregates.delay', side_effect=rebuild_institution_aggregates) as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.delete(
+                    f"/api/survey-templates/{self.template.id}/questions/",
+                    data=json.dumps({"question_id": self.questions[0].id}), content_type="application/json",
+                )
+        self.assertTrue(response.json()["success"])
+        delay.assert_called_once_with(self.institution.id)
+        dashboard = get_dashboard_data(self.institution)
+        self.assertEqual((dashboard['num_high_stress'], dashboard['num_low_stress']), (0, 1))
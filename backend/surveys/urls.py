@@ -1,7 +1,14 @@
 from django.urls import path
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from . import views
 
+# The student-facing survey endpoints are served by their async versions
+# when the app runs under ASGI
+survey_views = views
+if settings.ASYNC_SURVEY_VIEWS:
+    from . import async_views as survey_views
+
 urlpatterns = [
     # url for csrf
     path('api/csrf/', views.set_csrf_token, name='set_csrf_token'),
@@ -14,26 +21,30 @@ urlpatterns = [
     path('api/flagged-students/', views.flagged_students_view, name='flagged-students'),
     path('api/students/', views.students_view, name='students-api'),
     path('api/institutions/', views.institutions_view, name='institutions-api'),
+    path('api/export/responses/<str:export_format>/', views.export_responses_view, name='export-responses-api'),
+    path('api/export/analytics/', views.analytics_exports_view, name='analytics-exports-api'),
+    path('api/export/analytics/<path:file_path>', views.analytics_export_download_view, name='analytics-export-download-api'),
     
     # Add new URLs for survey management
     path('api/survey-templates/', views.survey_templates_view, name='survey-templates-api'),
     path('api/survey-templates/<int:template_id>/questions/', views.survey_questions_view, name='survey-questions-api'),
     path('api/admin/survey-templates/', views.survey_templates_admin_view, name='survey-templates-admin'),
-    path('api/get-user-survey-questions/', views.get_user_survey_questions, name='get-user-survey-questions'),
+    path('api/get-user-survey-questions/', survey_views.get_user_survey_questions, name='get-user-survey-questions'),
     path('api/survey-templates/<int:template_id>/use/', views.use_template, name='use_template'),
     path('api/dashboard/', views.dashboard_api, name='dashboard-api'),
     
     # University-specific and hash link survey URLs
-    path('api/survey/link/<uuid:hash_link>/', views.survey_view, name='hashed-survey'),
-    path('api/get-user-survey-questions/<uuid:hash_link>/', views.get_user_survey_questions, name='get-user-survey-questions-hash'),
+    path('api/survey/link/<uuid:hash_link>/', survey_views.survey_view, name='hashed-survey'),
+    path('api/get-user-survey-questions/<uuid:hash_link>/', survey_views.get_user_survey_questions, name='get-user-survey-questions-hash'),
+    path('api/survey/submissions/<uuid:submission_id>/', views.survey_submission_status_view, name='survey-submission-status'),
 
     # Auto saving survey responses
-    path('api/autosave/', views.survey_autosave, name='autosave-survey'),
-    path('api/autosave/load/<int:template_id>/', views.survey_autosave_load, name='autosave-survey-load'),
-    path('api/autosave/clear/<int:template_id>/', views.survey_autosave_clear, name='survey-autosave-clear'),
+    path('api/autosave/', survey_views.survey_autosave, name='autosave-survey'),
+    path('api/autosave/load/<int:template_id>/', survey_views.survey_autosave_load, name='autosave-survey-load'),
+    path('api/autosave/clear/<int:template_id>/', survey_views.survey_autosave_clear, name='survey-autosave-clear'),
     
     # Keep your other existing URLs
-    path('api/survey/', views.survey_view, name='survey'),
+    path('api/survey/', survey_views.survey_view, name='survey'),
     path('api/login/', views.login_view, name='login'),
     path("api/register/", views.register_view, name="register"),
     path("api/logout/", views.logout_view, name="logout"),
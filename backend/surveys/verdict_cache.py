@@ -0,0 +1,82 @@
+import hashlib
+import re
+import unicodedata
+from django.conf import settings
+from django.core.cache import cache
+from .caching import increment_counter
+
+HITS_KEY = "screening_verdict_cache_hits"
+MISSES_KEY = "screening_verdict_cache_misses"
+
+_WHITESPACE = re.compile(r"\s+")
+# Characters stripped from both ends of an answer ("Fine." and "fine" are the same answer)
+_EDGE_PUNCTUATION = " .,!?;:'\"()[]-_~*"
+
+
+def normalize_answer(text):
+    """
+    normalize_answer reduces a text answer to the form its verdict is cached
+    under: unicode normalized, case folded, whitespace collapsed and
+    punctuation stripped from both ends. Only differences that cannot change
+    the meaning of an answer are removed.
+    """
+    text = unicodedata.normalize("NFKC", str(text)).replace("’", "'").replace("‘", "'")
+    return _WHITESPACE.sub(" ", text.casefold()).strip(_EDGE_PUNCTUATION)
+
+
+def verdict_cache_key(text, question_text, version):
+    """
+    verdict_cache_key returns the cache key of the verdict of an answer to a
+    question, screened by the given model and prompt version
+    """
+    digest = hashlib.sha256(
+        "\0".join((version, normalize_answer(question_text or ""), normalize_answer(text))).encode()
+    ).hexdigest()
+    return f"screening_verdict_{digest}"
+
+
+def get_cached_verdicts(answers, version):
+    """
+    get_cached_verdicts looks up the cached verdicts of several answers with a
+    single cache read and counts the hits and misses
+
+    answers: list of (text, question_text) tuples
+    version: model and prompt version the verdicts must have been produced by
+
+    Returns the verdict of each answer, or None where there is none cached.
+    """
+    if not answers:
+        return []
+    keys = [verdict_cache_key(text, question_text, version) for text, question_text in answers]
+    found = cache.get_many(keys)
+    verdicts = [found.get(key) for key in keys]
+    hits = sum(verdict is not None for verdict in verdicts)
+    increment_counter(HITS_KEY, hits)
+    increment_counter(MISSES_KEY, len(verdicts) - hits)
+    return verdicts
+
+
+def cache_verdicts(verdicts, version):
+    """
+    cache_verdicts caches model verdicts for SCREENING_VERDICT_CACHE_TIMEOUT
+    seconds
+
+    verdicts: list of (text, question_text, verdict) tuples
+    version: model and prompt version that produced the verdicts
+    """
+    if verdicts:
+        cache.set_many(
+            {verdict_cache_key(text, question_text, version): verdict for text, question_text, verdict in verdicts},
+            timeout=settings.SCREENING_VERDICT_CACHE_TIMEOUT,
+        )
+
+
+def get_verdict_cache_stats():
+    """get_verdict_cache_stats returns the number of verdict cache hits and misses counted so far"""
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    return {"hits": counts.get(HITS_KEY, 0), "misses": counts.get(MISSES_KEY, 0)}
+
+
+def reset_verdict_cache_stats():
+    """reset_verdict_cache_stats sets the verdict cache hit and miss counts back to zero"""
+    cache.delete_many([HITS_KEY, MISSES_KEY])
@@ -1,11 +1,10 @@
 import logging
-import calendar
 import re
-from .models import SurveyResponse, User, Institution, AnonymousStudent, SurveyTemplate, SurveyQuestion, QuestionResponse, QuestionType, QuestionCategory
-from .serializers import SurveyResponseSerializer, UserSerializer, InstitutionSerializer, SurveyTemplateSerializer, SurveyQuestionSerializer, AnonymousStudentSerializer
+from .models import SurveyResponse, User, Institution, AnonymousStudent, SurveyTemplate, SurveyQuestion, QuestionType, QuestionCategory, LatestResponse, ExportWatermark, ScreeningResult
+from .serializers import SurveyResponseSerializer, UserSerializer, InstitutionSerializer, SurveyTemplateSerializer, SurveyQuestionSerializer, AnonymousStudentSerializer, SURVEY_RESPONSE_FIELDS, serialize_survey_responses
 from django.shortcuts import render, redirect
 from django.utils import timezone
-from django.http import JsonResponse, HttpResponseBadRequest, QueryDict
+from django.http import JsonResponse, HttpResponseBadRequest, QueryDict, StreamingHttpResponse, FileResponse, HttpResponse
 from django.contrib.auth import authenticate, login, logout
 from django.urls import reverse
 from django.contrib import messages
@@ -15,11 +14,21 @@ from django.shortcuts import get_object_or_404
 from django.views.decorators.csrf import ensure_csrf_cookie
 from rest_framework import status
 import json
-from django.db.models import Q
 from django.conf import settings
+from django.db import transaction
 from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
 from datetime import datetime
-from surveys.tasks import analyze_survey_responses_async
+from redis.exceptions import RedisError
+from surveys.submissions import persist_submission
+from surveys.template_cache import get_compiled_template, invalidate_compiled_template
+from surveys.ingestion import enqueue_submission, get_submission_status
+from surveys.idempotency import get_idempotency_key, claim_idempotency_key, store_idempotent_response
+from surveys.analytics import get_dashboard_snapshot, invalidate_dashboard
+from surveys.tasks import rebuild_institution_aggregates
+from surveys.pagination import PaginationError, paginate, get_page_size, filter_survey_responses, filter_by_date_range
+from surveys.exports import stream_csv, stream_ndjson, aiter_export
+from surveys.columnar_exports import list_export_files, resolve_export_file
 
 
 # Use a single logger configuration
@@ -101,28 +110,21 @@ def survey_view(request, hash_link=None):
     """survey_view allows students to access the survey page and save survey responses"""
     # Handle hash link survey submission
     if hash_link:
-        try:
-            survey_template = SurveyTemplate.objects.get(hash_link=hash_link)
-            # Get all questions for this template
-            questions = SurveyQuestion.objects.filter(survey_template=survey_template)
-            if not questions.exists():
-                return JsonResponse({"success": False, "message": "No questions found in the survey template"})
-            
-            # Check if all questions have responses
-            missing_responses = []
-            for question in questions:
-                question_id = str(question.id)
-                if question_id not in request.data:
-                    missing_responses.append(question.question_text[:30] + "...")
-            
-            if missing_responses:
-                return JsonResponse({"success": False, "message": f"Missing responses for questions: {', '.join(missing_responses)}"})
-
-            # Handle the survey submission
-            return _handle_student_responses(request, survey_template, questions, True)
-            
-        except SurveyTemplate.DoesNotExist:
+        compiled_template = get_compiled_template(hash_link)
+        if compiled_template is None:
             return JsonResponse({"success": False, "message": "Survey template not found"}, status=404)
+        if not compiled_template.questions:
+            return JsonResponse({"success": False, "message": "No questions found in the survey template"})
+
+        # Check if all questions have responses
+        missing_responses = compiled_template.missing_answers(request.data)
+        if missing_responses:
+            return JsonResponse({"success": False, "message": f"Missing responses for questions: {', '.join(missing_responses)}"})
+
+        # Handle the survey submission
+        return _handle_student_responses(
+            request, request.data, compiled_template.template, compiled_template.questions, True, compiled_template.email_pattern
+        )
     # Check if a valid user is submitting the response
     if not request.user.is_authenticated:
         return JsonResponse({"success": False, "message": "Please login to the application to submit a survey response"})
@@ -176,19 +178,22 @@ def survey_view(request, hash_link=None):
         return JsonResponse({"success": False, "message": f"Missing responses for questions: {', '.join(missing_responses)}"})
 
     # Important: You can't return a @api_view within another @api_view
-    return _handle_student_responses(request, survey_template, questions, False)
+    return _handle_student_responses(request, request.data, survey_template, questions, False)
 
 
-def _handle_student_responses(request, survey_template, questions, hashed=False):
+def _handle_student_responses(request, data, survey_template, questions, hashed=False, email_pattern=None):
     """
     A function that serializes student responses, returns proper Json responses and saves them to the database.
+    data is the submitted survey (request.data), email_pattern the compiled institution email pattern checked
+    for hash link submissions.
     """
     no_student_user = False
     if hashed:
-        student_name = request.data.get('student_name')
-        school_email = request.data.get('school_email')
-        institution_email_regex = survey_template.institution.institution_regex_pattern
-        if not re.fullmatch(institution_email_regex, school_email, re.IGNORECASE):
+        student_name = data.get('student_name')
+        school_email = data.get('school_email')
+        if email_pattern is None:
+            email_pattern = re.compile(survey_template.institution.institution_regex_pattern, re.IGNORECASE)
+        if not email_pattern.fullmatch(school_email):
             return JsonResponse({
                 "success": False,
                 "message": "Please use your institution email. Normally should end with .edu"
@@ -196,10 +201,6 @@ def _handle_student_responses(request, survey_template, questions, hashed=False)
         student = User.objects.filter(is_student=True, email=school_email).first()
         if not student:
             no_student_user=True
-            ano_student, created = AnonymousStudent.objects.get_or_create(
-                email=school_email,
-                defaults={'name': student_name, 'survey_template': survey_template}
-            )
         else:
             # Registered user exists with this email
             if not request.user.is_authenticated:
@@ -222,65 +223,107 @@ def _handle_student_responses(request, survey_template, questions, hashed=False)
         student = request.user
     
         # Update student name if provided
-        if 'student_name' in request.data and not student.name:
-            student.name = request.data['student_name']
+        if 'student_name' in data and not student.name:
+            student.name = data['student_name']
             student.save()
     
-    # Create the survey response
+    # A retried submission sent with the same idempotency key gets the
+    # response of the original one instead of being saved again
+    respondent = f"anonymous:{school_email.lower()}" if no_student_user else f"student:{student.id}"
     try:
-        if not no_student_user:
-            survey_response = SurveyResponse.objects.create(
+        idempotency_key = get_idempotency_key(request, data, f"{survey_template.id}:{respondent}")
+    except ValueError as e:
+        return JsonResponse({"success": False, "message": str(e)}, status=400)
+
+    if no_student_user:
+        student, anonymous_email, anonymous_name = None, school_email, student_name
+    else:
+        anonymous_email = anonymous_name = None
+    if idempotency_key is None:
+        return _save_student_responses(
+            data, survey_template, questions, student, anonymous_email, anonymous_name, idempotency_key
+        )
+
+    replayed_response = claim_idempotency_key(idempotency_key)
+    if replayed_response is not None:
+        return replayed_response
+
+    # The database is the backstop when the Redis entry is gone
+    survey_response = SurveyResponse.objects.filter(idempotency_key=idempotency_key).first()
+    if survey_response is not None:
+        response = _survey_saved_response(survey_response)
+    else:
+        response = _save_student_responses(
+            data, survey_template, questions, student, anonymous_email, anonymous_name, idempotency_key
+        )
+    store_idempotent_response(idempotency_key, response)
+    return response
+
+
+def _survey_saved_response(survey_response):
+    """_survey_saved_response is the response to a submission saved as survey_response"""
+    return JsonResponse({
+        "success": True,
+        "message": "Thank you for your honest response! Your input makes a difference.",
+        "redirect_url": "/",
+        "data": SurveyResponseSerializer(survey_response).data,
+    })
+
+
+def _save_student_responses(data, survey_template, questions, student, anonymous_email, anonymous_name, idempotency_key):
+    """
+    _save_student_responses saves a validated submission of a registered
+    student, or of an anonymous student (when student is None), and returns
+    the response to the submission
+    """
+    if settings.SURVEY_INGESTION_MODE == 'stream':
+        try:
+            submission_id = enqueue_submission(
+                survey_template,
+                questions,
+                data,
                 student=student,
-                survey_template=survey_template,
-                flagged=False  # Will update this after checking responses
-            )
-        else:
-            survey_response = SurveyResponse.objects.create(
-                anonymous_student=ano_student,
-                survey_template = survey_template,
-                flagged=False
+                anonymous_email=anonymous_email,
+                anonymous_name=anonymous_name,
+                idempotency_key=idempotency_key,
             )
-        
-        # Create individual question responses
-        should_flag = False
-        for question in questions:
-            question_id = str(question.id)
-            response_value = request.data.get(question_id)
-            
-            if question.question_type == 'likert':
-                likert_value = int(response_value)
-                text_response = None
-                # Check if this response should trigger flagging
-                if likert_value >= 3:  # Assuming 3+ is concerning for any question
-                    should_flag = True
-            else:  # text response
-                likert_value = None
-                text_response = response_value
-            
-            QuestionResponse.objects.create(
-                survey_response=survey_response,
-                question=question,
-                likert_value=likert_value,
-                text_response=text_response
+            return JsonResponse({
+                "success": True,
+                "message": "Thank you for your honest response! Your input makes a difference.",
+                "redirect_url": "/",
+                "submission_id": submission_id,
+                "status_url": reverse('survey-submission-status', args=[submission_id]),
+            }, status=202)
+        except (ValueError, TypeError) as e:
+            logger.error("Invalid survey response: %s", str(e))
+            return JsonResponse({
+                "success": False,
+                "message": "There was an error with your submission.",
+            })
+        except RedisError as e:
+            # Fall back to writing the submission directly
+            logger.error("Could not queue survey response, saving it directly: %s", str(e))
+
+    # Save the survey response, its question responses and the derived
+    # dashboard data in one transaction
+    try:
+        ano_student = None
+        if student is None:
+            ano_student, created = AnonymousStudent.objects.get_or_create(
+                email=anonymous_email,
+                defaults={'name': anonymous_name, 'survey_template': survey_template}
             )
-        
-        # Update flagged status if needed
-        if should_flag:
-            survey_response.flagged = True
-            survey_response.save()
-        
-        # Pass question IDs instead of model objects
-        question_ids = [q.id for q in questions]
-        result = analyze_survey_responses_async.delay(survey_response.id, question_ids)
+        survey_response = persist_submission(
+            survey_template,
+            questions,
+            data,
+            student=student,
+            anonymous_student=ano_student,
+            idempotency_key=idempotency_key,
+        )
 
         # Return success response
-        response_data = {
-            "success": True,
-            "message": "Thank you for your honest response! Your input makes a difference.",
-            "redirect_url": "/",
-            "data": SurveyResponseSerializer(survey_response).data,
-        }
-        return JsonResponse(response_data)
+        return _survey_saved_response(survey_response)
     
     except Exception as e:
         # Return error response if any errors occur
@@ -290,6 +333,19 @@ def _handle_student_responses(request, survey_template, questions, hashed=False)
             "message": "There was an error with your submission.",
         })
 
+@api_view(["GET"])
+def survey_submission_status_view(request, submission_id):
+    """
+    survey_submission_status_view returns the status of a submission queued
+    by the stream ingestion mode: queued, persisted (with the id of the saved
+    survey response) or failed
+    """
+    submission_status = get_submission_status(str(submission_id))
+    if submission_status is None:
+        return JsonResponse({"success": False, "error": "Submission not found"}, status=404)
+    return JsonResponse({"success": True, "submission_id": str(submission_id), **submission_status})
+
+
 @api_view(["GET"])
 def get_user_survey_questions(request, hash_link=None):
     """
@@ -297,40 +353,22 @@ def get_user_survey_questions(request, hash_link=None):
     """
     # Handle hash link requests (authentication required)
     if hash_link:
-        try:
-            survey_template = SurveyTemplate.objects.get(hash_link=hash_link)
-            
-            # Get all questions for this template
-            questions = SurveyQuestion.objects.filter(survey_template=survey_template).order_by('order')
-            
-            if not questions.exists():
-                return JsonResponse({
-                    "success": False, 
-                    "error": "No survey questions found for this template"
-                }, status=404)
-            
-            # Serialize the questions
-            questions_data = [{
-                'id': q.id,
-                'text': q.question_text,
-                'type': q.question_type,
-                'category': q.category,
-                'answer_choices': q.answer_choices,
-                'order': q.order
-            } for q in questions]
-            
-            return JsonResponse({
-                "success": True, 
-                "template_id": survey_template.id,
-                "questions": questions_data
-            })
-            
-        except SurveyTemplate.DoesNotExist:
+        compiled_template = get_compiled_template(hash_link)
+        if compiled_template is None:
             return JsonResponse({
                 "success": False, 
                 "error": "Survey template not found"
             }, status=404)
 
+        if not compiled_template.questions:
+            return JsonResponse({
+                "success": False, 
+                "error": "No survey questions found for this template"
+            }, status=404)
+
+        # The response body is encoded once per template version
+        return HttpResponse(compiled_template.questions_json, content_type="application/json")
+
     if not request.user.is_authenticated:
         return JsonResponse({"success": False, "error": "Authentication required"})
     try:
@@ -420,201 +458,7 @@ def dashboard_api(request):
     # Get the institution details of the admin
     institution_details = request.user.institution_details
 
-    # Number of students registered in the university
-    num_registered_students = len(User.objects.filter(is_student=True, institution_details=institution_details))
-
-    num_anonymous_students = len(AnonymousStudent.objects.filter(survey_template__institution=institution_details))
-
-    num_students = num_registered_students+num_anonymous_students
-
-    responded_students = 0
-    # Get all students in the institution
-    institution_students = User.objects.filter(is_student=True, institution_details=institution_details)
-    
-    anonymous_students = AnonymousStudent.objects.filter(survey_template__institution=institution_details)
-
-    # Initialize list for flagged students
-    school_flagged_responses = []
-    
-    # For each student, check if their latest response is flagged
-    for student in institution_students:
-        # Get the latest response for this student
-        latest_response = SurveyResponse.objects.filter(student=student).order_by('-created').first()
-        if latest_response:
-            responded_students += 1
-        # If the student has a response and it's flagged, add them to the list
-        if latest_response and latest_response.flagged:
-            school_flagged_responses.append((student.name, student.email))
-
-    # For each anonymous student, check if their latest response is flagged
-    for anon_student in anonymous_students:
-        # Get the latest response for this student
-        latest_response = SurveyResponse.objects.filter(anonymous_student=anon_student).order_by('-created').first()
-        if latest_response:
-            responded_students += 1
-        # If the student has a response and it's flagged, add them to the list
-        if latest_response and latest_response.flagged:
-            school_flagged_responses.append((anon_student.name or "Anonymous", anon_student.email))
-
-    # Number of responses for students registered in the university
-    all_registered_responses = SurveyResponse.objects.filter(student__institution_details=institution_details)
-    all_anonymous_responses = SurveyResponse.objects.filter(anonymous_student__survey_template__institution=institution_details)
-    num_responses = len(all_registered_responses)+len(all_anonymous_responses)
-    all_responses = SurveyResponse.objects.filter(
-    Q(student__institution_details=institution_details) | 
-    Q(anonymous_student__survey_template__institution=institution_details)
-)
-    
-    # Number of students registered in the university and marked as flagged
-    num_flagged_students = len(school_flagged_responses)
-    
-    # Get all survey templates for this institution
-    survey_templates = SurveyTemplate.objects.filter(institution=institution_details)
-    
-    # Check if there are sleep quality questions
-    has_sleep_questions = SurveyQuestion.objects.filter(
-        survey_template__in=survey_templates,
-        category=QuestionCategory.SLEEP
-    ).exists()
-    
-    # Check if there are stress level questions
-    has_stress_questions = SurveyQuestion.objects.filter(
-        survey_template__in=survey_templates,
-        category=QuestionCategory.STRESS
-    ).exists()
-    
-    # Check if there are support perception questions
-    has_support_questions = SurveyQuestion.objects.filter(
-        survey_template__in=survey_templates,
-        category=QuestionCategory.SUPPORT
-    ).exists()
-    
-    # Initialize metrics with default values
-    num_good_sleep_quality = 0
-    num_bad_sleep_quality = 0
-    num_low_stress = 0
-    num_moderate_stress = 0
-    num_high_stress = 0
-    monthly_support_perception = []
-    
-    # Only calculate sleep metrics if sleep questions exist
-    if has_sleep_questions:
-        # Find sleep quality questions
-        sleep_questions = SurveyQuestion.objects.filter(
-            survey_template__in=survey_templates,
-            category=QuestionCategory.SLEEP
-        )
-        
-        # Get responses for sleep questions
-        for response in all_responses:
-            for sleep_question in sleep_questions:
-                try:
-                    question_response = QuestionResponse.objects.get(
-                        survey_response=response,
-                        question=sleep_question
-                    )
-                    if question_response.likert_value is not None:
-                        if question_response.likert_value <= 2:
-                            num_good_sleep_quality += 1
-                        elif question_response.likert_value >= 4:
-                            num_bad_sleep_quality += 1
-                except QuestionResponse.DoesNotExist:
-                    continue
-    
-    # Only calculate stress metrics if stress questions exist
-    if has_stress_questions:
-        # Find stress level questions
-        stress_questions = SurveyQuestion.objects.filter(
-            survey_template__in=survey_templates,
-            category=QuestionCategory.STRESS
-        )
-        
-        # Get responses for stress questions
-        for response in all_responses:
-            for stress_question in stress_questions:
-                try:
-                    question_response = QuestionResponse.objects.get(
-                        survey_response=response,
-                        question=stress_question
-                    )
-                    if question_response.likert_value is not None:
-                        if question_response.likert_value <= 2:
-                            num_low_stress += 1
-                        elif question_response.likert_value == 3:
-                            num_moderate_stress += 1
-                        elif question_response.likert_value >= 4:
-                            num_high_stress += 1
-                except QuestionResponse.DoesNotExist:
-                    continue
-
-    months = []
-    months_idx = []
-    monthly_response_rates = []
-    monthly_num_responses = []
-    
-    # Only process if there are responses
-    if all_responses.exists():
-        months = list(calendar.month_abbr[1:all_responses.order_by("-created")[0].created.month + 1])
-        months_idx = range(1, all_responses.order_by("-created")[0].created.month + 1)
-        
-        # Compute monthly trends
-        for month in months_idx:
-            # Get all responses for this month
-            month_responses = all_responses.filter(created__year=timezone.now().year, created__month=month)
-            
-            # Count unique students who responded in this month
-            registered_responded = month_responses.filter(student__isnull=False).values('student').distinct().count()
-            anonymous_responded = month_responses.filter(anonymous_student__isnull=False).values('anonymous_student').distinct().count()  
-            unique_students_responded = registered_responded + anonymous_responded
-            # Calculate response rate based on unique students
-            monthly_response_rates.append(int(unique_students_responded/num_students * 100) if num_students > 0 else 0)
-            
-            # Store the count of unique student responses
-            monthly_num_responses.append(unique_students_responded)
-            
-            # Only calculate support perception if support questions exist
-            if has_support_questions:
-                # Rest of the support perception calculation remains the same
-                support_count = 0
-                support_questions = SurveyQuestion.objects.filter(
-                    survey_template__in=survey_templates,
-                    category=QuestionCategory.SUPPORT
-                )
-                
-                for response in month_responses:
-                    for support_question in support_questions:
-                        try:
-                            question_response = QuestionResponse.objects.get(
-                                survey_response=response,
-                                question=support_question
-                            )
-                            if question_response.likert_value is not None and question_response.likert_value <= 2:
-                                support_count += 1
-                        except QuestionResponse.DoesNotExist:
-                            continue
-                
-                monthly_support_perception.append(support_count)
-
-    context = {
-        "num_students": num_students, 
-        "flagged_students": school_flagged_responses, 
-        "num_flagged_students": num_flagged_students, 
-        "num_responses": num_responses,
-        "response_rate": int(responded_students/num_students * 100) if num_students > 0 else 0,
-        "num_stable_students": num_students - num_flagged_students, 
-        "num_good_sleep_quality": num_good_sleep_quality,
-        "num_bad_sleep_quality": num_bad_sleep_quality, 
-        "num_low_stress": num_low_stress,
-        "num_moderate_stress": num_moderate_stress, 
-        "num_high_stress": num_high_stress,
-        "months": months, 
-        "monthly_response_rates": monthly_response_rates, 
-        "monthly_num_responses": monthly_num_responses,
-        "monthly_support_perception": monthly_support_perception,
-        "has_sleep_questions": has_sleep_questions,
-        "has_stress_questions": has_stress_questions,
-        "has_support_questions": has_support_questions
-    }
+    context = get_dashboard_snapshot(institution_details)
 
     return JsonResponse(context)
 
@@ -754,6 +598,7 @@ def register_view(request):
                 name=name
             )
             student.save()
+            invalidate_dashboard(institution_details.id)
             
             return Response({
                 'success': True,
@@ -800,13 +645,14 @@ def logout_view(request):
     return response
 
 
-# NOTE: API views are WIP. Need to add parameters for filtering db records
 @api_view(['GET'])
 def student_response_view(request):
     """
-    student_response_view is an API view that returns survey responses
+    student_response_view is an API view that returns survey responses, newest
+    first, one page at a time
     - Superusers see all responses
     - Institution admins see only responses from their institution
+    Query parameters: cursor, page_size, created_after, created_before, template, flagged
     """
     if request.method == "GET" and request.user.is_authenticated and (request.user.is_superuser or request.user.is_institution_admin):
         if request.user.is_superuser:
@@ -816,12 +662,18 @@ def student_response_view(request):
             # Institution admin sees only responses from their institution
             # This includes both registered students and anonymous students from their institution
             survey_responses = SurveyResponse.objects.filter(
-                Q(student__institution_details=request.user.institution_details) |
-                Q(anonymous_student__survey_template__institution=request.user.institution_details)
+                institution=request.user.institution_details
             )
-        
-        survey_response_serializer = SurveyResponseSerializer(survey_responses, many=True)
-        return Response(survey_response_serializer.data)
+
+        try:
+            survey_responses = filter_survey_responses(survey_responses, request)
+            page, next_cursor = paginate(
+                survey_responses.values(*SURVEY_RESPONSE_FIELDS), request.query_params.get('cursor'), get_page_size(request)
+            )
+        except PaginationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"results": serialize_survey_responses(page), "next_cursor": next_cursor})
     
     else:
         return HttpResponseBadRequest("Request method not allowed")
@@ -830,9 +682,12 @@ def student_response_view(request):
 @api_view(["GET"])
 def flagged_responses_view(request):
     """
-    flagged_responses_view is an API view that returns flagged survey responses
+    flagged_responses_view is an API view that returns flagged survey responses,
+    newest first (or most severe first with sort=severity), one page at a
+    time, each with the screening verdicts of its answers
     - Superusers see all flagged responses
     - Institution admins see only flagged responses from their institution
+    Query parameters: cursor, page_size, created_after, created_before, template, sort
     """
     if request.method == "GET" and request.user.is_authenticated and (request.user.is_superuser or request.user.is_institution_admin):
         if request.user.is_superuser:
@@ -841,24 +696,158 @@ def flagged_responses_view(request):
         else:
             # Institution admin sees only flagged responses from their institution
             flagged_students = SurveyResponse.objects.filter(
-                flagged=True
-            ).filter(
-                Q(student__institution_details=request.user.institution_details) |
-                Q(anonymous_student__survey_template__institution=request.user.institution_details)
+                flagged=True,
+                institution=request.user.institution_details
             )
-        
-        flagged_students_serializer = SurveyResponseSerializer(flagged_students, many=True)
-        return Response(flagged_students_serializer.data)
+
+        sort = request.query_params.get('sort', 'created')
+        if sort not in ('created', 'severity'):
+            return Response({"error": "sort must be created or severity"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            flagged_students = filter_survey_responses(flagged_students, request)
+            page, next_cursor = paginate(
+                flagged_students.values(*SURVEY_RESPONSE_FIELDS),
+                request.query_params.get('cursor'),
+                get_page_size(request),
+                rank_field='screening_severity' if sort == 'severity' else None,
+            )
+        except PaginationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = serialize_survey_responses(page)
+        _attach_screening_results(results)
+        return Response({"results": results, "next_cursor": next_cursor})
     
     else:
         return HttpResponseBadRequest("Request method not allowed")
     
+def _attach_screening_results(responses):
+    """
+    _attach_screening_results adds the latest screening verdict of each
+    screened answer to serialized survey responses, with a single query
+    """
+    responses_by_id = {response['id']: response for response in responses}
+    screening_results = {}
+    for result in ScreeningResult.objects.filter(survey_response_id__in=responses_by_id).order_by('id').values(
+        'survey_response_id', 'question_response_id', 'severity', 'reason', 'source', 'provisional', 'created',
+    ):
+        screening_results[result['question_response_id']] = result
+    for response in responses:
+        response['screening_results'] = []
+    for result in screening_results.values():
+        responses_by_id[result.pop('survey_response_id')]['screening_results'].append(result)
+
+
+def _get_export_institution(request):
+    """
+    _get_export_institution returns the institution an export request is for,
+    or an error response if the user may not export it
+    - Institution admins export their own institution
+    - Superusers pick the institution with the institution query parameter
+    """
+    if not request.user.is_authenticated or not (request.user.is_superuser or request.user.is_institution_admin):
+        return None, JsonResponse({"error": "Admin access required"}, status=403)
+
+    if request.user.is_superuser:
+        institution_id = request.query_params.get('institution')
+        if not institution_id or not institution_id.isdigit():
+            return None, JsonResponse({"error": "institution must be an institution id"}, status=400)
+        return get_object_or_404(Institution, id=int(institution_id)), None
+    return request.user.institution_details, None
+
+
+EXPORT_FORMATS = {
+    'csv': (stream_csv, 'text/csv; charset=utf-8'),
+    'ndjson': (stream_ndjson, 'application/x-ndjson'),
+}
+
+
+@api_view(["GET"])
+def export_responses_view(request, export_format):
+    """
+    export_responses_view streams every survey response of an institution as
+    CSV or NDJSON, one line per response with a column per question. Rows are
+    generated while the response is sent, so memory use stays flat however
+    large the export is.
+    """
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({"error": "Export format must be csv or ndjson"}, status=400)
+
+    institution, error_response = _get_export_institution(request)
+    if error_response:
+        return error_response
+
+    stream, content_type = EXPORT_FORMATS[export_format]
+    filename = f"responses_{institution.id}_{timezone.localdate().isoformat()}.{export_format}"
+    if isinstance(request._request, ASGIRequest):
+        # Django reads a sync iterator whole before sending it to an ASGI server
+        content = aiter_export(stream, institution)
+    else:
+        content = stream(institution)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Let nginx pass rows through as they are generated instead of buffering the export
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api_view(["GET"])
+def analytics_exports_view(request):
+    """
+    analytics_exports_view lists the Parquet files of an institution's
+    analytics export (written by the export_analytics management command)
+    """
+    institution, error_response = _get_export_institution(request)
+    if error_response:
+        return error_response
+
+    watermark = ExportWatermark.objects.filter(institution=institution).first()
+    return Response({
+        "last_response_id": watermark.last_response_id if watermark else 0,
+        "last_created": watermark.last_created if watermark else None,
+        "files": list_export_files(institution.id),
+    })
+
+
+@api_view(["GET"])
+def analytics_export_download_view(request, file_path):
+    """
+    analytics_export_download_view downloads one Parquet file of an
+    institution's analytics export, by its path as listed by
+    analytics_exports_view
+    """
+    institution, error_response = _get_export_institution(request)
+    if error_response:
+        return error_response
+
+    path = resolve_export_file(institution.id, file_path)
+    if path is None:
+        return JsonResponse({"error": "Export file not found"}, status=404)
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name, content_type='application/vnd.apache.parquet')
+
+
+def _filter_by_latest_flag(students, flagged):
+    """
+    _filter_by_latest_flag keeps the students whose latest response is
+    flagged, or when flagged is False every other student, including those
+    without a LatestResponse (who have never responded)
+    """
+    if flagged:
+        return students.filter(latest_response__flagged=True)
+    return students.exclude(latest_response__flagged=True)
+
+
 @api_view(["GET"])
 def students_view(request):
     """
-    students_view is an API view that returns students (both registered and anonymous)
+    students_view is an API view that returns students (both registered and
+    anonymous), most recently joined first, one page of each at a time
     - Superusers see all students
     - Institution admins see only students from their institution
+    Query parameters: student_type (registered or anonymous, both when omitted),
+    registered_cursor, anonymous_cursor, page_size, created_after, created_before,
+    flagged (true: students whose latest response is flagged; false: every
+    other student, including those who have not responded yet)
     """
     if request.method == "GET" and request.user.is_authenticated and (request.user.is_superuser or request.user.is_institution_admin):
         if request.user.is_superuser:
@@ -874,15 +863,39 @@ def students_view(request):
             all_anonymous_students = AnonymousStudent.objects.filter(
                 survey_template__institution=request.user.institution_details
             )
-        
-        user_serializer = UserSerializer(all_students, many=True)
-        anonymous_serializer = AnonymousStudentSerializer(all_anonymous_students, many=True)
-        
-        # Combine the data with type indicators
-        response_data = {
-            "registered_students": user_serializer.data,
-            "anonymous_students": anonymous_serializer.data
-        }
+
+        student_type = request.query_params.get('student_type')
+        if student_type not in (None, 'registered', 'anonymous'):
+            return Response({"error": "student_type must be registered or anonymous"}, status=status.HTTP_400_BAD_REQUEST)
+
+        response_data = {}
+        try:
+            page_size = get_page_size(request)
+            flagged = request.query_params.get('flagged')
+            if flagged and flagged.lower() not in ('true', 'false'):
+                raise PaginationError("flagged must be true or false")
+
+            if student_type in (None, 'registered'):
+                all_students = filter_by_date_range(all_students, request, 'date_joined')
+                if flagged:
+                    all_students = _filter_by_latest_flag(all_students, flagged.lower() == 'true')
+                students, next_cursor = paginate(
+                    all_students, request.query_params.get('registered_cursor'), page_size, 'date_joined', 'id'
+                )
+                response_data["registered_students"] = UserSerializer(students, many=True).data
+                response_data["next_registered_cursor"] = next_cursor
+
+            if student_type in (None, 'anonymous'):
+                all_anonymous_students = filter_by_date_range(all_anonymous_students, request, 'created_at')
+                if flagged:
+                    all_anonymous_students = _filter_by_latest_flag(all_anonymous_students, flagged.lower() == 'true')
+                anonymous_students, next_cursor = paginate(
+                    all_anonymous_students, request.query_params.get('anonymous_cursor'), page_size, 'created_at', 'email'
+                )
+                response_data["anonymous_students"] = AnonymousStudentSerializer(anonymous_students, many=True).data
+                response_data["next_anonymous_cursor"] = next_cursor
+        except PaginationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         return Response(response_data)
     
@@ -904,62 +917,50 @@ def flagged_students_view(request):
         return JsonResponse({"error": "Admin access required"}, status=403)
     
     try:
-        flagged_registered_students = []
-        flagged_anonymous_students = []
-        
+        # Latest responses are indexed per respondent, so this is a scan of
+        # the flagged rows only
+        flagged_latest = LatestResponse.objects.filter(flagged=True)
+        if not request.user.is_superuser:
+            flagged_latest = flagged_latest.filter(institution=request.user.institution_details)
+
         # Handle registered students
-        if request.user.is_superuser:
-            students = User.objects.filter(is_student=True)
-        else:
-            students = User.objects.filter(
-                is_student=True, 
-                institution_details=request.user.institution_details
-            )
-        
-        # Check each registered student's latest response
-        for student in students:
-            latest_response = SurveyResponse.objects.filter(
-                student=student
-            ).order_by('-created').first()
-            
-            # If latest response exists and is flagged, include this student
-            if latest_response and latest_response.flagged:
-                flagged_registered_students.append({
-                    "id": student.id,
-                    "name": student.name,
-                    "email": student.email,
-                    "institution_id": student.institution_details.id if student.institution_details else None,
-                    "institution_name": student.institution_details.institution_name if student.institution_details else None,
-                    "latest_response_date": latest_response.created,
-                    "latest_response_id": latest_response.id
-                })
-        
+        registered_latest = flagged_latest.filter(
+            student__is_student=True
+        ).select_related('student__institution_details').order_by('-screening_severity', 'student_id')
+
+        flagged_registered_students = []
+        for latest_response in registered_latest:
+            student = latest_response.student
+            flagged_registered_students.append({
+                "id": student.id,
+                "name": student.name,
+                "email": student.email,
+                "institution_id": student.institution_details.id if student.institution_details else None,
+                "institution_name": student.institution_details.institution_name if student.institution_details else None,
+                "latest_response_date": latest_response.created,
+                "latest_response_id": latest_response.survey_response_id,
+                "latest_response_severity": latest_response.screening_severity
+            })
+
         # Handle anonymous students
-        if request.user.is_superuser:
-            anonymous_students = AnonymousStudent.objects.all()
-        else:
-            anonymous_students = AnonymousStudent.objects.filter(
-                survey_template__institution=request.user.institution_details
-            )
-        
-        # Check each anonymous student's latest response
-        for anonymous_student in anonymous_students:
-            latest_response = SurveyResponse.objects.filter(
-                anonymous_student=anonymous_student
-            ).order_by('-created').first()
-            
-            # If latest response exists and is flagged, include this anonymous student
-            if latest_response and latest_response.flagged:
-                flagged_anonymous_students.append({
-                    "email": anonymous_student.email,
-                    "name": anonymous_student.name,
-                    "institution_id": anonymous_student.survey_template.institution.id if anonymous_student.survey_template else None,
-                    "institution_name": anonymous_student.survey_template.institution.institution_name if anonymous_student.survey_template else None,
-                    "survey_template_id": anonymous_student.survey_template.id if anonymous_student.survey_template else None,
-                    "latest_response_date": latest_response.created,
-                    "latest_response_id": latest_response.id,
-                    "created_at": anonymous_student.created_at
-                })
+        anonymous_latest = flagged_latest.filter(
+            anonymous_student__isnull=False
+        ).select_related('anonymous_student__survey_template__institution').order_by('-screening_severity', 'anonymous_student_id')
+
+        flagged_anonymous_students = []
+        for latest_response in anonymous_latest:
+            anonymous_student = latest_response.anonymous_student
+            flagged_anonymous_students.append({
+                "email": anonymous_student.email,
+                "name": anonymous_student.name,
+                "institution_id": anonymous_student.survey_template.institution.id if anonymous_student.survey_template else None,
+                "institution_name": anonymous_student.survey_template.institution.institution_name if anonymous_student.survey_template else None,
+                "survey_template_id": anonymous_student.survey_template.id if anonymous_student.survey_template else None,
+                "latest_response_date": latest_response.created,
+                "latest_response_id": latest_response.survey_response_id,
+                "latest_response_severity": latest_response.screening_severity,
+                "created_at": anonymous_student.created_at
+            })
         
         return JsonResponse({
             "success": True,
@@ -1046,8 +1047,15 @@ def survey_templates_view(request):
             if template.institution != request.user.institution_details:
                 return JsonResponse({"success": False, "error": "You can only delete your institution's templates"})
             
-            # Delete the template (this will cascade delete all associated questions)
+            # Delete the template (this will cascade delete all associated questions and responses)
+            template_id = template.id
             template.delete()
+            invalidate_compiled_template(template_id)
+            # Rebuilding the rollups and latest responses scans every response
+            # of the institution: leave it to a maintenance worker once the
+            # deletion is committed
+            institution_id = template.institution_id
+            transaction.on_commit(lambda: rebuild_institution_aggregates.delay(institution_id))
             
             return JsonResponse({
                 "success": True,
@@ -1101,6 +1109,8 @@ def survey_questions_view(request, template_id):
                 new_question.answer_choices = data.get('answer_choices')
             
             new_question.save()
+            invalidate_dashboard(template.institution_id)
+            invalidate_compiled_template(template.id)
             
             serializer = SurveyQuestionSerializer(new_question)
             return JsonResponse({
@@ -1128,6 +1138,11 @@ def survey_questions_view(request, template_id):
             for i, q in enumerate(remaining_questions, 1):
                 q.order = i
                 q.save()
+            invalidate_compiled_template(template.id)
+            # The question's answers are deleted with it: rebuild the Likert
+            # rollups without them once the deletion is committed
+            institution_id = template.institution_id
+            transaction.on_commit(lambda: rebuild_institution_aggregates.delay(institution_id))
             
             return JsonResponse({
                 "success": True,
@@ -1153,6 +1168,7 @@ def use_template(request, template_id):
         # Activate the selected template
         template.used = True
         template.save()
+        invalidate_compiled_template(template.id)
         
         return JsonResponse({"success": True})
     except Exception as e: